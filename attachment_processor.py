@@ -1,38 +1,311 @@
 import io
 import json
-import pdfplumber
-from docx import Document
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree
+import metrics
+from pdf_ocr import is_image_only_page, page_image_hash, ocr_pages, ocr_available
+from config import PARSE_CONFIG, OCR_CONFIG
+
+PDF_MIME = "application/pdf"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+DOC_MIME = "application/msword"
+
+# 空白页（无可提取文字，多为扫描图片且未能OCR识别）在正文中的占位说明
+EMPTY_PAGE_NOTE = "[本页无可提取文字，可能为扫描图片]"
+
+# 解析器版本：解析结果的格式或内容变化时递增（3：DOCX流式解析、扫描页OCR），旧的解析缓存随之失效
+EXTRACTOR_VERSION = 3
+
+# 进程内共享的解析进程池（按需创建）
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def extractor_version():
+    """
+    解析缓存使用的解析器版本：EXTRACTOR_VERSION + OCR引擎/语言及是否可用；
+    未安装OCR引擎时解析的扫描件在安装后会重新解析，而不是一直沿用空白页结果
+    """
+    ocr = f"{OCR_CONFIG['engine']}/{OCR_CONFIG['lang']}" if ocr_available() else "off"
+    return f"{EXTRACTOR_VERSION}+ocr:{ocr}"
+
+
+def get_parse_pool():
+    """获取共享的解析进程池，进程数由PARSE_CONFIG["processes"]限定"""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(max_workers=PARSE_CONFIG["processes"])
+        return _parse_pool
+
+
+def _page_item(page):
+    """提取单页文字及扫描页标记，处理完立即释放pdfplumber的页面缓存"""
+    text = page.extract_text() or ""
+    item = (text, page_image_hash(page) if is_image_only_page(page, text) else None)
+    page.flush_cache()
+    return item
+
+
+def _extract_pdf_page_range(source, start, end):
+    """
+    提取[start, end)页的文字；
+    返回[(文字, 扫描页的页面hash)]，非扫描页的页面hash为None
+    """
+    import pdfplumber
+
+    with pdfplumber.open(source) as pdf:
+        return [_page_item(page) for page in pdf.pages[start:end]]
+
+
+def _extract_pdf_document(path, parallel_min_pages):
+    """
+    在解析进程中打开PDF并统计页数：页数少于parallel_min_pages时直接提取全部页面；
+    返回(总页数, 页面列表)，页数较多时页面列表为None，由调用方按页码区间拆分并行提取
+    """
+    import pdfplumber
+
+    with pdfplumber.open(path) as pdf:
+        total_pages = len(pdf.pages)
+        if total_pages >= parallel_min_pages:
+            return total_pages, None
+        return total_pages, [_page_item(page) for page in pdf.pages]
+
+
+def extract_pdf_pages(source, workers=None, in_process=False):
+    """
+    按页提取PDF文字，返回各页文字列表（按页码顺序），扫描页为OCR识别的文字；
+    in_process=True时在当前进程中串行提取（如基准测试的串行基线）
+    """
+    page_texts, _ = _extract_pdf_text(source, workers, in_process)
+    return page_texts
+
+
+def _extract_pdf_text(source, workers=None, in_process=False):
+    """
+    返回(各页文字列表, OCR识别的页码列表)：
+    文字页在解析进程池中提取（页数较多时按页码区间拆分并行提取），
+    仅有图片的扫描页在OCR进程池中识别后按页码顺序合并
+    """
+    pages = _extract_pdf_page_items(source, workers, in_process)
+    page_texts = [text for text, _ in pages]
+    scanned = {index: page_hash for index, (_, page_hash) in enumerate(pages) if page_hash}
+    if not scanned:
+        return page_texts, []
+    # OCR在子进程中按路径重新打开文件，文件对象不做OCR
+    if not isinstance(source, (str, os.PathLike)):
+        return page_texts, []
+    with metrics.timer("parse_seconds", parser="ocr"):
+        recognized = ocr_pages(os.fspath(source), scanned)
+    ocr_page_numbers = []
+    for index, text in sorted(recognized.items()):
+        if text.strip():
+            page_texts[index] = text
+            ocr_page_numbers.append(index + 1)
+    return page_texts, ocr_page_numbers
+
+
+def _extract_pdf_page_items(source, workers=None, in_process=False):
+    """
+    按页提取PDF文字及扫描页标记（见_extract_pdf_page_range）：
+    source为磁盘路径时全部在解析进程中执行（统计页数及小PDF的整体提取为一个任务，页数较多时再按页码区间并行），
+    避免pdfplumber的CPU计算与主进程中的事件循环及JIRA线程争抢GIL
+    """
+    workers = workers or PARSE_CONFIG["processes"]
+    # 文件对象无法传给子进程，与in_process=True时一样在当前进程中提取
+    if in_process or not isinstance(source, (str, os.PathLike)):
+        return _extract_pdf_page_range(source, 0, None)
+
+    pool = get_parse_pool() if workers == PARSE_CONFIG["processes"] else ProcessPoolExecutor(max_workers=workers)
+    try:
+        parallel_min_pages = PARSE_CONFIG["pdf_parallel_min_pages"] if workers > 1 else float("inf")
+        total_pages, pages = pool.submit(_extract_pdf_document, source, parallel_min_pages).result()
+        if pages is not None:
+            return pages
+
+        # 每个进程任务处理一段连续页码，避免子进程反复打开同一文件
+        pages_per_task = max(PARSE_CONFIG["pdf_pages_per_task"], -(-total_pages // (workers * 4)))
+        ranges = [(start, min(start + pages_per_task, total_pages))
+                  for start in range(0, total_pages, pages_per_task)]
+        futures = [pool.submit(_extract_pdf_page_range, source, start, end) for start, end in ranges]
+        pages = []
+        for future in futures:
+            pages.extend(future.result())
+    finally:
+        if pool is not _parse_pool:
+            pool.shutdown()
+    return pages
+
+
+def _pdf_to_json(source):
+    """解析PDF（source为磁盘路径或文件对象，pdfplumber按需读取，不整体载入内存）"""
+    try:
+        page_texts, ocr_page_numbers = _extract_pdf_text(source)
+
+        # 各页文字先放入列表，最后一次性拼接
+        parts = []
+        empty_pages = []
+        for page_num, page_text in enumerate(page_texts, start=1):
+            if not page_text.strip():
+                empty_pages.append(page_num)
+                page_text = EMPTY_PAGE_NOTE
+            parts.append(f"=== 第{page_num}页 ===\n{page_text}\n\n")
+        pdf_text = "".join(parts)
+        metrics.inc("pdf_pages_parsed_total", len(page_texts))
+        metrics.inc("pdf_empty_pages_total", len(empty_pages))
+        if ocr_page_numbers:
+            print(f"扫描页OCR识别：第{'、'.join(map(str, ocr_page_numbers))}页")
+
+        # 封装成豆包API要求的json结构
+        result_json = {
+            "text": pdf_text,
+            "pdf_info": {
+                "total_pages": len(page_texts),
+                "empty_pages": empty_pages,
+                "ocr_pages": ocr_page_numbers
+            }
+        }
+
+        # 生成json文件，并返回json字符串
+        json_str = json.dumps(result_json, ensure_ascii=False, indent=4)
+        return json_str
+
+    except Exception as e:
+        return  json.dumps({"error": f"PDF处理失败：{str(e)}"}, ensure_ascii=False)
+
+
+# WordprocessingML命名空间
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def iter_docx_blocks(source):
+    """
+    流式解析DOCX的word/document.xml，按文档顺序产出段落及表格：
+    {"type": "paragraph", "text": ...} / {"type": "table", "rows": [[...], ...]}
+    合并单元格只输出一次（横向合并不重复，纵向合并的后续单元格为空），
+    已处理的节点及时清理，内存占用与文档大小无关
+    """
+    with zipfile.ZipFile(source) as docx_zip:
+        with docx_zip.open("word/document.xml") as xml_file:
+            body = None
+            table_depth = 0
+            para_parts = []        # 当前段落的文字片段
+            cell_paras = []        # 当前单元格的段落
+            row = None             # 当前行
+            rows = None            # 当前表格
+            cell_continued = False  # 当前单元格是否为纵向合并的后续单元格
+
+            for event, elem in ElementTree.iterparse(xml_file, events=("start", "end")):
+                tag = elem.tag
+                if event == "start":
+                    if tag == _W + "body":
+                        body = elem
+                    elif tag == _W + "tbl":
+                        table_depth += 1
+                        if table_depth == 1:
+                            rows = []
+                    elif table_depth == 1 and tag == _W + "tr":
+                        row = []
+                    elif table_depth == 1 and tag == _W + "tc":
+                        cell_paras = []
+                        cell_continued = False
+                    continue
+
+                # end事件
+                if tag == _W + "t":
+                    para_parts.append(elem.text or "")
+                elif tag == _W + "tab":
+                    para_parts.append("\t")
+                elif tag in (_W + "br", _W + "cr"):
+                    para_parts.append("\n")
+                elif tag == _W + "vMerge" and table_depth == 1:
+                    # 无val或val="continue"表示纵向合并的后续单元格
+                    cell_continued = elem.get(_W + "val", "continue") == "continue"
+                elif tag == _W + "p":
+                    text = "".join(para_parts).strip()
+                    para_parts = []
+                    if table_depth:
+                        if text:
+                            cell_paras.append(text)
+                    elif text:
+                        yield {"type": "paragraph", "text": text}
+                elif table_depth == 1 and tag == _W + "tc":
+                    row.append("" if cell_continued else "\n".join(cell_paras))
+                elif table_depth == 1 and tag == _W + "tr":
+                    rows.append(row)
+                elif tag == _W + "tbl":
+                    table_depth -= 1
+                    if table_depth == 0:
+                        yield {"type": "table", "rows": rows}
+
+                # 正文一级节点处理完毕后清理，保持内存恒定
+                if body is not None and table_depth == 0 and tag in (_W + "p", _W + "tbl", _W + "sectPr"):
+                    body.clear()
+
+
+def _docx_to_json_streaming(source):
+    """流式解析DOCX，段落与表格按文档顺序输出"""
+    full_content = {
+        "title": "Jira Attachment Content",
+        "content": list(iter_docx_blocks(source))
+    }
+    return json.dumps(full_content, ensure_ascii=False, indent=2)
+
+
+def _docx_to_json_python_docx(source):
+    """使用python-docx解析DOCX（流式解析失败时的兼容方案，段落与表格分开输出）"""
+    from docx import Document
+
+    doc = Document(source)
+    full_content = {
+        "title": "Jira Attachment Content",
+        "paragraphs": [],
+        "tables": []
+    }
+
+    # 3. 提取段落文字
+    for para in doc.paragraphs:
+        if para.text.strip():
+            full_content["paragraphs"].append(para.text.strip())
+
+    # 4. 提取表格信息
+    for table in doc.tables:
+        table_data = []
+        for row in table.rows:
+            row_content = [cell.text.strip() for cell in row.cells]
+            table_data.append(row_content)
+        full_content["tables"].append(table_data)
+
+    # 5. 转换为JSON格式
+    return json.dumps(full_content, ensure_ascii=False, indent=2)
+
+
+def _docx_to_json(source):
+    """解析DOCX（source为磁盘路径或文件对象），优先流式解析，失败时回退python-docx"""
+    try:
+        if PARSE_CONFIG["docx_streaming"]:
+            try:
+                return _docx_to_json_streaming(source)
+            except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+                print(f"DOCX流式解析失败，改用python-docx解析：{str(e)}")
+                if hasattr(source, "seek"):
+                    source.seek(0)
+        return _docx_to_json_python_docx(source)
+
+    except Exception as e:
+        return json.dumps({"error": f"DOCX处理失败：{str(e)}"}, ensure_ascii=False)
 
 
 def conver_pdf_response_to_json(response):
     # 判断是否为pdf文档
     content_type = response.headers.get("Content-Type","")
-    PDF_MIME = "application/pdf"
 
     if PDF_MIME in content_type:
         print("确认文件类型: PDF，开始解析...")
-        try:
-            pdf_text = ""
-            with pdfplumber.open(io.BytesIO(response.content)) as pdf:
-                for page_num, page in enumerate(pdf.pages, start=1):
-                    page_text = page.extract_text()
-                    pdf_text += f"=== 第{page_num}页 ===\n"
-                    pdf_text += page_text + "\n\n"
-
-                # 封装成豆包API要求的json结构
-                result_json = {
-                    "text": pdf_text,
-                    "pdf_info": {
-                        "total_pages": len(pdf.pages)
-                    }
-                }
-
-            # 生成json文件，并返回json字符串
-            json_str = json.dumps(result_json, ensure_ascii=False, indent=4)
-            return json_str
-
-        except Exception as e:
-            return  json.dumps({"error": f"PDF处理失败：{str(e)}"}, ensure_ascii=False)
+        return _pdf_to_json(io.BytesIO(response.content))
     else:
         return json.dumps({"error": "非PDF格式文件，无法处理"}, ensure_ascii=False)
 
@@ -40,8 +313,6 @@ def conver_pdf_response_to_json(response):
 def conver_docx_response_to_json(response):
     # 0. 判断是否为docx文档
     content_type = response.headers.get("Content-Type","")
-    DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-    DOC_MIME = "application/msword"
 
     if DOCX_MIME in content_type:
         print("确认文件类型: Word (.docx)，开始解析...")
@@ -53,37 +324,8 @@ def conver_docx_response_to_json(response):
         print(error_msg)
         return json.dumps({"error": error_msg}, ensure_ascii=False)
 
-
-    # 1. 将二进制流放入内存文件对象
-    doc_file = io.BytesIO(response.content)
-
-    # 2. 加载文档
-    try:
-        doc = Document(doc_file)
-        full_content = {
-            "title": "Jira Attachment Content",
-            "paragraphs": [],
-            "tables": []
-        }
-
-        # 3. 提取段落文字
-        for para in doc.paragraphs:
-            if para.text.strip():
-                full_content["paragraphs"].append(para.text.strip())
-
-        # 4. 提取表格信息
-        for table in doc.tables:
-            table_data = []
-            for row in table.rows:
-                row_content = [cell.text.strip() for cell in row.cells]
-                table_data.append(row_content)
-            full_content["tables"].append(table_data)
-
-        # 5. 转换为JSON格式
-        return json.dumps(full_content, ensure_ascii=False, indent=2)
-
-    except Exception as e:
-        return json.dumps({"error": f"DOCX处理失败：{str(e)}"}, ensure_ascii=False)
+    # 1. 将二进制流放入内存文件对象，2. 加载文档
+    return _docx_to_json(io.BytesIO(response.content))
 
 
 def convert_response_to_json(response):
@@ -92,8 +334,6 @@ def convert_response_to_json(response):
         return json.dumps({"error": "无效的响应对象"}, ensure_ascii=False)
 
     response_type = response.headers.get("Content-Type", "")
-    PDF_MIME = "application/pdf"
-    DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
 
     if PDF_MIME in response_type:
         return conver_pdf_response_to_json(response)
@@ -103,6 +343,27 @@ def convert_response_to_json(response):
         return json.dumps({"error": f"不支持的文件格式：{response_type}"}, ensure_ascii=False)
 
 
+def convert_file_to_json(path, content_type):
+    """
+    解析已流式下载到磁盘的附件（见SimpleJiraClient.download_attachment），直接从磁盘读取；
+    CPU密集部分在共享解析进程池中执行，调用方可在线程中直接调用
+    """
+    if PDF_MIME in content_type:
+        print("确认文件类型: PDF，开始解析...")
+        with metrics.timer("parse_seconds", parser="pdf"):
+            return _pdf_to_json(path)
+    elif DOCX_MIME in content_type:
+        print("确认文件类型: Word (.docx)，开始解析...")
+        # DOCX解析为纯Python的CPU密集型任务，同样放入解析进程池
+        with metrics.timer("parse_seconds", parser="docx"):
+            return get_parse_pool().submit(_docx_to_json, path).result()
+    elif DOC_MIME in content_type:
+        print("检测到旧版 .doc 格式文件，请转换为 .docx 格式文件上传")
+        return json.dumps({"error": "不支持.doc格式，仅支持.docx格式"}, ensure_ascii=False)
+    else:
+        return json.dumps({"error": f"不支持的文件格式：{content_type}"}, ensure_ascii=False)
+
+
 
 # 程序测试
 if __name__ == "__main__":
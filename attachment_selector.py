@@ -0,0 +1,47 @@
+import os
+from issue_poller import parse_jira_time
+from attachment_processor import PDF_MIME, DOCX_MIME
+from config import SUPPORTED_FILE_TYPES
+
+# 支持的文件扩展名 → 解析使用的MIME类型
+_EXTENSION_MIME = {".pdf": PDF_MIME, ".docx": DOCX_MIME}
+
+
+def attachment_content_type(attachment):
+    """
+    根据搜索结果中的附件元数据（filename/mimeType）判断解析类型，不支持的附件返回None。
+    JIRA对部分上传文件只记录application/octet-stream，因此优先按扩展名判断
+    """
+    extension = os.path.splitext(attachment.get("filename") or "")[1].lower()
+    if extension in SUPPORTED_FILE_TYPES and extension in _EXTENSION_MIME:
+        return _EXTENSION_MIME[extension]
+    mime_type = (attachment.get("mimeType") or "").split(";")[0].strip()
+    for supported in SUPPORTED_FILE_TYPES:
+        if _EXTENSION_MIME.get(supported) == mime_type:
+            return mime_type
+    return None
+
+
+def _created(attachment):
+    created = attachment.get("created")
+    return parse_jira_time(created).timestamp() if created else 0.0
+
+
+def select_attachments(attachments):
+    """
+    从ticket的附件列表中选出需要审阅的附件（无需下载）：
+    只保留支持的文件类型，同名文件（多次上传的版本）只保留最新一个，按上传时间排序
+    """
+    newest = {}
+    for attachment in attachments or []:
+        if attachment_content_type(attachment) is None:
+            continue
+        name = (attachment.get("filename") or attachment["id"]).lower()
+        if name not in newest or _created(attachment) > _created(newest[name]):
+            newest[name] = attachment
+    return sorted(newest.values(), key=_created)
+
+
+def attachment_fingerprint(attachment):
+    """附件指纹（ID/大小/上传时间），与上次审阅时相同即视为未变化"""
+    return f"{attachment['id']}:{attachment.get('size')}:{attachment.get('created')}"
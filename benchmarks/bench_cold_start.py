@@ -0,0 +1,136 @@
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_end_to_end import _free_port, _start  # noqa: E402
+from synthetic_contracts import write_corpus  # noqa: E402
+
+# 只有实际解析附件/调用豆包时才应导入的模块
+HEAVY_MODULES = ("pdfplumber", "docx", "volcenginesdkarkruntime", "pydantic")
+_IMPORT_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def parse_importtime(stderr):
+    """解析-X importtime的输出，返回{顶层模块: 累计导入耗时(秒)}及全部已导入模块名"""
+    top_level = {}
+    modules = set()
+    for line in stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        modules.add(name)
+        if indent == 1:
+            top_level[name] = cumulative / 1e6
+    return top_level, modules
+
+
+def run_once(env):
+    """以子进程运行python cli.py run-once，返回(墙钟时间, 进程CPU时间, importtime输出)"""
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", os.path.join(ROOT_DIR, "cli.py"), "run-once"],
+                            cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall = time.perf_counter() - started
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    if result.returncode != 0:
+        raise RuntimeError(f"run-once退出码{result.returncode}：{result.stderr[-2000:]}")
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return wall, cpu, result.stderr
+
+
+def run(args):
+    """模拟JIRA（评论均不含触发关键词）上重复运行run-once，统计启动及无触发轮次的耗时"""
+    work_dir = tempfile.mkdtemp(prefix="bench_cold_")
+    corpus_dir = os.path.join(work_dir, "corpus")
+    write_corpus(corpus_dir, tickets=args.tickets, attachments_per_ticket=1, min_pages=1, max_pages=2)
+    jira_port = _free_port()
+    log = open(os.path.join(work_dir, "fake_jira.log"), "w")
+    fake_jira = _start("fake_jira.py", jira_port, {
+        "manifest": os.path.join(corpus_dir, "manifest.json"), "latency": args.jira_latency, "jitter": 0,
+        "no-trigger": True
+    }, log)
+    runs = []
+    try:
+        for index in range(args.repeat):
+            # 每次使用新的状态目录，所有ticket都需要查询评论（无触发轮次中开销最大的情况）
+            state_dir = os.path.join(work_dir, f"state-{index}")
+            env = dict(os.environ, **{
+                "JIRA_SERVER": f"http://127.0.0.1:{jira_port}",
+                "JIRA_USERNAME": "bench",
+                "JIRA_API_TOKEN": "bench",
+                "JIRA_PROJECT_KEY": "BENCH",
+                "JIRA_ISSUE_TYPE": "Contract",
+                "ARK_API_KEY": "bench",
+                "DOUBAO_MODEL": "fake-doubao",
+                "LEDGER_DB_PATH": os.path.join(state_dir, "review_ledger.db"),
+                "CACHE_DIR": os.path.join(state_dir, "cache"),
+                "SIMILARITY_DB_PATH": os.path.join(state_dir, "similarity_index.db"),
+                "attachment_save_path": os.path.join(work_dir, "downloads")
+            })
+            wall, cpu, stderr = run_once(env)
+            top_level, modules = parse_importtime(stderr)
+            runs.append({"wall_seconds": wall, "cpu_seconds": cpu, "import_seconds": sum(top_level.values()),
+                         "top_imports": dict(sorted(top_level.items(), key=lambda item: -item[1])[:8]),
+                         "heavy_imported": sorted(module for module in modules
+                                                  if module.split(".")[0] in HEAVY_MODULES and "." not in module)})
+    finally:
+        fake_jira.terminate()
+        fake_jira.wait()
+        log.close()
+
+    def median(key):
+        values = sorted(run[key] for run in runs)
+        return round(values[len(values) // 2], 3)
+
+    return {
+        "tickets": args.tickets,
+        "repeat": args.repeat,
+        "wall_seconds": median("wall_seconds"),
+        "cpu_seconds": median("cpu_seconds"),
+        "import_seconds": median("import_seconds"),
+        "top_imports": {name: round(seconds, 3) for name, seconds in runs[-1]["top_imports"].items()},
+        "heavy_imported": runs[-1]["heavy_imported"]
+    }
+
+
+def print_report(report):
+    print(f"无触发轮次（{report['tickets']}个ticket，{report['repeat']}次取中位数）：")
+    print(f"  墙钟时间 {report['wall_seconds']}秒，解释器CPU时间 {report['cpu_seconds']}秒，"
+          f"其中模块导入 {report['import_seconds']}秒")
+    print(f"  导入耗时最多的顶层模块：{report['top_imports']}")
+    print(f"  已导入的重量级模块：{report['heavy_imported'] or '无'}")
+
+
+# 冷启动基准测试：python benchmarks/bench_cold_start.py --tickets 20 --fail-above 1.0
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="冷启动基准测试（cli.py run-once在无触发ticket上的耗时及导入开销）")
+    parser.add_argument("--tickets", type=int, default=20, help="ticket数（均不触发审阅）")
+    parser.add_argument("--repeat", type=int, default=5, help="重复运行次数")
+    parser.add_argument("--jira-latency", type=float, default=0.02, help="模拟JIRA每个请求的延迟（秒）")
+    parser.add_argument("--json", metavar="FILE", help="将报告写入JSON文件")
+    parser.add_argument("--fail-above", type=float, default=0.0, help="解释器CPU时间超过该值（秒）时以非0退出")
+    args = parser.parse_args()
+
+    result = run(args)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if result["heavy_imported"]:
+        print(f"❌ 无触发轮次导入了{result['heavy_imported']}")
+        sys.exit(1)
+    if args.fail_above and result["cpu_seconds"] > args.fail_above:
+        print(f"❌ 解释器CPU时间{result['cpu_seconds']}秒超过阈值{args.fail_above}秒")
+        sys.exit(1)
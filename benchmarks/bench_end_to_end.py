@@ -0,0 +1,245 @@
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic_contracts import write_corpus  # noqa: E402
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"模拟服务启动失败（退出码{process.returncode}）")
+        with contextlib.suppress(OSError), socket.create_connection(("127.0.0.1", port), timeout=0.5):
+            return
+        time.sleep(0.1)
+    raise RuntimeError(f"等待模拟服务端口{port}超时")
+
+
+def _start(script, port, options, log):
+    """在独立进程中启动模拟服务（避免与被测程序争用GIL），返回子进程"""
+    command = [sys.executable, os.path.join(BENCH_DIR, script), "--port", str(port)]
+    for key, value in options.items():
+        # 值为True的选项为开关参数
+        command += [f"--{key}"] if value is True else [f"--{key}", str(value)]
+    process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+    _wait_for_port(port, process)
+    return process
+
+
+def _fake_stats(port):
+    import requests
+    return requests.get(f"http://127.0.0.1:{port}/__stats", timeout=5).json()
+
+
+def _peak_rss_mb():
+    """主进程峰值RSS，及解析子进程的峰值RSS之和（读取/proc，仅Linux）"""
+    # Linux下ru_maxrss单位为KB
+    main_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children_rss = 0.0
+    for child in multiprocessing.active_children():
+        with contextlib.suppress(OSError):
+            with open(f"/proc/{child.pid}/status", "r") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        children_rss += int(line.split()[1]) / 1024
+    return round(main_rss, 1), round(children_rss, 1)
+
+
+def _posted_counts(ledger_path):
+    """从台账统计已回写审阅意见的ticket数及附件数"""
+    with contextlib.closing(sqlite3.connect(ledger_path)) as conn:
+        return conn.execute(
+            "SELECT COUNT(DISTINCT issue_id), COUNT(*) FROM reviews WHERE status = 'posted'"
+        ).fetchone()
+
+
+def _worker(index, args, log_dir, results):
+    """一个实例：运行args.ticks轮main.main，返回各轮耗时及峰值内存（多实例时各自在独立进程中运行）"""
+    app_log_path = os.path.join(log_dir, f"app-{index}.log" if args.workers > 1 else "app.log")
+    with open(app_log_path, "w", encoding="utf-8") as app_log:
+        with contextlib.redirect_stdout(sys.stdout if args.verbose else app_log):
+            import main
+
+            tick_seconds = []
+            for _ in range(args.ticks):
+                tick_start = time.perf_counter()
+                main.main()
+                tick_seconds.append(time.perf_counter() - tick_start)
+    main_rss, children_rss = _peak_rss_mb()
+    # 共享解析进程池只在解释器退出时关闭，multiprocessing子进程需显式关闭，否则等待进程池而无法退出
+    import attachment_processor
+    attachment_processor.get_parse_pool().shutdown()
+    results.put({"worker": index, "tick_seconds": tick_seconds, "peak_rss_mb": main_rss,
+                 "parse_workers_peak_rss_mb": children_rss, "log": app_log_path})
+
+
+def run(args):
+    """
+    生成语料 → 启动模拟JIRA/豆包 → 运行main.main（--workers大于1时启动多个实例，通过租约分配ticket）
+    → 汇总吞吐、各阶段耗时、峰值内存及重复评论数
+    """
+    work_dir = tempfile.mkdtemp(prefix="bench_e2e_")
+    corpus_dir = os.path.join(work_dir, "corpus")
+    started = time.perf_counter()
+    manifest = write_corpus(corpus_dir, tickets=args.tickets, attachments_per_ticket=args.attachments,
+                            min_pages=args.min_pages, max_pages=args.max_pages, docx_ratio=args.docx_ratio,
+                            seed=args.seed)
+    attachment_count = sum(len(issue["attachments"]) for issue in manifest["issues"])
+    print(f"合成语料：{args.tickets}个ticket，{attachment_count}个附件（{time.perf_counter() - started:.1f}秒）")
+
+    jira_port, ark_port = _free_port(), _free_port()
+    log = open(os.path.join(work_dir, "fakes.log"), "w")
+    fakes = []
+    try:
+        fakes.append(_start("fake_jira.py", jira_port, {
+            "manifest": os.path.join(corpus_dir, "manifest.json"), "latency": args.jira_latency,
+            "jitter": args.jira_latency / 2, "throttle-rate": args.jira_429_rate, "retry-after": args.retry_after
+        }, log))
+        fakes.append(_start("fake_ark.py", ark_port, {
+            "first-token": args.ark_first_token, "tokens-per-second": args.ark_tokens_per_second,
+            "output-tokens": args.ark_output_tokens, "throttle-rate": args.ark_429_rate,
+            "retry-after": args.retry_after, "prefill-tokens-per-second": args.ark_prefill_tps
+        }, log))
+
+        # 配置在导入时读取，必须在导入main之前设置；状态文件均放在临时目录，每次从空状态开始
+        os.environ.update({
+            "JIRA_SERVER": f"http://127.0.0.1:{jira_port}",
+            "JIRA_USERNAME": "bench",
+            "JIRA_API_TOKEN": "bench",
+            "JIRA_PROJECT_KEY": "BENCH",
+            "JIRA_ISSUE_TYPE": "Contract",
+            "ARK_API_URL": f"http://127.0.0.1:{ark_port}/api/v3",
+            "ARK_API_KEY": "bench",
+            "DOUBAO_MODEL": "fake-doubao",
+            "LEDGER_DB_PATH": os.path.join(work_dir, "state", "review_ledger.db"),
+            "CACHE_DIR": os.path.join(work_dir, "state", "cache"),
+            "SIMILARITY_DB_PATH": os.path.join(work_dir, "state", "similarity_index.db"),
+            "SIMILARITY_ENABLED": "true" if args.similarity else "false",
+            "attachment_save_path": os.path.join(work_dir, "downloads"),
+            "METRICS_ENABLED": "true",
+            # 各实例的指标写入同一JSONL文件，结束后汇总整体的耗时分布
+            "METRICS_JSONL_PATH": os.path.join(work_dir, "metrics.jsonl"),
+            # 多个实例共用台账及租约数据库
+            "LEASE_ENABLED": "true" if args.workers > 1 else "false",
+            "LEASE_DB_PATH": os.path.join(work_dir, "state", "leases.db"),
+            "DOUBAO_PREFIX_CACHE": "false" if args.no_prefix_cache else "true",
+            "DOUBAO_PREFIX_CACHE_PATH": os.path.join(work_dir, "state", "prefix_cache.json")
+        })
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=_worker, args=(index, args, work_dir, results))
+                   for index in range(args.workers)]
+        for process in workers:
+            process.start()
+        worker_reports = sorted((results.get() for _ in workers), key=lambda item: item["worker"])
+        for process in workers:
+            process.join()
+
+        import metrics
+        summary, totals = metrics.summarize_jsonl(os.environ["METRICS_JSONL_PATH"])
+        # 各实例同时开始，以最慢的实例为准
+        elapsed = max(sum(item["tick_seconds"]) for item in worker_reports)
+        tickets_posted, posted = _posted_counts(os.environ["LEDGER_DB_PATH"])
+        fake_jira = _fake_stats(jira_port)
+        report = {
+            "tickets": args.tickets,
+            "attachments": attachment_count,
+            "workers": args.workers,
+            "tickets_posted": tickets_posted,
+            "posted": posted,
+            # 每个附件只应有一条评论（占位评论随后更新为审阅意见）
+            "duplicate_comments": max(0, fake_jira["comments_added"] - posted),
+            "elapsed_seconds": round(elapsed, 2),
+            "tick_seconds": [round(seconds, 2) for seconds in worker_reports[0]["tick_seconds"]],
+            "tickets_per_minute": round(tickets_posted / elapsed * 60, 1) if elapsed else 0.0,
+            "attachments_per_minute": round(posted / elapsed * 60, 1) if elapsed else 0.0,
+            "peak_rss_mb": max(item["peak_rss_mb"] for item in worker_reports),
+            "parse_workers_peak_rss_mb": max(item["parse_workers_peak_rss_mb"] for item in worker_reports),
+            "latency": {name: stats for name, stats in summary.items()
+                        if name.startswith(("pipeline_stage_seconds", "ticket_seconds", "doubao_", "parse_seconds",
+                                            "jira_call_seconds"))},
+            "counters": totals,
+            "fake_jira": fake_jira,
+            "fake_ark": _fake_stats(ark_port),
+            "log": worker_reports[0]["log"] if args.workers == 1 else work_dir
+        }
+    finally:
+        for process in fakes:
+            process.terminate()
+            process.wait()
+        log.close()
+    return report
+
+
+def print_report(report):
+    print(f"\n{report['workers']}个实例完成审阅{report['tickets_posted']}/{report['tickets']}个ticket、"
+          f"{report['posted']}/{report['attachments']}个附件，耗时{report['elapsed_seconds']}秒（各轮：{report['tick_seconds']}）")
+    print(f"重复评论：{report['duplicate_comments']}")
+    print(f"吞吐：{report['tickets_per_minute']} ticket/分钟，{report['attachments_per_minute']} 附件/分钟")
+    print(f"峰值内存（单个实例）：主进程{report['peak_rss_mb']}MB，解析子进程合计{report['parse_workers_peak_rss_mb']}MB")
+    print("耗时分布（秒）：")
+    for name, stats in report["latency"].items():
+        print(f"  {name:<70} n={stats['count']:<5} p50={stats['p50']:<8} p95={stats['p95']:<8} max={stats['max']}")
+    print(f"模拟JIRA：{report['fake_jira']}")
+    print(f"模拟豆包：{report['fake_ark']}")
+    print(f"程序输出：{report['log']}")
+
+
+# 端到端基准测试：python benchmarks/bench_end_to_end.py --tickets 50 --jira-429-rate 0.02
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="端到端基准测试（模拟JIRA/豆包 + 合成合同，运行main.main）")
+    parser.add_argument("--tickets", type=int, default=30, help="ticket数")
+    parser.add_argument("--attachments", type=int, default=1, help="每个ticket的附件数")
+    parser.add_argument("--min-pages", type=int, default=2, help="合同最少页数")
+    parser.add_argument("--max-pages", type=int, default=30, help="合同最多页数")
+    parser.add_argument("--docx-ratio", type=float, default=0.3, help="DOCX附件比例")
+    parser.add_argument("--workers", type=int, default=1, help="实例数（大于1时开启租约，各实例在独立进程中运行）")
+    parser.add_argument("--ticks", type=int, default=1, help="运行main.main的轮数（后续轮次衡量无新触发时的开销）")
+    parser.add_argument("--jira-latency", type=float, default=0.05, help="模拟JIRA每个请求的平均延迟（秒）")
+    parser.add_argument("--jira-429-rate", type=float, default=0.0, help="模拟JIRA返回429的请求比例")
+    parser.add_argument("--ark-first-token", type=float, default=1.0, help="模拟豆包首段回复前的等待（秒）")
+    parser.add_argument("--ark-tokens-per-second", type=float, default=400.0, help="模拟豆包输出速度")
+    parser.add_argument("--ark-output-tokens", type=int, default=1500, help="模拟豆包每次回复的输出token数")
+    parser.add_argument("--ark-429-rate", type=float, default=0.0, help="模拟豆包返回429的请求比例")
+    parser.add_argument("--ark-prefill-tps", type=float, default=0.0,
+                        help="模拟豆包未命中缓存的输入token的prefill速度（0表示不模拟）")
+    parser.add_argument("--no-prefix-cache", action="store_true", help="不使用前缀缓存（对比首token耗时及输入成本）")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429响应的Retry-After秒数")
+    parser.add_argument("--similarity", action="store_true", help="开启相似合同复用（合成语料高度相似，默认关闭）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="FILE", help="将报告写入JSON文件（便于部署前对比）")
+    parser.add_argument("--fail-below", type=float, default=0.0, help="吞吐低于该值（ticket/分钟）时以非0退出")
+    parser.add_argument("--verbose", action="store_true", help="直接输出程序日志（默认写入临时目录）")
+    args = parser.parse_args()
+
+    result = run(args)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if result["duplicate_comments"]:
+        print(f"❌ 出现{result['duplicate_comments']}条重复评论")
+        sys.exit(1)
+    if args.fail_below and result["tickets_per_minute"] < args.fail_below:
+        print(f"❌ 吞吐{result['tickets_per_minute']} ticket/分钟低于阈值{args.fail_below}")
+        sys.exit(1)
@@ -0,0 +1,45 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from attachment_processor import extract_pdf_pages  # noqa: E402
+from synthetic_contracts import write_pdf  # noqa: E402
+
+
+def bench(path, workers, rounds=1):
+    """返回(页数, 每秒页数)"""
+    best = None
+    pages = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        # 单进程为串行基线（在当前进程中提取，不经过进程池）
+        pages = len(extract_pdf_pages(path, workers=workers, in_process=workers == 1))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return pages, pages / best
+
+
+# PDF按页并行提取的吞吐测试：python benchmarks/bench_pdf_extract.py --pages 300
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="PDF并行提取基准测试")
+    parser.add_argument("--pages", type=int, default=300, help="合成PDF页数")
+    parser.add_argument("--rounds", type=int, default=1, help="每种进程数重复次数（取最快一次）")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = write_pdf(os.path.join(tmp_dir, "contract.pdf"), pages=args.pages)
+        print(f"合成PDF：{args.pages}页，{os.path.getsize(pdf_path) / 1024:.0f}KB，CPU核数：{os.cpu_count()}")
+
+        workers = 1
+        baseline = None
+        while workers <= args.max_workers:
+            pages, rate = bench(pdf_path, workers, args.rounds)
+            baseline = baseline or rate
+            print(f"进程数{workers:>3}：{rate:8.1f} 页/秒（加速比 {rate / baseline:.2f}x）")
+            workers *= 2
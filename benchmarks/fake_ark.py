@@ -0,0 +1,233 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from contract_compactor import estimate_tokens  # noqa: E402
+
+# 与审阅Prompt要求的七个模块一致
+SECTIONS = ["【合法性检查】", "【完整性检查】", "【法律风险点识别】", "【税务风险点识别】",
+            "【财务风险点识别】", "【修改建议】", "【整体结论】"]
+FILLER = "第3条第2款付款节点约定不明确，建议补充验收合格后付款的条件及发票开具要求。"
+
+
+class FakeArkState:
+    """模拟豆包responses接口的延迟、token用量、前缀缓存及限流配置与统计"""
+
+    def __init__(self, first_token_seconds=0.5, tokens_per_second=400.0, output_tokens=1500,
+                 reasoning_tokens=500, throttle_rate=0.0, retry_after=1.0, seed=0, prefill_tokens_per_second=0.0):
+        self.first_token_seconds = first_token_seconds
+        # 输入token的prefill速度（0表示不模拟）：未命中缓存的输入越多，首段回复越晚
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.reasoning_tokens = reasoning_tokens
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._prefixes = {}  # 前缀缓存ID → (token数, 过期时间戳)
+        self.stats = {"requests": 0, "throttled": 0, "streamed": 0, "input_tokens": 0, "output_tokens": 0,
+                      "cached_tokens": 0, "prefix_caches": 0, "in_flight": 0, "max_in_flight": 0}
+
+    def count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+            if key == "in_flight":
+                self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+
+    def should_throttle(self):
+        with self._lock:
+            return self.throttle_rate > 0 and self._rng.random() < self.throttle_rate
+
+    def add_prefix(self, tokens, expire_at=None):
+        """登记前缀缓存，返回缓存ID（即创建请求的回复ID）"""
+        response_id = f"resp_{uuid.uuid4().hex[:16]}"
+        with self._lock:
+            self._prefixes[response_id] = (tokens, expire_at or time.time() + 86400)
+            self.stats["prefix_caches"] += 1
+        return response_id
+
+    def prefix_tokens(self, response_id):
+        """前缀缓存的token数，不存在或已过期时返回None"""
+        with self._lock:
+            prefix = self._prefixes.get(response_id)
+        if prefix is None or prefix[1] <= time.time():
+            return None
+        return prefix[0]
+
+    def prefill_seconds(self, tokens):
+        return tokens / self.prefill_tokens_per_second if self.prefill_tokens_per_second > 0 else 0.0
+
+    def review_text(self):
+        """按配置的输出token数生成七个模块的审阅意见"""
+        per_section = max(1, self.output_tokens // len(SECTIONS))
+        repeat = max(1, per_section // max(estimate_tokens(FILLER), 1))
+        return "\n".join(f"{section}\n{FILLER * repeat}" for section in SECTIONS)
+
+
+def _response(model, text, input_tokens, state, cached_tokens=0):
+    output_tokens = estimate_tokens(text)
+    input_tokens += cached_tokens
+    return {
+        "id": f"resp_{uuid.uuid4().hex[:16]}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": model,
+        "status": "completed",
+        "tools": [],
+        "output": [
+            {"type": "reasoning", "id": f"rs_{uuid.uuid4().hex[:8]}", "status": "completed",
+             "summary": [{"type": "summary_text", "text": "模拟思考过程"}]},
+            {"type": "message", "id": f"msg_{uuid.uuid4().hex[:8]}", "role": "assistant", "status": "completed",
+             "content": [{"type": "output_text", "text": text, "annotations": []}]}
+        ],
+        "usage": {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": cached_tokens},
+            "output_tokens": output_tokens + state.reasoning_tokens,
+            "output_tokens_details": {"reasoning_tokens": state.reasoning_tokens},
+            "total_tokens": input_tokens + output_tokens + state.reasoning_tokens
+        }
+    }
+
+
+class _FakeArkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/__stats":
+            return self._json(200, dict(self.server.state.stats))
+        self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        state = self.server.state
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/responses"):
+            return self._json(404, {"error": {"message": f"unsupported path {self.path}"}})
+
+        state.count("requests")
+        if state.should_throttle():
+            state.count("throttled")
+            return self._json(429, {"error": {"code": "RateLimitExceeded", "message": "Too many requests"}},
+                              headers={"Retry-After": str(state.retry_after)})
+
+        prompt = "".join(part.get("text", "") for message in body.get("input", [])
+                         for part in message.get("content", []) if isinstance(part, dict))
+        input_tokens = estimate_tokens(prompt)
+        model = body.get("model") or "fake-doubao"
+
+        # 创建前缀缓存：只做prefill，不生成回复
+        if (body.get("caching") or {}).get("prefix"):
+            time.sleep(state.prefill_seconds(input_tokens))
+            state.count("input_tokens", input_tokens)
+            return self._json(200, {
+                "id": state.add_prefix(input_tokens, body.get("expire_at")), "object": "response",
+                "created_at": int(time.time()), "model": model, "status": "completed", "tools": [], "output": [],
+                "usage": {"input_tokens": input_tokens, "input_tokens_details": {"cached_tokens": 0},
+                          "output_tokens": 0, "output_tokens_details": {"reasoning_tokens": 0},
+                          "total_tokens": input_tokens}
+            })
+
+        # 引用前缀缓存：缓存部分计为cached_tokens，无需再次prefill
+        cached_tokens = 0
+        if body.get("previous_response_id"):
+            cached_tokens = state.prefix_tokens(body["previous_response_id"])
+            if cached_tokens is None:
+                return self._json(404, {"error": {"code": "InvalidParameter.PreviousResponseNotFound",
+                                                  "message": "previous response not found or expired"}})
+            state.count("cached_tokens", cached_tokens)
+
+        text = state.review_text()
+        state.count("input_tokens", input_tokens + cached_tokens)
+        state.count("output_tokens", estimate_tokens(text))
+        state.count("in_flight")
+        try:
+            # prefill（未命中缓存的输入） + 思考时间 + 按输出速度生成回复
+            time.sleep(state.prefill_seconds(input_tokens) + state.first_token_seconds)
+            response = _response(model, text, input_tokens, state, cached_tokens)
+            if body.get("stream"):
+                state.count("streamed")
+                self._stream(response, text)
+            else:
+                time.sleep(estimate_tokens(text) / state.tokens_per_second)
+                self._json(200, response)
+        finally:
+            state.count("in_flight", -1)
+
+    def _stream(self, response, text, chunks=20):
+        """SSE流式输出：若干段response.output_text.delta后以response.completed结束"""
+        state = self.server.state
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        message_id = response["output"][1]["id"]
+        step = max(1, len(text) // chunks)
+        delay = estimate_tokens(text) / state.tokens_per_second / chunks
+        sequence = 0
+        for start in range(0, len(text), step):
+            time.sleep(delay)
+            sequence += 1
+            self._event("response.output_text.delta", {
+                "delta": text[start:start + step], "item_id": message_id, "output_index": 1,
+                "content_index": 0, "sequence_number": sequence
+            })
+        self._event("response.completed", {"response": response, "sequence_number": sequence + 1})
+        self.close_connection = True
+
+    def _event(self, event_type, payload):
+        data = json.dumps(dict(payload, type=event_type), ensure_ascii=False)
+        self.wfile.write(f"event: {event_type}\ndata: {data}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host="127.0.0.1", **options):
+    """启动模拟豆包（方舟）responses接口（阻塞），ARK_API_URL配置为http://host:port/api/v3"""
+    server = ThreadingHTTPServer((host, port), _FakeArkHandler)
+    server.daemon_threads = True
+    server.state = FakeArkState(**options)
+    print(f"✅ 模拟豆包接口已启动：http://{host}:{server.server_address[1]}/api/v3", flush=True)
+    server.serve_forever()
+
+
+# 运行：python benchmarks/fake_ark.py --port 8082 --first-token 0.5 --output-tokens 1500
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="模拟豆包（方舟）responses接口")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--first-token", type=float, default=0.5, help="首段回复前的等待时间（秒，模拟思考）")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0, help="回复输出速度")
+    parser.add_argument("--output-tokens", type=int, default=1500, help="每次回复的输出token数")
+    parser.add_argument("--reasoning-tokens", type=int, default=500, help="每次回复计入用量的思考token数")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="返回429的请求比例")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429响应的Retry-After秒数")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=0.0,
+                        help="未命中缓存的输入token的prefill速度（0表示不模拟）")
+    args = parser.parse_args()
+
+    serve(args.port, first_token_seconds=args.first_token, tokens_per_second=args.tokens_per_second,
+          output_tokens=args.output_tokens, reasoning_tokens=args.reasoning_tokens,
+          throttle_rate=args.throttle_rate, retry_after=args.retry_after,
+          prefill_tokens_per_second=args.prefill_tokens_per_second)
@@ -0,0 +1,265 @@
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+TRIGGER_KEYWORD = "@FIN-ContractHelper"
+_COMMENTS_PATH = re.compile(r"^/rest/api/3/issue/([^/]+)/comment(?:/([^/]+))?$")
+_ATTACHMENT_PATH = re.compile(r"^/rest/api/3/attachment/content/([^/]+)$")
+_KEY_IN = re.compile(r"key in \(([^)]*)\)")
+
+
+def _adf(text):
+    """评论正文（Atlassian Document Format）"""
+    return {"type": "doc", "version": 1,
+            "content": [{"type": "paragraph", "content": [{"type": "text", "text": text}]}]}
+
+
+class FakeJiraState:
+    """
+    模拟JIRA的数据及统计：ticket与附件来自语料清单（见synthetic_contracts.write_corpus），
+    每个ticket初始有一条包含触发关键词的评论（trigger为False时为不触发审阅的普通评论）
+    """
+
+    def __init__(self, manifest, latency=0.0, jitter=0.0, throttle_rate=0.0, retry_after=1.0, seed=0, trigger=True):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.issues = {}
+        self.attachments = {}
+        self.comments = {}
+        self._comment_id = 50000
+        for issue in manifest["issues"]:
+            self.issues[issue["key"]] = issue
+            self.issues[issue["id"]] = issue
+            for attachment in issue["attachments"]:
+                self.attachments[attachment["id"]] = attachment
+            text = f"{TRIGGER_KEYWORD} 请审阅合同" if trigger else "合同已上传，待确认"
+            self.comments[issue["id"]] = [self._new_comment(text, "申请人")]
+        self.stats = {"requests": 0, "throttled": 0, "comments_added": 0, "comments_updated": 0,
+                      "comments_deleted": 0, "attachment_bytes": 0}
+
+    def _new_comment(self, text, author):
+        self._comment_id += 1
+        now = time.strftime("%Y-%m-%dT%H:%M:%S.000+0800")
+        return {"id": str(self._comment_id), "body": _adf(text), "author": {"displayName": author},
+                "created": now, "updated": now}
+
+    def count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def delay(self):
+        """每个请求的模拟延迟（秒）"""
+        with self._lock:
+            return max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+
+    def should_throttle(self):
+        with self._lock:
+            return self.throttle_rate > 0 and self._rng.random() < self.throttle_rate
+
+    def search(self, body):
+        """POST /search/jql：按nextPageToken分页，只识别key in (...)条件，其余JQL条件视为全部满足"""
+        issues = [issue for key, issue in self.issues.items() if key == issue["key"]]
+        match = _KEY_IN.search(body.get("jql", ""))
+        if match:
+            keys = {key.strip().strip('"') for key in match.group(1).split(",")}
+            issues = [issue for issue in issues if issue["key"] in keys]
+        start = int(body.get("nextPageToken") or 0)
+        page_size = int(body.get("maxResults") or 50)
+        page = issues[start:start + page_size]
+        result = {
+            "issues": [{
+                "id": issue["id"],
+                "key": issue["key"],
+                "fields": {
+                    "attachment": [{key: value for key, value in attachment.items() if key != "path"}
+                                   for attachment in issue["attachments"]],
+                    "updated": "2024-05-01T12:00:00.000+0800"
+                }
+            } for issue in page],
+            "isLast": start + page_size >= len(issues)
+        }
+        if not result["isLast"]:
+            result["nextPageToken"] = str(start + page_size)
+        return result
+
+    def list_comments(self, issue_key, params):
+        issue = self.issues.get(issue_key)
+        if issue is None:
+            return None
+        with self._lock:
+            comments = list(self.comments[issue["id"]])
+        if params.get("orderBy", [""])[0] == "-created":
+            comments.reverse()
+        max_results = int(params.get("maxResults", ["50"])[0])
+        return {"comments": comments[:max_results], "total": len(comments)}
+
+    def add_comment(self, issue_key, body):
+        issue = self.issues.get(issue_key)
+        if issue is None:
+            return None
+        text = body["body"]["content"][0]["content"][0]["text"]
+        with self._lock:
+            comment = self._new_comment(text, "合同审阅助手")
+            self.comments[issue["id"]].append(comment)
+            self.stats["comments_added"] += 1
+        return comment
+
+    def update_comment(self, issue_key, comment_id, body):
+        issue = self.issues.get(issue_key)
+        if issue is None:
+            return None
+        with self._lock:
+            for comment in self.comments[issue["id"]]:
+                if comment["id"] == comment_id:
+                    comment["body"] = body["body"]
+                    self.stats["comments_updated"] += 1
+                    return comment
+        return None
+
+    def delete_comment(self, issue_key, comment_id):
+        issue = self.issues.get(issue_key)
+        if issue is None:
+            return False
+        with self._lock:
+            before = len(self.comments[issue["id"]])
+            self.comments[issue["id"]] = [c for c in self.comments[issue["id"]] if c["id"] != comment_id]
+            deleted = len(self.comments[issue["id"]]) < before
+            self.stats["comments_deleted"] += deleted
+        return deleted
+
+
+class _FakeJiraHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _dispatch(self, method):
+        state = self.server.state
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+        if url.path == "/__stats":
+            return self._json(200, dict(state.stats))
+        state.count("requests")
+        time.sleep(state.delay())
+        if state.should_throttle():
+            state.count("throttled")
+            return self._json(429, {"errorMessages": ["Rate limit exceeded"]},
+                              headers={"Retry-After": str(state.retry_after)})
+
+        if url.path == "/rest/api/3/myself" and method == "GET":
+            return self._json(200, {"displayName": "benchmark", "accountId": "bench", "timeZone": "Asia/Shanghai"})
+        if url.path == "/rest/api/3/search/jql" and method == "POST":
+            return self._json(200, state.search(body))
+
+        match = _ATTACHMENT_PATH.match(url.path)
+        if match and method == "GET":
+            attachment = state.attachments.get(match.group(1))
+            if attachment is None:
+                return self._json(404, {"errorMessages": ["attachment not found"]})
+            return self._file(attachment)
+
+        match = _COMMENTS_PATH.match(url.path)
+        if match:
+            issue_key, comment_id = match.groups()
+            if method == "GET" and comment_id is None:
+                result = state.list_comments(issue_key, parse_qs(url.query))
+            elif method == "POST" and comment_id is None:
+                result = state.add_comment(issue_key, body)
+            elif method == "PUT" and comment_id:
+                result = state.update_comment(issue_key, comment_id, body)
+            elif method == "DELETE" and comment_id:
+                if state.delete_comment(issue_key, comment_id):
+                    return self._json(204, None)
+                result = None
+            else:
+                result = None
+            if result is None:
+                return self._json(404, {"errorMessages": ["not found"]})
+            return self._json(201 if method == "POST" else 200, result)
+        return self._json(404, {"errorMessages": [f"unsupported {method} {url.path}"]})
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def _json(self, status, payload, headers=None):
+        data = b"" if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _file(self, attachment):
+        size = os.path.getsize(attachment["path"])
+        self.send_response(200)
+        self.send_header("Content-Type", attachment["mimeType"])
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        with open(attachment["path"], "rb") as f:
+            while True:
+                chunk = f.read(64 * 1024)
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+        self.server.state.count("attachment_bytes", size)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(manifest, port, host="127.0.0.1", **options):
+    """启动模拟JIRA REST v3服务（阻塞）"""
+    server = ThreadingHTTPServer((host, port), _FakeJiraHandler)
+    server.daemon_threads = True
+    server.state = FakeJiraState(manifest, **options)
+    print(f"✅ 模拟JIRA已启动：http://{host}:{server.server_address[1]}（{len(manifest['issues'])}个ticket）", flush=True)
+    server.serve_forever()
+
+
+# 运行：python benchmarks/fake_jira.py --port 8081 --tickets 20 --latency 0.05 --throttle-rate 0.02
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+    from synthetic_contracts import write_corpus
+
+    parser = argparse.ArgumentParser(description="模拟JIRA REST v3服务（search/jql、评论、附件下载）")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--manifest", help="语料清单（synthetic_contracts.write_corpus生成），不指定时临时生成")
+    parser.add_argument("--tickets", type=int, default=20, help="未指定清单时生成的ticket数")
+    parser.add_argument("--latency", type=float, default=0.05, help="每个请求的平均延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.02, help="延迟的随机波动（秒）")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="返回429的请求比例")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429响应的Retry-After秒数")
+    parser.add_argument("--no-trigger", action="store_true", help="评论不包含触发关键词（衡量无触发轮次的开销）")
+    args = parser.parse_args()
+
+    if args.manifest:
+        with open(args.manifest, "r", encoding="utf-8") as f:
+            corpus = json.load(f)
+    else:
+        corpus = write_corpus(tempfile.mkdtemp(prefix="fake_jira_"), tickets=args.tickets)
+    serve(corpus, args.port, latency=args.latency, jitter=args.jitter,
+          throttle_rate=args.throttle_rate, retry_after=args.retry_after, trigger=not args.no_trigger)
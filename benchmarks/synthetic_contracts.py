@@ -0,0 +1,171 @@
+import json
+import os
+import random
+
+# 合成合同使用的条款素材（PDF标准字体不含中文字形，PDF正文使用英文条款）
+CLAUSE_TOPICS = [
+    "Subject Matter", "Price and Payment", "Delivery", "Acceptance", "Warranty",
+    "Confidentiality", "Intellectual Property", "Liability for Breach", "Termination",
+    "Force Majeure", "Taxes and Invoices", "Dispute Resolution", "Miscellaneous"
+]
+SENTENCES = [
+    "Party A shall pay Party B the contract price within thirty days after receipt of a valid VAT invoice.",
+    "Party B shall deliver the goods to the place designated by Party A and bear all transportation risks.",
+    "Either party may terminate this contract by written notice if the other party materially breaches it.",
+    "The breaching party shall compensate the non-breaching party for all direct losses incurred.",
+    "Neither party shall disclose any confidential information obtained during the performance hereof.",
+    "Any dispute arising from this contract shall be submitted to the court where Party A is located.",
+    "The contract price includes value added tax at the applicable rate and all other fees.",
+    "Party A may withhold five percent of the price as a quality deposit for twelve months.",
+]
+
+
+def _escape_pdf_text(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _contract_lines(pages, lines_per_page, seed):
+    """按页生成合同文字：页眉、条款标题、正文、页脚"""
+    rng = random.Random(seed)
+    clause_no = 0
+    for page_num in range(1, pages + 1):
+        lines = ["Synthetic Service Agreement No. 2024-001"]
+        for i in range(lines_per_page):
+            if i % 12 == 0:
+                clause_no += 1
+                topic = CLAUSE_TOPICS[clause_no % len(CLAUSE_TOPICS)]
+                lines.append(f"Article {clause_no} {topic}")
+            else:
+                lines.append(f"{clause_no}.{i % 12} {rng.choice(SENTENCES)}")
+        lines.append(f"Page {page_num} of {pages}")
+        yield lines
+
+
+def write_pdf(path, pages=300, lines_per_page=40, seed=0):
+    """
+    生成指定页数的文本型PDF合同（不依赖第三方库，手工写出PDF对象及xref表）
+    """
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(None)  # 页面树，所有页面生成后回填
+    page_ids = []
+    for lines in _contract_lines(pages, lines_per_page, seed):
+        stream = ["BT", "/F1 9 Tf", "11 TL", "50 800 Td"]
+        for line in lines:
+            stream.append(f"({_escape_pdf_text(line)}) Tj T*")
+        stream.append("ET")
+        content = "\n".join(stream).encode("latin-1")
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (pages_id, content_id, font_id)
+        ))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids)
+    catalog_id = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref_offset = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                % (len(objects) + 1, catalog_id, xref_offset))
+    return path
+
+
+def write_docx(path, pages=100, tables_per_page=2, rows_per_table=12, seed=0):
+    """
+    生成以表格为主的DOCX合同（约每页两个表格），表头含横向合并单元格，
+    首列含纵向合并单元格，用于对比不同DOCX解析方式的耗时
+    """
+    from docx import Document
+
+    rng = random.Random(seed)
+    doc = Document()
+    clause_no = 0
+    for page_num in range(1, pages + 1):
+        clause_no += 1
+        doc.add_paragraph(f"第{clause_no}条 {CLAUSE_TOPICS[clause_no % len(CLAUSE_TOPICS)]}")
+        for i in range(3):
+            doc.add_paragraph(f"{clause_no}.{i + 1} {rng.choice(SENTENCES)}")
+        for _ in range(tables_per_page):
+            table = doc.add_table(rows=rows_per_table, cols=5)
+            header = table.rows[0].cells
+            header[0].merge(header[1]).text = "付款节点"
+            header[2].text = "金额（元）"
+            header[3].text = "税率"
+            header[4].text = "备注"
+            table.cell(1, 0).merge(table.cell(rows_per_table - 1, 0)).text = f"第{clause_no}期"
+            for r in range(1, rows_per_table):
+                cells = table.rows[r].cells
+                cells[1].text = f"节点{r}"
+                cells[2].text = f"{rng.randint(1, 999) * 1000:,}"
+                cells[3].text = rng.choice(["6%", "9%", "13%"])
+                cells[4].text = rng.choice(SENTENCES)[:40]
+        doc.add_page_break()
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    doc.save(path)
+    return path
+
+
+def write_corpus(out_dir, tickets=20, attachments_per_ticket=1, min_pages=2, max_pages=20, docx_ratio=0.3, seed=0):
+    """
+    生成端到端基准测试使用的合成合同语料：每个ticket若干个PDF/DOCX附件，页数在[min_pages, max_pages]内随机，
+    返回语料清单（同时写入out_dir/manifest.json，供模拟JIRA服务加载）
+    """
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    issues = []
+    attachment_id = 10000
+    for index in range(1, tickets + 1):
+        attachments = []
+        for n in range(attachments_per_ticket):
+            attachment_id += 1
+            pages = rng.randint(min_pages, max_pages)
+            if rng.random() < docx_ratio:
+                # DOCX每页约两个表格，页数按比例缩小以保持相近的文字量
+                path = write_docx(os.path.join(out_dir, f"{attachment_id}.docx"), pages=max(1, pages // 4),
+                                  seed=attachment_id)
+                mime_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+            else:
+                path = write_pdf(os.path.join(out_dir, f"{attachment_id}.pdf"), pages=pages, seed=attachment_id)
+                mime_type = "application/pdf"
+            attachments.append({
+                "id": str(attachment_id),
+                "filename": f"contract-{index}-{n + 1}{os.path.splitext(path)[1]}",
+                "mimeType": mime_type,
+                "size": os.path.getsize(path),
+                "created": f"2024-05-01T10:{n:02d}:00.000+0800",
+                "path": os.path.abspath(path)
+            })
+        issues.append({"id": str(20000 + index), "key": f"BENCH-{index}", "attachments": attachments})
+
+    manifest = {"issues": issues}
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+# 生成示例文件
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="生成合成合同文件")
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--out", default="./bench_data/synthetic_contract.pdf")
+    args = parser.parse_args()
+    writer = write_docx if args.out.endswith(".docx") else write_pdf
+    print(f"✅ 已生成：{writer(args.out, pages=args.pages)}")
@@ -0,0 +1,108 @@
+import argparse
+import os
+import sys
+import time
+
+# 本模块只导入标准库，各子命令在执行时才导入所需模块：
+# run-once不加载解析库及方舟SDK（未触发审阅时全程不会用到），review-file不连接JIRA
+
+
+def run_once():
+    """运行一轮轮询审阅后退出（供cron/Kubernetes Job定时调用，不检查运行时间段），存在失败任务时返回1"""
+    import main
+
+    results = main.main()
+    return 1 if any(job.status == "failed" for job in results) else 0
+
+
+def run_daemon(webhook=False, interval=5):
+    """常驻运行：按间隔轮询，或以webhook模式接收事件（兜底轮询见WEBHOOK_SWEEP_MINUTES）"""
+    if webhook:
+        import webhook_server
+        webhook_server.serve()
+    else:
+        import main
+        main.run_daemon(interval)
+    return 0
+
+
+def review_file(path, output=None, use_cache=True):
+    """本地审阅单个合同文件（PDF/DOCX），不读写JIRA；审阅意见打印到控制台或写入output"""
+    from attachment_processor import convert_file_to_json
+    from attachment_selector import attachment_content_type
+    from contract_compactor import compact_with_stats
+    from doubao_client import call_doubao_api, parse_doubao_output, PROMPT_VERSION
+    from long_contract_review import is_long_contract, review_long_contract, LONG_PROMPT_VERSION
+    from review_cache import get_shared_cache, review_cache_key
+    from config import DOUBAO_CONFIG
+
+    if not os.path.isfile(path):
+        print(f"❌ 文件不存在：{path}")
+        return 1
+    content_type = attachment_content_type({"filename": os.path.basename(path)})
+    if content_type is None:
+        print(f"❌ 不支持的文件类型：{path}")
+        return 1
+
+    start = time.time()
+    contract = convert_file_to_json(path, content_type)
+    contract_text, before, after = compact_with_stats(contract)
+    if not contract_text.strip():
+        print(f"❌ 未能从{path}解析出合同内容：{contract}")
+        return 1
+    print(f"合同内容压缩：约{before} → {after} tokens")
+
+    # 与流水线使用相同的缓存键，已审阅过的合同直接复用
+    long_contract = is_long_contract(contract_text)
+    prompt_version = f"{PROMPT_VERSION}+{LONG_PROMPT_VERSION}" if long_contract else PROMPT_VERSION
+    cache = get_shared_cache() if use_cache else None
+    cache_key = review_cache_key(contract_text, DOUBAO_CONFIG["ai_model"], prompt_version)
+    review = cache.get("review", cache_key) if cache else None
+    if review is not None:
+        print(f"审阅结果命中缓存（AI回复ID为{review['id']}）")
+    else:
+        review = review_long_contract(contract_text) if long_contract \
+            else parse_doubao_output(call_doubao_api(contract_text))
+        if cache:
+            cache.put("review", cache_key, review)
+
+    footer = f"AI模型为{review.get('model')}, AI回复ID为{review['id']}, AI Token消耗为{review['total_tokens']}。"
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(f"{review['text']}\n\n{footer}\n")
+        print(f"✅ 审阅意见已写入{output}")
+    else:
+        print(f"\n{review['text']}\n\n{footer}")
+    print(f"耗时{time.time() - start:.1f}秒")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="JIRA合同审阅助手")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("run-once", help="运行一轮轮询审阅后退出（cron/Kubernetes Job）")
+
+    daemon = subparsers.add_parser("daemon", help="常驻运行（每天9:00-19:00内按间隔轮询）")
+    daemon.add_argument("--interval", type=int, default=5, help="轮询间隔（分钟）")
+    daemon.add_argument("--webhook", action="store_true", help="以webhook模式运行（同python webhook_server.py）")
+
+    review = subparsers.add_parser("review-file", help="本地审阅单个合同文件（不读写JIRA）")
+    review.add_argument("path", help="PDF或DOCX文件路径")
+    review.add_argument("--output", help="将审阅意见写入文件")
+    review.add_argument("--no-cache", action="store_true", help="不使用审阅缓存")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "run-once":
+        return run_once()
+    if args.command == "daemon":
+        return run_daemon(webhook=args.webhook, interval=args.interval)
+    return review_file(args.path, output=args.output, use_cache=not args.no_cache)
+
+
+# 运行：python cli.py run-once / python cli.py daemon [--webhook] / python cli.py review-file 合同.pdf
+if __name__ == "__main__":
+    sys.exit(main())
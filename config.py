@@ -12,20 +12,157 @@ JIRA_CONFIG = {
     "api_token": os.getenv("JIRA_API_TOKEN"),
     "project_key": os.getenv("JIRA_PROJECT_KEY"),  # 你指定的板块key
     "issue_type": os.getenv("JIRA_ISSUE_TYPE"),    # 你指定的ticket类型
-    "trigger_keyword": "@FIN-ContractHelper"         # 触发的@字段
+    "trigger_keyword": "@FIN-ContractHelper",        # 触发的@字段
+    "pool_connections": int(os.getenv("JIRA_POOL_CONNECTIONS", "4")),  # 连接池缓存的host数量（含附件重定向host）
+    "pool_maxsize": int(os.getenv("JIRA_POOL_MAXSIZE", "16")),         # 每个host的最大长连接数
+    "connect_timeout": float(os.getenv("JIRA_CONNECT_TIMEOUT", "10")),  # 连接超时（秒）
+    "read_timeout": float(os.getenv("JIRA_READ_TIMEOUT", "60"))         # 读取超时（秒）
 }
 
 # 豆包API配置（需替换为官方有效地址）
 DOUBAO_CONFIG = {
     "api_url": os.getenv("ARK_API_URL"),
     "api_key": os.getenv("ARK_API_KEY"),
-    "ai_model": os.getenv("DOUBAO_MODEL")
+    "ai_model": os.getenv("DOUBAO_MODEL"),
+    "timeout": float(os.getenv("DOUBAO_TIMEOUT", "600")),  # 单次请求超时（秒），思考模式下长合同耗时较长
+    "prefix_cache": os.getenv("DOUBAO_PREFIX_CACHE", "true").lower() == "true",  # 是否将固定审阅指令缓存为前缀
+    "prefix_cache_ttl": int(os.getenv("DOUBAO_PREFIX_CACHE_TTL", "86400")),      # 前缀缓存有效期（秒）
+    "prefix_cache_path": os.getenv("DOUBAO_PREFIX_CACHE_PATH", "./state/prefix_cache.json")  # 前缀缓存ID登记文件
 }
 
 # 配置附件下载地址
 ATTACHMENT_CONFIG = {
-    "save_path": os.getenv("attachment_save_path", "./downloads")
+    "save_path": os.getenv("attachment_save_path", "./downloads"),
+    "max_bytes": int(os.getenv("attachment_max_mb", "100")) * 1024 * 1024,  # 附件大小上限，超过即中止下载
+    "chunk_size": 1024 * 1024,                                              # 流式下载分块大小
+    "keep_files": os.getenv("attachment_keep_files", "false").lower() == "true"  # 解析后是否保留下载文件
 }
 
 # 支持的附件格式
-SUPPORTED_FILE_TYPES = [".pdf", ".docx"]
\ No newline at end of file
+SUPPORTED_FILE_TYPES = [".pdf", ".docx"]
+
+# 审阅流水线各阶段并发配置
+PIPELINE_CONFIG = {
+    "jira_workers": int(os.getenv("PIPELINE_JIRA_WORKERS", "8")),          # JIRA读取（评论/附件下载）并发数
+    "parse_workers": int(os.getenv("PIPELINE_PARSE_WORKERS", "2")),        # 同时解析的附件数（进程数见PARSE_CONFIG）
+    "llm_workers": int(os.getenv("PIPELINE_LLM_WORKERS", "16")),           # 豆包API并发调用数
+    "writeback_workers": int(os.getenv("PIPELINE_WRITEBACK_WORKERS", "4")),  # 评论回写并发数
+    "queue_size": int(os.getenv("PIPELINE_QUEUE_SIZE", "32")),             # 阶段间队列长度上限
+    "progressive_writeback": os.getenv("PIPELINE_PROGRESSIVE_WRITEBACK", "true").lower() == "true",  # 先回写占位评论并随流式输出更新
+    "progress_interval": float(os.getenv("PIPELINE_PROGRESS_INTERVAL", "15"))  # 占位评论两次更新的最小间隔（秒）
+}
+
+# 审阅处理台账（SQLite）配置
+LEDGER_CONFIG = {
+    "db_path": os.getenv("LEDGER_DB_PATH", "./state/review_ledger.db"),
+    "max_attempts": int(os.getenv("RETRY_MAX_ATTEMPTS", "5")),               # 失败任务最多尝试次数，超过后进入死信
+    "retry_base_seconds": int(os.getenv("RETRY_BASE_SECONDS", "60")),        # 首次重试等待时间，之后按2倍递增
+    "retry_max_seconds": int(os.getenv("RETRY_MAX_SECONDS", "3600"))         # 重试等待时间上限
+}
+
+# 内容寻址缓存（附件解析结果/豆包审阅结果）配置
+CACHE_CONFIG = {
+    "cache_dir": os.getenv("CACHE_DIR", "./state/cache"),
+    "max_bytes": int(os.getenv("CACHE_MAX_MB", "512")) * 1024 * 1024,  # 缓存总大小上限
+    "max_age_days": int(os.getenv("CACHE_MAX_AGE_DAYS", "30"))          # 缓存条目最长保留天数
+}
+
+# JIRA增量轮询配置
+POLLING_CONFIG = {
+    "incremental": os.getenv("POLLING_INCREMENTAL", "true").lower() == "true",  # 是否只查询上次水位之后更新的ticket
+    "overlap_minutes": int(os.getenv("POLLING_OVERLAP_MINUTES", "10")),         # 水位回退窗口，覆盖时钟误差及ticket更新与查询的时间差
+    "page_size": int(os.getenv("POLLING_PAGE_SIZE", "100")),                    # 每页ticket数量
+    "latest_comments": int(os.getenv("POLLING_LATEST_COMMENTS", "1"))           # 触发检查时获取的最新评论条数
+}
+
+# 附件解析配置
+PARSE_CONFIG = {
+    "processes": int(os.getenv("PARSE_PROCESSES", str(os.cpu_count() or 1))),     # 解析进程池大小
+    "pdf_pages_per_task": int(os.getenv("PARSE_PDF_PAGES_PER_TASK", "16")),       # 每个进程任务处理的最少页数
+    "pdf_parallel_min_pages": int(os.getenv("PARSE_PDF_PARALLEL_MIN_PAGES", "32")),  # 页数达到该值才并行提取
+    "docx_streaming": os.getenv("PARSE_DOCX_STREAMING", "true").lower() == "true"    # DOCX是否使用流式解析
+}
+
+# 扫描件OCR配置（仅有图片、无可提取文字的PDF页面）
+OCR_CONFIG = {
+    "enabled": os.getenv("OCR_ENABLED", "true").lower() == "true",                 # 是否对扫描页做OCR（未安装OCR引擎时自动跳过）
+    "engine": os.getenv("OCR_ENGINE", "tesseract"),                                # tesseract（pytesseract）/ rapidocr（rapidocr_onnxruntime）
+    "lang": os.getenv("OCR_LANG", "chi_sim+eng"),                                  # tesseract识别语言
+    "processes": int(os.getenv("OCR_PROCESSES", "2")),                             # OCR进程池大小（OCR占用内存较多，单独限定）
+    "dpi": int(os.getenv("OCR_DPI", "200")),                                       # 页面渲染分辨率
+    "min_chars": int(os.getenv("OCR_MIN_CHARS", "20")),                            # 可提取文字少于该字数的页面才可能是扫描页
+    "min_image_coverage": float(os.getenv("OCR_MIN_IMAGE_COVERAGE", "0.5"))        # 图片覆盖页面面积达到该比例视为扫描页
+}
+
+# 长合同分块审阅配置
+LONG_CONTRACT_CONFIG = {
+    "threshold_tokens": int(os.getenv("LONG_CONTRACT_THRESHOLD_TOKENS", "24000")),  # 超过该估算token数启用分块审阅
+    "chunk_tokens": int(os.getenv("LONG_CONTRACT_CHUNK_TOKENS", "8000")),           # 每个分块的token预算
+    "chunk_workers": int(os.getenv("LONG_CONTRACT_CHUNK_WORKERS", "4"))             # 单份合同的分块并发审阅数
+}
+
+# 限流配置：JIRA各端点与豆包API分别使用令牌桶限速，并发上限按AIMD自适应调整
+RATE_LIMIT_CONFIG = {
+    "jira_rate": float(os.getenv("JIRA_RATE_LIMIT", "10")),                # JIRA每个端点每秒请求数
+    "jira_burst": int(os.getenv("JIRA_RATE_BURST", "20")),                 # JIRA每个端点允许的突发请求数
+    "jira_max_concurrency": int(os.getenv("JIRA_MAX_CONCURRENCY", "16")),  # JIRA每个端点并发请求上限
+    "doubao_rate": float(os.getenv("DOUBAO_RATE_LIMIT", "5")),             # 豆包每秒请求数
+    "doubao_burst": int(os.getenv("DOUBAO_RATE_BURST", "10")),             # 豆包允许的突发请求数
+    "doubao_max_concurrency": int(os.getenv("DOUBAO_MAX_CONCURRENCY", "16")),  # 豆包并发请求上限
+    "doubao_tpm": int(os.getenv("DOUBAO_TPM", "0")),                       # 豆包每分钟token预算（0为不限制）
+    "doubao_output_tokens": int(os.getenv("DOUBAO_OUTPUT_TOKENS", "4000")),  # 预估单次回复token数（用于预扣预算）
+    "max_retries": int(os.getenv("RATE_LIMIT_MAX_RETRIES", "5")),          # 被限流（429/503）后的最大重试次数
+    "backoff_seconds": float(os.getenv("RATE_LIMIT_BACKOFF_SECONDS", "2")),  # 无Retry-After时的初始退避时间
+    "max_backoff_seconds": float(os.getenv("RATE_LIMIT_MAX_BACKOFF_SECONDS", "60"))  # 退避时间上限
+}
+
+# webhook模式配置：本地HTTP服务接收JIRA comment_created事件，轮询降为低频兜底
+WEBHOOK_CONFIG = {
+    "host": os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+    "port": int(os.getenv("WEBHOOK_PORT", "8080")),
+    "path": os.getenv("WEBHOOK_PATH", "/jira/webhook"),
+    "secret": os.getenv("JIRA_WEBHOOK_SECRET"),                              # JIRA webhook密钥（用于校验X-Hub-Signature）
+    "max_body_bytes": int(os.getenv("WEBHOOK_MAX_BODY_KB", "1024")) * 1024,  # 请求体大小上限
+    "batch_seconds": float(os.getenv("WEBHOOK_BATCH_SECONDS", "2")),          # 合并该时间内的事件后一次查询ticket
+    "sweep_minutes": int(os.getenv("WEBHOOK_SWEEP_MINUTES", "60")),           # 兜底轮询间隔（分钟）
+    "dedupe_days": int(os.getenv("WEBHOOK_DEDUPE_DAYS", "7"))                 # 投递去重记录保留天数
+}
+
+# 修订版增量审阅配置
+REVISION_CONFIG = {
+    "enabled": os.getenv("REVISION_INCREMENTAL", "true").lower() == "true",       # 是否对修订版只审阅变化的条款
+    "max_changed_ratio": float(os.getenv("REVISION_MAX_CHANGED_RATIO", "0.5")),  # 变化条款超过该比例时完整审阅
+    "min_clauses": int(os.getenv("REVISION_MIN_CLAUSES", "3"))                   # 条款数少于该值时完整审阅
+}
+
+# 相似合同索引配置（同一模板的合同复用已有审阅意见）
+SIMILARITY_CONFIG = {
+    "enabled": os.getenv("SIMILARITY_ENABLED", "true").lower() == "true",           # 是否在审阅前查找相似合同
+    "db_path": os.getenv("SIMILARITY_DB_PATH", "./state/similarity_index.db"),     # 索引数据库文件
+    "diff_threshold": float(os.getenv("SIMILARITY_DIFF_THRESHOLD", "0.85")),       # 达到该相似度时只审阅差异部分
+    "num_perm": int(os.getenv("SIMILARITY_NUM_PERM", "128")),                      # MinHash签名长度
+    "bands": int(os.getenv("SIMILARITY_BANDS", "32")),                             # LSH分段数（需整除签名长度）
+    "shingle_size": int(os.getenv("SIMILARITY_SHINGLE_SIZE", "5"))                 # 字符shingle长度
+}
+
+# 运行指标配置（各阶段耗时、下载字节数、解析页数、token消耗等）
+METRICS_CONFIG = {
+    "enabled": os.getenv("METRICS_ENABLED", "true").lower() == "true",   # 是否采集运行指标
+    "host": os.getenv("METRICS_HOST", "0.0.0.0"),                        # Prometheus文本格式接口监听地址
+    "port": int(os.getenv("METRICS_PORT", "0")),                         # 接口端口（0为不开启，如9108）
+    "path": os.getenv("METRICS_PATH", "/metrics"),                       # 接口路径
+    "jsonl_path": os.getenv("METRICS_JSONL_PATH", ""),                   # 逐条写入指标的JSONL文件（为空不写入）
+    "window": int(os.getenv("METRICS_WINDOW", "2048"))                   # 计算分位数保留的最近样本数
+}
+
+# 多实例租约配置（多个实例共用台账及租约存储，同一ticket同时只由一个实例处理）
+LEASE_CONFIG = {
+    "enabled": os.getenv("LEASE_ENABLED", "false").lower() == "true",       # 是否启用租约（部署多个实例时开启）
+    "backend": os.getenv("LEASE_BACKEND", "sqlite"),                         # sqlite / file / 模块名:类名（自定义存储）
+    "db_path": os.getenv("LEASE_DB_PATH", "./state/leases.db"),              # sqlite租约数据库文件（各实例共用）
+    "lock_dir": os.getenv("LEASE_LOCK_DIR", "./state/leases"),               # file租约的锁文件目录
+    "ttl_seconds": int(os.getenv("LEASE_TTL_SECONDS", "300")),               # 租约时长（实例异常退出后该时间内其他实例不接管）
+    "heartbeat_seconds": int(os.getenv("LEASE_HEARTBEAT_SECONDS", "60")),    # 续约间隔（应远小于租约时长）
+    "max_held": int(os.getenv("LEASE_MAX_HELD", "16")),                      # 每个实例同时持有的租约上限（达到后等待，余下ticket由其他实例获取）
+    "worker_name": os.getenv("WORKER_NAME", "")                              # 实例名称（默认主机名，实际标识附加进程号）
+}
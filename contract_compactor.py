@@ -0,0 +1,142 @@
+import json
+import re
+from collections import Counter
+
+# PDF解析结果中的分页标记，如 "=== 第3页 ==="
+_PAGE_MARKER = re.compile(r"^=== 第(\d+)页 ===$", re.MULTILINE)
+# 中日韩文字及全角标点
+_CJK = r"\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef"
+_CJK_CHAR = re.compile(f"[{_CJK}]")
+# 两个中文字符之间被PDF提取插入的空格
+_SPACE_BETWEEN_CJK = re.compile(f"(?<=[{_CJK}])[ \t]+(?=[{_CJK}])")
+_SPACES = re.compile(r"[ \t\u00a0]+")
+_DIGITS = re.compile(r"\d+")
+# 条款标题：行首的“第X条”（中文或阿拉伯数字），兼容英文合同的“Article X”
+CLAUSE_HEADING = re.compile(r"^\s*(第[一二三四五六七八九十百千零〇两\d]+条|Article\s+\d+)", re.MULTILINE)
+# 页码：整行为页码（如“3”“- 3 -”“3 / 10”），或行内的“第3页”“共10页”“Page 3 of 10”
+_PAGE_NUMBER_LINE = re.compile(r"^[-–—\s]*\d+(\s*/\s*\d+)?[-–—\s]*$")
+_PAGE_NUMBER_TEXT = re.compile(r"第\s*\d+\s*页|共\s*\d+\s*页|Page\s+\d+(\s+of\s+\d+)?", re.IGNORECASE)
+
+# 页眉/页脚判定：至少出现在该比例的页面上（页码数字忽略不计，其余内容需完全相同）
+HEADER_FOOTER_MIN_RATIO = 0.5
+HEADER_FOOTER_MIN_PAGES = 3
+# 页眉/页脚通常很短，较长的行视为正文，避免误删重复的条款内容
+HEADER_FOOTER_MAX_LEN = 50
+
+
+def estimate_tokens(text):
+    """
+    本地粗略估算token数（不调用接口）：
+    中文字符约0.7个token/字，其余字符约4个字符/token
+    """
+    if not text:
+        return 0
+    cjk_count = len(_CJK_CHAR.findall(text))
+    other_count = len(text) - cjk_count
+    return int(cjk_count * 0.7 + other_count / 4) + 1
+
+
+def normalize_whitespace(text):
+    """统一空白：去掉中文之间多余空格、合并连续空格、去除空行"""
+    lines = []
+    for line in text.splitlines():
+        line = _SPACE_BETWEEN_CJK.sub("", line)
+        line = _SPACES.sub(" ", line).strip()
+        if line:
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def _split_pdf_pages(text):
+    """按分页标记拆分PDF文字，返回各页的行列表"""
+    parts = _PAGE_MARKER.split(text)
+    # split结果：[标记前文字, 页码, 页文字, 页码, 页文字, ...]
+    return [normalize_whitespace(page_text).splitlines() for page_text in parts[2::2]]
+
+
+def _header_footer_key(line):
+    """
+    页眉/页脚的比较键：只将页码中的数字替换为#，其余内容原样比较；
+    条款标题（如“第3条 付款”）位于页首/页尾时不可能是页眉/页脚，返回None
+    """
+    if len(line) > HEADER_FOOTER_MAX_LEN or CLAUSE_HEADING.match(line):
+        return None
+    if _PAGE_NUMBER_LINE.match(line):
+        return "#"
+    return _PAGE_NUMBER_TEXT.sub(lambda match: _DIGITS.sub("#", match.group(0)), line)
+
+
+def _strip_headers_footers(pages):
+    """去除每页重复出现的页眉/页脚行（首两行、末两行中跨页重复的内容）"""
+    if len(pages) < HEADER_FOOTER_MIN_PAGES:
+        return pages
+
+    candidates = Counter()
+    for lines in pages:
+        keys = set(_header_footer_key(line) for line in lines[:2] + lines[-2:])
+        candidates.update(keys - {None})
+    min_count = max(2, int(len(pages) * HEADER_FOOTER_MIN_RATIO))
+    repeated = {line for line, count in candidates.items() if count >= min_count}
+    if not repeated:
+        return pages
+
+    stripped = []
+    for lines in pages:
+        edge_indexes = set(range(min(2, len(lines)))) | set(range(max(len(lines) - 2, 0), len(lines)))
+        stripped.append([line for index, line in enumerate(lines)
+                         if index not in edge_indexes or _header_footer_key(line) not in repeated])
+    return stripped
+
+
+def _table_rows(rows):
+    """表格按行紧凑输出：单元格以|分隔，空行省略"""
+    lines = []
+    for row in rows:
+        cells = [_SPACES.sub(" ", cell.replace("\n", " ")).strip() for cell in row]
+        if any(cells):
+            lines.append("|".join(cells))
+    return "\n".join(lines)
+
+
+def compact_contract(contract_json):
+    """
+    将附件解析得到的JSON字符串转换为发送给模型的紧凑文本：
+    PDF去掉分页标记及重复页眉/页脚，DOCX段落与表格按行输出，统一空白。
+    解析失败的结果原样返回
+    """
+    try:
+        contract = json.loads(contract_json)
+    except ValueError:
+        return contract_json
+    if not isinstance(contract, dict) or "error" in contract:
+        return contract_json
+
+    # PDF：{"text": ..., "pdf_info": {...}}
+    if "text" in contract:
+        pages = _strip_headers_footers(_split_pdf_pages(contract["text"]))
+        if not pages:
+            return normalize_whitespace(contract["text"])
+        return "\n".join("\n".join(lines) for lines in pages if lines)
+
+    # DOCX流式解析：{"content": [段落/表格块, ...]}，保持文档顺序
+    sections = []
+    if "content" in contract:
+        for block in contract["content"]:
+            if block["type"] == "paragraph":
+                sections.append(normalize_whitespace(block["text"]))
+            elif block["type"] == "table":
+                sections.append(f"[表格]\n{_table_rows(block['rows'])}")
+
+    # DOCX python-docx解析：{"paragraphs": [...], "tables": [...]}
+    for paragraph in contract.get("paragraphs", []):
+        sections.append(normalize_whitespace(paragraph))
+    for rows in contract.get("tables", []):
+        sections.append(f"[表格]\n{_table_rows(rows)}")
+
+    return "\n".join(section for section in sections if section)
+
+
+def compact_with_stats(contract_json):
+    """返回(紧凑文本, 压缩前token估算, 压缩后token估算)"""
+    compact = compact_contract(contract_json)
+    return compact, estimate_tokens(contract_json), estimate_tokens(compact)
@@ -1,15 +1,28 @@
+import asyncio
+import hashlib
+import json
 import os
+import threading
+import time
+import weakref
 
-import requests
 import dotenv
-from volcenginesdkarkruntime import Ark
+import metrics
+from contract_compactor import estimate_tokens
+from rate_limiter import get_limiter, parse_retry_after, backoff_delay, THROTTLE_STATUS_CODES
+from config import DOUBAO_CONFIG, RATE_LIMIT_CONFIG
 
 dotenv.load_dotenv()
 
+# 同步客户端非线程安全：每个线程复用自己的客户端及连接
+_thread_local = threading.local()
+# 异步客户端绑定事件循环：每个事件循环复用一个客户端，所有协程共享其连接池
+_async_clients = weakref.WeakKeyDictionary()
 
-def build_contract_review_prompt(contract_content):
-    """构建合同审阅的Prompt，让豆包成为专业法律助手"""
-    prompt = f"""
+
+# 合同审阅的固定指令（审阅要求及输出格式）：放在请求开头且不随合同变化，
+# 作为公共前缀由方舟上下文缓存复用，每次审阅只需对合同内容做prefill
+REVIEW_INSTRUCTIONS = """
     你现在是一名专业的合同法律及财税审阅助手，需要严格按照以下要求审阅合同内容并输出法律意见：
     
     ### 审阅要求
@@ -21,9 +34,6 @@ def build_contract_review_prompt(contract_content):
     4. 建议：针对发现的问题给出具体、可落地的修改建议；
     5. 结论：给出合同整体合评价（如“基本合规，需修改XX条款”“存在重大法律风险，建议重新拟定”）。
 
-    ### 合同内容
-    {contract_content}
-    
     ### 输出格式要求
     1. 分模块输出：【合法性检查】【完整性检查】【法律风险点识别】【税务风险点识别】【财务风险点识别】【修改建议】【整体结论】；
     2. 对于重大风险（风险发生概率大于80%或风险发生后的损失金额大于50万元的）重点提示；
@@ -31,47 +41,389 @@ def build_contract_review_prompt(contract_content):
     3. 针对每一个问题，明确指出对应的合同条款位置（如“第3条第2款”）；
     4. 建议具体，避免“完善条款”等模糊表述；
     5. 输出为能普通文本格式，不需要体现格式。
+
+    需要审阅的合同见下方“### 合同内容”。
     """
-    return prompt
 
 
-def call_doubao_api(contract_content):
+def build_contract_section(contract_content):
+    """构建Prompt中随合同变化的部分（合同内容），位于固定指令之后"""
+    return f"""
+    ### 合同内容
+    {contract_content}
+    """
+
+
+def build_contract_review_prompt(contract_content):
+    """构建合同审阅的完整Prompt（固定指令 + 合同内容），让豆包成为专业法律助手"""
+    return REVIEW_INSTRUCTIONS + build_contract_section(contract_content)
+
+
+# Prompt版本：模板内容变化时自动变化，用于审阅结果缓存失效
+PROMPT_VERSION = hashlib.sha256(build_contract_review_prompt("").encode("utf-8")).hexdigest()[:12]
+
+
+def parse_doubao_output(doubao_output):
+    """将豆包API返回整理为可缓存的审阅结果：回复文本、回复ID、模型及token消耗"""
+    # 获取使用信息
+    doubao_usage = doubao_output.usage
+    total_tokens = getattr(doubao_usage, "total_tokens")
+    # 命中前缀缓存的输入token（按缓存价格计费）
+    cached_tokens = _cached_tokens(doubao_output) or 0
+
+    # 获取豆包回复意见（output[0]为思考过程，output[1]为回复内容）
+    doubao_resp = doubao_output.output
+    doubao_data = doubao_resp[1].content[0].text
+
+    return {
+        "text": doubao_data,
+        "id": doubao_output.id,
+        "model": getattr(doubao_output, "model", None) or DOUBAO_CONFIG["ai_model"],
+        "total_tokens": total_tokens,
+        "cached_tokens": cached_tokens
+    }
+
+
+def get_ark_client():
+    """获取当前线程复用的豆包客户端（首次调用时创建）"""
+    client = getattr(_thread_local, "client", None)
+    if client is None:
+        # 方舟SDK导入较慢，首次调用豆包时才导入（未触发审阅的轮次无需加载）
+        from volcenginesdkarkruntime import Ark
+
+        # 建立豆包链接
+        client = Ark(
+            base_url=DOUBAO_CONFIG["api_url"],
+            api_key=DOUBAO_CONFIG["api_key"],
+            timeout=DOUBAO_CONFIG["timeout"],
+            max_retries=0  # 限流重试由rate_limiter统一处理
+        )
+        _thread_local.client = client
+    return client
+
+
+def get_async_ark_client():
+    """获取当前事件循环复用的异步豆包客户端（首次调用时创建）"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        from volcenginesdkarkruntime import AsyncArk
+
+        client = AsyncArk(
+            base_url=DOUBAO_CONFIG["api_url"],
+            api_key=DOUBAO_CONFIG["api_key"],
+            timeout=DOUBAO_CONFIG["timeout"],
+            max_retries=0
+        )
+        _async_clients[loop] = client
+    return client
+
+
+class PrefixCacheRegistry:
+    """
+    前缀缓存登记：模型 + 固定指令hash → 方舟上下文缓存ID及过期时间，保存在本地JSON文件中（重启及多个实例复用）。
+    指令模板变化时hash随之变化，自动创建新的缓存；缓存临近过期时提前重新创建
+    """
+
+    # 距过期不足该秒数时重新创建，避免请求途中缓存过期
+    REFRESH_MARGIN = 300
+    # 创建失败后暂不使用缓存的秒数（期间直接发送完整Prompt）
+    RETRY_AFTER = 600
+
+    def __init__(self, path=None):
+        self.path = path or DOUBAO_CONFIG["prefix_cache_path"]
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        now = time.time()
+        self._entries = {key: entry for key, entry in self._entries.items() if entry["expire_at"] > now}
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _usable(self, entry):
+        return entry is not None and entry["expire_at"] - time.time() > (self.REFRESH_MARGIN if entry["id"] else 0)
+
+    def get(self, key, create):
+        """
+        返回key对应的缓存ID：不存在或临近过期时调用create()创建（返回(缓存ID, 过期时间戳)）；
+        创建失败时返回None，RETRY_AFTER秒内不再尝试
+        """
+        with self._lock:
+            if self._entries is None or not self._usable(self._entries.get(key)):
+                # 其他实例可能已创建，重新读取文件
+                self._entries = self._load()
+            entry = self._entries.get(key)
+            if not self._usable(entry):
+                try:
+                    cache_id, expire_at = create()
+                    print(f"✅ 已创建豆包前缀缓存：{cache_id}")
+                except Exception as e:
+                    print(f"⚠️ 创建豆包前缀缓存失败，暂时发送完整Prompt：{str(e)}")
+                    cache_id, expire_at = None, time.time() + self.RETRY_AFTER
+                entry = {"id": cache_id, "expire_at": expire_at}
+                self._entries[key] = entry
+                try:
+                    self._save()
+                except OSError as e:
+                    print(f"⚠️ 保存前缀缓存登记失败：{str(e)}")
+            return entry["id"]
+
+    def invalidate(self, key, cache_id):
+        """缓存已失效（如被服务端提前清理）时删除登记，下次调用重新创建"""
+        with self._lock:
+            if self._entries and self._entries.get(key, {}).get("id") == cache_id:
+                del self._entries[key]
+                try:
+                    self._save()
+                except OSError:
+                    pass
+
+
+_prefix_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_prefix_registry():
+    global _prefix_registry
+    with _registry_lock:
+        if _prefix_registry is None:
+            _prefix_registry = PrefixCacheRegistry()
+        return _prefix_registry
+
 
-    api_key = os.getenv("ARK_API_KEY")
-    base_url = os.getenv("ARK_API_URL")
-    model = os.getenv("DOUBAO_MODEL")
+def _prefix_key(instructions):
+    return f"{DOUBAO_CONFIG['ai_model']}:{hashlib.sha256(instructions.encode('utf-8')).hexdigest()[:12]}"
 
-    # 建立豆包链接
-    client = Ark(
-        base_url=base_url,
-        api_key=api_key
+
+def _message(role, text):
+    return {"role": role, "content": [{"type": "input_text", "text": text}]}
+
+
+def _create_prefix_cache(instructions):
+    """将固定指令创建为方舟前缀缓存（只做prefill，不生成回复），返回(缓存ID, 过期时间戳)"""
+    expire_at = int(time.time() + DOUBAO_CONFIG["prefix_cache_ttl"])
+    response = get_ark_client().responses.create(
+        model=DOUBAO_CONFIG["ai_model"],
+        input=[_message("system", instructions)],
+        caching={"type": "enabled", "prefix": True},
+        thinking={"type": "enabled"},
+        expire_at=expire_at
     )
+    _record_usage(response)
+    return response.id, expire_at
 
-    """调用豆包API获取合同审阅意见"""
-    prompt = build_contract_review_prompt(contract_content)
+
+def _prefix_cache_id(instructions):
+    """获取固定指令对应的前缀缓存ID，未开启前缀缓存或暂不可用时返回None"""
+    if not instructions or not DOUBAO_CONFIG["prefix_cache"]:
+        return None
+    return get_prefix_registry().get(_prefix_key(instructions), lambda: _create_prefix_cache(instructions))
+
+
+def _error_detail(error):
+    """取出方舟接口错误的错误码与错误信息（SDK异常的code/message/body），统一转为小写文本"""
+    body = getattr(error, "body", None)
+    if isinstance(body, dict):
+        body = body.get("error", body)
+    parts = [getattr(error, "code", None), getattr(error, "message", None), str(error)]
+    if isinstance(body, dict):
+        parts += [body.get("code"), body.get("message")]
+    return " ".join(str(part) for part in parts if part).lower()
+
+
+def _is_cache_miss(error, cache_id):
+    """
+    使用前缀缓存的请求因previous_response_id不存在/已过期被拒绝：
+    只看400/404状态码会把其他参数错误也当成缓存失效，需同时匹配方舟的错误码或错误信息
+    """
+    if cache_id is None or getattr(error, "status_code", None) not in (400, 404):
+        return False
+    detail = _error_detail(error)
+    if "previousresponsenotfound" in detail:
+        return True
+    return ("previous_response" in detail or "previous response" in detail) and \
+        any(word in detail for word in ("not found", "not exist", "expired"))
+
+
+def _build_request(prompt, instructions=None, cache_id=None):
+    """
+    构建responses接口的请求参数：
+    有前缀缓存时只发送prompt（合同内容），固定指令由previous_response_id引用的缓存提供；
+    无缓存时固定指令作为system消息放在最前面
+    """
+    request = {
+        "model": DOUBAO_CONFIG["ai_model"],
+        "input": [_message("user", prompt)],
+        "thinking": {"type":"enabled"},
+        "temperature": 0.7
+    }
+    if cache_id:
+        request["previous_response_id"] = cache_id
+        request["caching"] = {"type": "enabled"}
+    elif instructions:
+        request["input"].insert(0, _message("system", instructions))
+    return request
+
+
+def _estimate_cost(prompt, instructions=None):
+    """预估单次调用的token消耗（Prompt + 预估回复长度），用于每分钟token预算的预扣"""
+    return estimate_tokens((instructions or "") + prompt) + RATE_LIMIT_CONFIG["doubao_output_tokens"]
+
+
+def _throttle_delay(error, attempt):
+    """豆包API限流（429/503）且未超过重试次数时返回重试前的等待秒数，否则返回None"""
+    if getattr(error, "status_code", None) not in THROTTLE_STATUS_CODES or attempt >= RATE_LIMIT_CONFIG["max_retries"]:
+        return None
+    response = getattr(error, "response", None)
+    retry_after = parse_retry_after(response.headers.get("Retry-After")) if response is not None else None
+    return backoff_delay(attempt, retry_after)
+
+
+def _usage_tokens(response):
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+
+def _cached_tokens(response):
+    details = getattr(getattr(response, "usage", None), "input_tokens_details", None)
+    return getattr(details, "cached_tokens", None)
+
+
+def _record_usage(response):
+    """记录输入（含命中缓存部分）/输出token消耗指标"""
+    usage = getattr(response, "usage", None)
+    metrics.inc("doubao_input_tokens_total", getattr(usage, "input_tokens", None))
+    metrics.inc("doubao_cached_input_tokens_total", _cached_tokens(response))
+    metrics.inc("doubao_output_tokens_total", getattr(usage, "output_tokens", None))
+
+
+@metrics.timed("doubao_call_seconds")
+def call_doubao_prompt(prompt, instructions=None):
+    """
+    调用豆包API处理已构建好的Prompt，返回原始响应；
+    instructions为固定指令（可选），开启前缀缓存时通过缓存引用，不再重复prefill
+    """
+    client = get_ark_client()
+    limiter = get_limiter("doubao")
+    cost = _estimate_cost(prompt, instructions)
+    cache_id = _prefix_cache_id(instructions)
 
     # 让豆包返还内容
-    try:
-        print(f"✅ 豆包AI模型：{model}，开始处理合同文件")
-        response = client.responses.create(
-            model=model,
-            input=[{
-                "role":"user",
-                "content":[{
-                    "type":"input_text",
-                    "text":prompt
-                }]
-            }],
-            thinking={"type":"enabled"},
-            temperature=0.7
-        )
+    print(f"✅ 豆包AI模型：{DOUBAO_CONFIG['ai_model']}，开始处理合同文件")
+    attempt = 0
+    while True:
+        limiter.acquire(cost)
+        try:
+            response = client.responses.create(**_build_request(prompt, instructions, cache_id))
+        except Exception as e:
+            delay = _throttle_delay(e, attempt)
+            limiter.release(throttled=delay is not None, retry_after=delay, cost=cost)
+            if _is_cache_miss(e, cache_id):
+                print(f"⚠️ 豆包前缀缓存{cache_id}已失效，改为发送完整Prompt")
+                get_prefix_registry().invalidate(_prefix_key(instructions), cache_id)
+                cache_id = None
+                continue
+            if delay is None:
+                print(f"调用豆包API失败：{str(e)}")
+                raise
+            print(f"⚠️ 豆包API限流，暂停{delay:.1f}秒后重试")
+            attempt += 1
+            continue
+        # 按实际token消耗校正每分钟token预算
+        limiter.release(cost=cost, actual_cost=_usage_tokens(response), success=True)
+        _record_usage(response)
+        return response
+
+
+def call_doubao_api(contract_content):
+    """调用豆包API获取合同审阅意见"""
+    return call_doubao_prompt(build_contract_section(contract_content), instructions=REVIEW_INSTRUCTIONS)
+
+
+@metrics.timed("doubao_call_seconds")
+async def stream_doubao_prompt(prompt, on_delta=None, timeout=None, instructions=None):
+    """
+    以流式方式调用豆包API：回复文字每到达一段即回调on_delta(delta)（可为协程函数），
+    返回完整响应（与call_doubao_prompt返回格式相同）。
+    timeout为整个请求的超时秒数；调用方取消任务时流式连接随之关闭；instructions同call_doubao_prompt
+    """
+    client = get_async_ark_client()
+    timeout = timeout or DOUBAO_CONFIG["timeout"]
+    # 登记文件读写及首次创建缓存为同步调用，放到线程池中执行，不阻塞事件循环
+    cache_id = await asyncio.get_running_loop().run_in_executor(None, _prefix_cache_id, instructions) \
+        if instructions else None
+
+    async def consume():
+        started = time.perf_counter()
+        first_delta = True
+        stream = await client.responses.create(**_build_request(prompt, instructions, cache_id), stream=True)
+        try:
+            async for event in stream:
+                if event.type == "response.output_text.delta":
+                    if first_delta:
+                        # 首段回复文字的等待时间（含思考过程）
+                        metrics.observe("doubao_first_token_seconds", time.perf_counter() - started)
+                        first_delta = False
+                    if on_delta is not None:
+                        result = on_delta(event.delta)
+                        if asyncio.iscoroutine(result):
+                            await result
+                elif event.type == "response.completed":
+                    return event.response
+                elif event.type in ("response.failed", "error"):
+                    message = getattr(event, "message", None) or getattr(event.response, "error", None)
+                    raise Exception(f"豆包API返回错误：{message}")
+        finally:
+            await stream.close()
+        raise Exception("豆包API流式响应意外结束")
+
+    limiter = get_limiter("doubao")
+    cost = _estimate_cost(prompt, instructions)
+    print(f"✅ 豆包AI模型：{DOUBAO_CONFIG['ai_model']}，开始流式处理合同文件")
+    attempt = 0
+    while True:
+        await limiter.acquire_async(cost)
+        try:
+            response = await asyncio.wait_for(consume(), timeout=timeout)
+        except asyncio.CancelledError:
+            # 任务被取消时同样归还名额
+            limiter.release(cost=cost)
+            raise
+        except Exception as e:
+            delay = _throttle_delay(e, attempt)
+            limiter.release(throttled=delay is not None, retry_after=delay, cost=cost)
+            if isinstance(e, asyncio.TimeoutError):
+                raise Exception(f"调用豆包API超时（{timeout}秒）")
+            if _is_cache_miss(e, cache_id):
+                print(f"⚠️ 豆包前缀缓存{cache_id}已失效，改为发送完整Prompt")
+                get_prefix_registry().invalidate(_prefix_key(instructions), cache_id)
+                cache_id = None
+                continue
+            if delay is None:
+                raise
+            print(f"⚠️ 豆包API限流，暂停{delay:.1f}秒后重试")
+            attempt += 1
+            continue
+        limiter.release(cost=cost, actual_cost=_usage_tokens(response), success=True)
+        _record_usage(response)
+        return response
+
 
-        # 按豆包API实际返回格式解析（以下为示例，需根据真实返回调整）
-        result = response
-        return result
-    except requests.exceptions.RequestException as e:
-        print(f"调用豆包API失败：{str(e)}")
-        raise
+async def call_doubao_api_async(contract_content, on_delta=None, timeout=None):
+    """异步流式获取合同审阅意见"""
+    return await stream_doubao_prompt(build_contract_section(contract_content), on_delta=on_delta,
+                                      timeout=timeout, instructions=REVIEW_INSTRUCTIONS)
 
 
 # 程序测试
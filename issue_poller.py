@@ -0,0 +1,112 @@
+import math
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from config import POLLING_CONFIG
+
+# 台账中保存水位的键
+WATERMARK_KEY = "jira_updated_watermark"
+
+# JIRA返回的updated格式，如 2024-05-01T10:20:30.123+0800
+JIRA_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+# JQL接受的时间格式：JIRA按查询账号的时区（/myself返回的timeZone）解释，不含时区信息
+JQL_TIME_FORMAT = "%Y/%m/%d %H:%M"
+
+
+def parse_jira_time(value):
+    return datetime.strptime(value, JIRA_TIME_FORMAT)
+
+
+class IssuePoller:
+    """
+    基于updated水位的增量轮询：
+    只查询上次水位（减去回退窗口）之后更新的ticket，分页逐个产出；
+    本轮处理结束后再推进水位，处理失败的ticket不会被水位跳过
+    """
+
+    def __init__(self, jira, ledger, config=None):
+        self.jira = jira
+        self.ledger = ledger
+        self.config = dict(POLLING_CONFIG, **(config or {}))
+        self._max_seen = None
+
+    def _jira_timezone(self):
+        """JIRA账号的时区（连接时由/myself获取），未知或无法识别时返回None"""
+        name = getattr(self.jira, "time_zone", None)
+        if not name:
+            return None
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            print(f"⚠️ 无法识别JIRA账号时区{name}，改用相对时间查询")
+            return None
+
+    def _updated_since(self):
+        """
+        计算本轮查询起点，无水位或未开启增量模式时返回None（按本月全量查询）；
+        水位换算到JIRA账号时区后输出，时区未知时使用相对时间（如"-95m"），不受本机时区影响
+        """
+        if not self.config["incremental"]:
+            return None
+        watermark = self.ledger.get_meta(WATERMARK_KEY)
+        if not watermark:
+            return None
+        since = parse_jira_time(watermark) - timedelta(minutes=self.config["overlap_minutes"])
+        jira_timezone = self._jira_timezone()
+        if jira_timezone is not None:
+            return since.astimezone(jira_timezone).strftime(JQL_TIME_FORMAT)
+        minutes = math.ceil((datetime.now(timezone.utc) - since).total_seconds() / 60)
+        return f"-{max(minutes, 1)}m"
+
+    def poll(self):
+        """
+        分页产出本轮需要检查的ticket（生成器）：
+        水位之后更新的ticket，以及运维标记强制重审的ticket（不论更新时间，标记后未必有人修改过ticket）
+        """
+        updated_since = self._updated_since()
+        if updated_since:
+            print(f"增量轮询：查询{updated_since}之后更新的ticket")
+        self._max_seen = None
+
+        count = 0
+        seen = set()
+        for issue in self.jira.iter_target_issues(updated_since=updated_since,
+                                                  page_size=self.config["page_size"]):
+            updated = issue.get("fields", {}).get("updated")
+            if updated and (self._max_seen is None or parse_jira_time(updated) > parse_jira_time(self._max_seen)):
+                self._max_seen = updated
+            count += 1
+            seen.update((str(issue.get("id")), str(issue.get("key"))))
+            yield issue
+
+        # 强制重审的ticket单独按key/ID查询，已在本轮结果中的不重复产出（不影响水位）
+        forced = self.ledger.forced_issues() if self.ledger is not None else []
+        forced = [issue for issue in forced if issue not in seen]
+        if forced:
+            print(f"强制重审：另外查询{len(forced)}个ticket（{'、'.join(forced)}）")
+            for issue in self.jira.iter_target_issues(issue_keys=forced, page_size=self.config["page_size"]):
+                if str(issue.get("id")) in seen or str(issue.get("key")) in seen:
+                    continue
+                seen.update((str(issue.get("id")), str(issue.get("key"))))
+                count += 1
+                yield issue
+        print(f"✅ 本轮轮询获取到{count}个目标ticket")
+
+    def commit(self, results):
+        """
+        根据本轮处理结果推进水位：
+        存在失败或由其他实例处理中（租约）的ticket时，水位不超过其中最早的updated，保证下一轮仍会查询到
+        """
+        new_watermark = self._max_seen
+        for job in results:
+            # 强制重审的ticket在完成前每轮都会单独查询，无需压低水位（其updated可能早于水位很久）
+            if job.status not in ("failed", "leased") or getattr(job, "forced", False):
+                continue
+            updated = job.issue.get("fields", {}).get("updated")
+            if updated and (new_watermark is None or parse_jira_time(updated) < parse_jira_time(new_watermark)):
+                new_watermark = updated
+
+        old_watermark = self.ledger.get_meta(WATERMARK_KEY)
+        if new_watermark is None or new_watermark == old_watermark:
+            return
+        self.ledger.set_meta(WATERMARK_KEY, new_watermark)
+        print(f"轮询水位已更新：{old_watermark} → {new_watermark}")
@@ -1,20 +1,19 @@
+import hashlib
 import json
-import sys
 import os
+import tempfile
+import threading
 import requests
 from requests.auth import HTTPBasicAuth  # 🔧 保留：官方推荐的鉴权方式
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from config import JIRA_CONFIG
+import metrics
+from rate_limiter import get_limiter, parse_retry_after, backoff_delay, THROTTLE_STATUS_CODES
+from config import JIRA_CONFIG, ATTACHMENT_CONFIG, RATE_LIMIT_CONFIG
 
-# 1. 打印环境信息（团队排查用）
-print('Python %s on %s' % (sys.version, sys.platform))
-
-# 2. 扩展项目内utils目录（团队托管规范）
-current_dir = os.path.dirname(os.path.abspath(__file__))
-utils_dir = os.path.join(current_dir, "utils")
-sys.path.extend([utils_dir])
-print(f"✅ 已加载团队工具目录：{utils_dir}")
+# 附件类型与保存文件扩展名
+PDF_CONTENT_TYPE = "application/pdf"
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
 
 # 基于JIRA官方REST API v3规范实现的客户端（回归官方标准）
 class SimpleJiraClient:
@@ -28,104 +27,202 @@ class SimpleJiraClient:
             "Accept": "application/json",          # 官方要求：指定返回JSON
             "Content-Type": "application/json"     # 官方要求：POST请求必须设置
         }
+        # 默认超时：(连接超时, 读取超时)
+        self.timeout = (JIRA_CONFIG["connect_timeout"], JIRA_CONFIG["read_timeout"])
         retry = Retry(
             total=3,
             connect=3,
             read=3,
             backoff_factor=0.5,
-            status_forcelist=[429, 500, 502, 503, 504],
+            # 429/503由_request按Retry-After及端点限流器统一处理
+            status_forcelist=[500, 502, 504],
+            respect_retry_after_header=False,
             allowed_methods=["GET", "POST"]
         )
-        adapter = HTTPAdapter(max_retries=retry)
+        # 所有接口共用同一个长连接池，连接数需覆盖流水线中JIRA相关的并发worker
+        adapter = HTTPAdapter(
+            pool_connections=JIRA_CONFIG["pool_connections"],
+            pool_maxsize=JIRA_CONFIG["pool_maxsize"],
+            max_retries=retry
+        )
         self.session = requests.Session()
+        self.session.auth = self.auth
+        self.session.headers.update(self.headers)
         self.session.mount("https://", adapter)
         self.session.mount("http://", adapter)
+        self._adapter = adapter
+        self._request_count = 0
+        self._count_lock = threading.Lock()
+        # JIRA账号时区（get_current_user时获取），JQL中的时间按该时区解释
+        self.time_zone = None
+
+    @staticmethod
+    def _endpoint(url):
+        """按接口路径归类限流端点：search / comment / attachment / other"""
+        path = url.split("?", 1)[0]
+        if "/search" in path:
+            return "jira:search"
+        if "/comment" in path:
+            return "jira:comment"
+        if "/attachment" in path:
+            return "jira:attachment"
+        return "jira:other"
+
+    def _request(self, method, url, **kwargs):
+        """
+        统一的请求入口：复用session连接池及重试策略；
+        请求前经过端点限流器，被限流（429/503）时按Retry-After或指数退避暂停整个端点后重试
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        limiter = get_limiter(self._endpoint(url))
+        attempt = 0
+        while True:
+            limiter.acquire()
+            with self._count_lock:
+                self._request_count += 1
+            try:
+                response = self.session.request(method, url=url, **kwargs)
+            except requests.exceptions.RequestException:
+                limiter.release()
+                raise
+            metrics.inc("jira_http_requests_total", endpoint=limiter.name, status=response.status_code)
+            if response.status_code not in THROTTLE_STATUS_CODES or attempt >= RATE_LIMIT_CONFIG["max_retries"]:
+                # 只有成功的响应才提高并发上限（5xx及重试用尽的限流响应不算成功）
+                limiter.release(success=response.ok)
+                return response
+
+            delay = backoff_delay(attempt, parse_retry_after(response.headers.get("Retry-After")))
+            print(f"⚠️ JIRA接口限流（HTTP {response.status_code}），{limiter.name}暂停{delay:.1f}秒后重试")
+            limiter.release(throttled=True, retry_after=delay)
+            response.close()
+            attempt += 1
+
+    def get_connection_stats(self):
+        """连接复用统计：请求数、新建连接数及连接复用率"""
+        new_connections = 0
+        for pool_key in list(self._adapter.poolmanager.pools.keys()):
+            pool = self._adapter.poolmanager.pools.get(pool_key)
+            if pool is not None:
+                new_connections += pool.num_connections
+        requests_sent = self._request_count
+        reuse_rate = 1 - new_connections / requests_sent if requests_sent else 0.0
+        return {
+            "requests": requests_sent,
+            "new_connections": new_connections,
+            "reuse_rate": round(max(reuse_rate, 0.0), 3)
+        }
 
+    @metrics.timed("jira_call_seconds")
     def get_current_user(self):
         """验证JIRA连接（官方/myself接口）"""
         url = f"{self.base_url}/rest/api/3/myself"
         try:
-            # 使用官方鉴权方式（auth参数），移除冗余headers鉴权
-            response = requests.get(
-                url=url,
-                auth=self.auth,
-                headers=self.headers,
-                timeout=10
-            )
+            # 使用官方鉴权方式（session.auth），移除冗余headers鉴权
+            response = self._request("GET", url)
             response.raise_for_status()  # 抛出HTTP错误（官方推荐）
             user_data = response.json()
+            self.time_zone = user_data.get("timeZone")
             print(f"✅ Jira连接成功！当前用户：{user_data['displayName']} (ID: {user_data['accountId']})")
             return True
         except requests.exceptions.RequestException as e:
             raise Exception(f"Jira API请求失败：{str(e)} | 请检查邮箱/API Token是否正确")
 
-    def get_target_issues(self):
-        """获取指定项目/类型的ticket（严格遵循官方/search接口规范）"""
+    def _build_target_jql(self, updated_since=None, issue_keys=None):
+        """
+        构造目标ticket的JQL；指定updated_since时只查询该时间之后更新的ticket，
+        指定issue_keys时只在这些ticket中查询（webhook事件涉及的ticket）
+        """
+        if issue_keys:
+            keys = ", ".join(f'"{key}"' for key in issue_keys)
+            updated_clause = f'key in ({keys})'
+        elif updated_since:
+            updated_clause = f'updatedDate >= "{updated_since}"'
+        else:
+            updated_clause = 'updatedDate >= startOfMonth()'
+        return (f'spaceJira = "{JIRA_CONFIG["project_key"]}" AND worktype = {JIRA_CONFIG["issue_type"]}'
+                f' AND ({updated_clause}) AND status = "Pre Authorize"'
+                f' AND attachments IS NOT EMPTY ORDER BY updated ASC')
+
+    @metrics.timed("jira_call_seconds")
+    def iter_target_issues(self, updated_since=None, page_size=100, issue_keys=None):
+        """
+        分页获取指定项目/类型的ticket（生成器），跟随nextPageToken直至最后一页，
+        下游可在第一页返回后立即开始处理
+        """
         # 1. 官方标准的search-post接口URL
         url = f"{self.base_url}/rest/api/3/search/jql"
 
         # 2. 构造jql
-        jql = (f'spaceJira = "{JIRA_CONFIG["project_key"]}" AND worktype = {JIRA_CONFIG["issue_type"]}'
-               f' AND (updatedDate >= startOfMonth()) AND status = "Pre Authorize"'
-               f' AND attachments IS NOT EMPTY')
-
-        # 2. 构造官方要求的POST payload（JSON格式）
-        payload = json.dumps({
-            "fields": ["id","attachment"],
-            "fieldsByKeys": True,
-            "jql": jql,
-            "maxResults": 200
-        })
+        jql = self._build_target_jql(updated_since, issue_keys)
 
-        try:
-            # 使用POST请求
-            response = requests.request(
-                "POST",
-                url=url,
-                auth=self.auth,
-                headers=self.headers,
-                data=payload,
-                timeout=30
-            )
-            response.raise_for_status()
-            result = response.json()
-            issues = result.get("issues", [])
-            print(f"✅ 获取到{len(issues)}个目标ticket（{JIRA_CONFIG['project_key']}/{JIRA_CONFIG['issue_type']}）")
-            return issues
-        except requests.exceptions.RequestException as e:
-            error_detail = f"获取ticket失败：{str(e)} | JQL：{jql}"
-            # 补充官方文档提示
-            error_detail += "\n💡 官方文档参考：https://developer.atlassian.com/cloud/jira/platform/rest/v3/api-group-issue-search/#api-rest-api-3-search-post"
-            raise Exception(error_detail)
+        next_page_token = None
+        while True:
+            # 3. 构造官方要求的POST payload（JSON格式）
+            body = {
+                "fields": ["id", "attachment", "updated"],
+                "fieldsByKeys": True,
+                "jql": jql,
+                "maxResults": page_size
+            }
+            if next_page_token:
+                body["nextPageToken"] = next_page_token
+
+            try:
+                # 使用POST请求
+                response = self._request("POST", url, data=json.dumps(body))
+                response.raise_for_status()
+                result = response.json()
+            except requests.exceptions.RequestException as e:
+                error_detail = f"获取ticket失败：{str(e)} | JQL：{jql}"
+                # 补充官方文档提示
+                error_detail += "\n💡 官方文档参考：https://developer.atlassian.com/cloud/jira/platform/rest/v3/api-group-issue-search/#api-rest-api-3-search-post"
+                raise Exception(error_detail)
+
+            yield from result.get("issues", [])
+
+            next_page_token = result.get("nextPageToken")
+            if not next_page_token or result.get("isLast", False):
+                break
+
+    @metrics.timed("jira_call_seconds")
+    def get_target_issues(self, updated_since=None, page_size=100):
+        """获取指定项目/类型的全部ticket（严格遵循官方/search接口规范，自动翻页）"""
+        issues = list(self.iter_target_issues(updated_since=updated_since, page_size=page_size))
+        print(f"✅ 获取到{len(issues)}个目标ticket（{JIRA_CONFIG['project_key']}/{JIRA_CONFIG['issue_type']}）")
+        return issues
 
+    @metrics.timed("jira_call_seconds")
     def get_issue_comments(self, issue_key):
         """获取ticket评论（官方/comment接口）"""
         url = f"{self.base_url}/rest/api/3/issue/{issue_key}/comment"
         try:
-            response = self.session.request(
-                "GET",
-                url=url,
-                auth=self.auth,
-                headers=self.headers,
-                timeout=(10, 60)
-            )
+            response = self._request("GET", url)
             response.raise_for_status()
             result = response.json()
             return result.get("comments", [])
         except requests.exceptions.RequestException as e:
             raise Exception(f"获取{issue_key}评论失败：{str(e)} | 官方文档：https://developer.atlassian.com/cloud/jira/platform/rest/v3/api-group-issue-comments/#api-rest-api-3-issue-issueidorkey-comment-get")
 
+    @metrics.timed("jira_call_seconds")
+    def get_latest_comments(self, issue_key, max_results=1):
+        """只获取ticket最新的若干条评论（按创建时间倒序取一页），按时间正序返回"""
+        url = f"{self.base_url}/rest/api/3/issue/{issue_key}/comment"
+        try:
+            response = self._request("GET", url, params={"orderBy": "-created", "maxResults": max_results})
+            response.raise_for_status()
+            result = response.json()
+            # 与get_issue_comments保持一致：最新评论在最后
+            return list(reversed(result.get("comments", [])))
+        except requests.exceptions.RequestException as e:
+            raise Exception(f"获取{issue_key}最新评论失败：{str(e)} | 官方文档：https://developer.atlassian.com/cloud/jira/platform/rest/v3/api-group-issue-comments/#api-rest-api-3-issue-issueidorkey-comment-get")
+
+    @metrics.timed("jira_call_seconds")
     def get_issue_attachments(self, attachment_key):
         """获取ticket附件（官方/issue接口）"""
         url = f"{self.base_url}/rest/api/3/attachment/content/{attachment_key}"
         try:
-            response = requests.request(
-                "GET",
-                url=url,
-                auth=self.auth,
-                allow_redirects=True,
-                timeout=20
-            )
+            # 附件内容不是JSON，覆盖默认的Accept头
+            response = self._request("GET", url, headers={"Accept": "*/*"}, allow_redirects=True)
             response.raise_for_status()
             # 返回附件本身，待根据格式处理
             result = response
@@ -133,10 +230,59 @@ class SimpleJiraClient:
         except requests.exceptions.RequestException as e:
             raise Exception(f"获取{attachment_key}附件失败：{str(e)} | 官方文档：https://developer.atlassian.com/cloud/jira/platform/rest/v3/api-group-issues/#api-rest-api-3-issue-issueidorkey-get")
 
-    def add_comment_to_issue(self, issue_key, comment_content):
-        """回写评论（官方/comment POST接口）"""
-        url = f"{self.base_url}/rest/api/3/issue/{issue_key}/comment"
-        payload = json.dumps({
+    @metrics.timed("jira_call_seconds")
+    def download_attachment(self, attachment_key, save_dir=None, max_bytes=None):
+        """
+        流式下载附件到磁盘（save_path），边下载边计算SHA-256，
+        超过大小上限时立即中止，返回附件文件信息而非整个响应内容
+        """
+        url = f"{self.base_url}/rest/api/3/attachment/content/{attachment_key}"
+        save_dir = save_dir or ATTACHMENT_CONFIG["save_path"]
+        max_bytes = max_bytes or ATTACHMENT_CONFIG["max_bytes"]
+        os.makedirs(save_dir, exist_ok=True)
+
+        tmp_path = None
+        try:
+            # 附件内容不是JSON，覆盖默认的Accept头
+            with self._request("GET", url, headers={"Accept": "*/*"}, allow_redirects=True, stream=True) as response:
+                response.raise_for_status()
+                content_type = response.headers.get("Content-Type", "")
+
+                # 服务端声明的大小已超限时，不再下载
+                content_length = int(response.headers.get("Content-Length") or 0)
+                if content_length > max_bytes:
+                    raise ValueError(f"附件大小{content_length}字节超过上限{max_bytes}字节")
+
+                sha256 = hashlib.sha256()
+                size = 0
+                fd, tmp_path = tempfile.mkstemp(prefix=f"{attachment_key}_", suffix=".part", dir=save_dir)
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=ATTACHMENT_CONFIG["chunk_size"]):
+                        size += len(chunk)
+                        if size > max_bytes:
+                            raise ValueError(f"附件大小超过上限{max_bytes}字节，已中止下载")
+                        sha256.update(chunk)
+                        f.write(chunk)
+
+            extension = {PDF_CONTENT_TYPE: ".pdf", DOCX_CONTENT_TYPE: ".docx"}.get(content_type.split(";")[0].strip(), "")
+            path = os.path.join(save_dir, f"{attachment_key}{extension}")
+            os.replace(tmp_path, path)
+            metrics.inc("attachment_download_bytes_total", size)
+            return {
+                "attachment_id": attachment_key,
+                "path": path,
+                "content_type": content_type,
+                "size": size,
+                "sha256": sha256.hexdigest()
+            }
+        except (requests.exceptions.RequestException, ValueError, OSError) as e:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise Exception(f"下载{attachment_key}附件失败：{str(e)} | 官方文档：https://developer.atlassian.com/cloud/jira/platform/rest/v3/api-group-issue-attachments/#api-rest-api-3-attachment-content-id-get")
+
+    def _comment_payload(self, comment_content):
+        """评论正文（Atlassian Document Format）"""
+        return json.dumps({
             "body": {
                 "content": [
                     {
@@ -153,20 +299,40 @@ class SimpleJiraClient:
                 "version": 1
             }
         })
+
+    @metrics.timed("jira_call_seconds")
+    def add_comment_to_issue(self, issue_key, comment_content):
+        """回写评论（官方/comment POST接口），返回新建的评论（含id）"""
+        url = f"{self.base_url}/rest/api/3/issue/{issue_key}/comment"
         try:
-            response = requests.request(
-                "POST",
-                url=url,
-                auth=self.auth,
-                headers=self.headers,
-                data=payload,
-                timeout=30
-            )
+            response = self._request("POST", url, data=self._comment_payload(comment_content))
             response.raise_for_status()
             print(f"✅ 法律意见已回写到{issue_key}的评论中")
+            return response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise Exception(f"回写评论失败：{str(e)} | 官方文档：https://developer.atlassian.com/cloud/jira/platform/rest/v3/api-group-issue-comments/#api-rest-api-3-issue-issueidorkey-comment-post")
+
+    @metrics.timed("jira_call_seconds")
+    def update_comment(self, issue_key, comment_id, comment_content):
+        """更新已有评论的内容（官方/comment/{id} PUT接口）"""
+        url = f"{self.base_url}/rest/api/3/issue/{issue_key}/comment/{comment_id}"
+        try:
+            response = self._request("PUT", url, data=self._comment_payload(comment_content))
+            response.raise_for_status()
+            return response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise Exception(f"更新评论{comment_id}失败：{str(e)} | 官方文档：https://developer.atlassian.com/cloud/jira/platform/rest/v3/api-group-issue-comments/#api-rest-api-3-issue-issueidorkey-comment-id-put")
+
+    @metrics.timed("jira_call_seconds")
+    def delete_comment(self, issue_key, comment_id):
+        """删除评论（官方/comment/{id} DELETE接口）"""
+        url = f"{self.base_url}/rest/api/3/issue/{issue_key}/comment/{comment_id}"
+        try:
+            response = self._request("DELETE", url)
+            response.raise_for_status()
             return True
         except requests.exceptions.RequestException as e:
-            raise Exception(f"回写评论失败：{str(e)} | 官方文档：https://developer.atlassian.com/cloud/jira/platform/rest/v3/api-group-issue-comments/#api-rest-api-3-issue-issueidorkey-comment-post")
+            raise Exception(f"删除评论{comment_id}失败：{str(e)} | 官方文档：https://developer.atlassian.com/cloud/jira/platform/rest/v3/api-group-issue-comments/#api-rest-api-3-issue-issueidorkey-comment-id-delete")
 
 # 对外统一的初始化方法（保持兼容）
 def connect_jira():
@@ -179,6 +345,20 @@ def connect_jira():
         print(f"❌ JIRA连接失败：{str(e)}")
         raise
 
+
+# 进程内共享的长连接客户端，鉴权校验每个进程只做一次
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
+
+def get_jira_client():
+    """获取进程内共享的JIRA客户端（首次调用时创建并验证连接）"""
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is None:
+            _shared_client = connect_jira()
+        return _shared_client
+
 # 测试代码（按官方规范验证）
 if __name__ == "__main__":
     try:
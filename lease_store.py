@@ -0,0 +1,252 @@
+import importlib
+import os
+from abc import ABC, abstractmethod
+import socket
+import sqlite3
+import threading
+import time
+from config import LEASE_CONFIG
+
+try:
+    import fcntl
+except ImportError:  # Windows无fcntl，只能使用SQLite租约
+    fcntl = None
+
+
+def default_worker_id():
+    """实例标识：WORKER_NAME（默认主机名）+ 进程号，同一台机器上的多个实例互不相同"""
+    return f"{LEASE_CONFIG['worker_name'] or socket.gethostname()}:{os.getpid()}"
+
+
+class LeaseStore(ABC):
+    """
+    租约存储接口：同一个key同时只能被一个实例（owner）持有，到期未续约的租约可被其他实例获取。
+    自定义存储（如Redis）实现以下抽象方法后，通过LEASE_BACKEND=模块名:类名启用（未实现时创建即报错）
+    """
+
+    @abstractmethod
+    def acquire(self, key, owner, ttl):
+        """获取租约（未被持有、已过期或已由owner持有时成功），返回是否成功"""
+
+    @abstractmethod
+    def renew(self, key, owner, ttl):
+        """续约，租约已不属于owner时返回False"""
+
+    @abstractmethod
+    def release(self, key, owner):
+        """释放owner持有的租约"""
+
+    def close(self):
+        pass
+
+
+class SQLiteLeaseStore(LeaseStore):
+    """
+    SQLite文件租约（默认）：多个进程/机器共用同一个数据库文件，
+    过期时间按各实例的系统时间判断，实例之间的时钟偏差需远小于租约时长
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or LEASE_CONFIG["db_path"]
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        # 多个进程同时写入时等待对方事务完成
+        self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS leases (
+                    key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    acquired_at REAL NOT NULL
+                )
+            """)
+
+    def acquire(self, key, owner, ttl):
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE立即获取写锁，避免两个实例同时读到“无人持有”
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT owner, expires_at FROM leases WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[0] != owner and row[1] > now:
+                    self._conn.execute("ROLLBACK")
+                    return False
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO leases (key, owner, expires_at, acquired_at) VALUES (?, ?, ?, ?)",
+                    (key, owner, now + ttl, now)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def renew(self, key, owner, ttl):
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE leases SET expires_at = ? WHERE key = ? AND owner = ?", (time.time() + ttl, key, owner)
+            )
+        return cursor.rowcount == 1
+
+    def release(self, key, owner):
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class FileLeaseStore(LeaseStore):
+    """
+    文件锁租约：每个key一个锁文件，持有期间保持flock排他锁；
+    进程退出时操作系统自动释放，无需过期时间（仅适用于同一台机器，或支持flock的共享文件系统）
+    """
+
+    def __init__(self, lock_dir=None):
+        if fcntl is None:
+            raise RuntimeError("当前系统不支持文件锁租约，请使用LEASE_BACKEND=sqlite")
+        self.lock_dir = lock_dir or LEASE_CONFIG["lock_dir"]
+        os.makedirs(self.lock_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._held = {}  # key → 文件描述符
+
+    def acquire(self, key, owner, ttl):
+        with self._lock:
+            if key in self._held:
+                return True
+            fd = os.open(os.path.join(self.lock_dir, f"{key}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            os.ftruncate(fd, 0)
+            os.write(fd, owner.encode("utf-8"))
+            self._held[key] = fd
+        return True
+
+    def renew(self, key, owner, ttl):
+        with self._lock:
+            return key in self._held
+
+    def release(self, key, owner):
+        with self._lock:
+            fd = self._held.pop(key, None)
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def close(self):
+        for key in list(self._held):
+            self.release(key, None)
+
+
+_BACKENDS = {"sqlite": SQLiteLeaseStore, "file": FileLeaseStore}
+
+
+def create_lease_store(backend=None):
+    """按LEASE_BACKEND创建租约存储：sqlite（默认）、file，或“模块名:类名”指定的自定义实现"""
+    backend = backend or LEASE_CONFIG["backend"]
+    if backend in _BACKENDS:
+        return _BACKENDS[backend]()
+    module_name, _, class_name = backend.partition(":")
+    if not class_name:
+        raise ValueError(f"未知的租约存储：{backend}")
+    store_class = getattr(importlib.import_module(module_name), class_name)
+    if not (isinstance(store_class, type) and issubclass(store_class, LeaseStore)):
+        raise TypeError(f"自定义租约存储{backend}需继承lease_store.LeaseStore")
+    return store_class()
+
+
+class LeaseKeeper:
+    """
+    当前实例持有的ticket租约：获取/释放租约，并由后台线程定期续约（心跳）；
+    续约失败（如实例长时间卡住导致过期并被其他实例接管）的租约不再视为持有；
+    持有数达到max_held时获取新租约需等待已持有的释放，避免一个实例一次领走全部ticket
+    """
+
+    def __init__(self, store, owner=None, ttl=None, heartbeat=None, max_held=None):
+        self.store = store
+        self.owner = owner or default_worker_id()
+        self.ttl = ttl or LEASE_CONFIG["ttl_seconds"]
+        self.heartbeat = heartbeat or LEASE_CONFIG["heartbeat_seconds"]
+        self.max_held = LEASE_CONFIG["max_held"] if max_held is None else max_held
+        self._held = set()
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._heartbeat_loop, name="lease-heartbeat", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止心跳并释放仍持有的租约"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        for key in self.held():
+            self.release(key)
+
+    def close(self):
+        self.stop()
+        self.store.close()
+
+    def held(self):
+        with self._lock:
+            return list(self._held)
+
+    def claim(self, key):
+        """获取租约（持有数达到上限时先等待），返回是否成功（其他实例持有时返回False）"""
+        key = str(key)
+        with self._released:
+            while self.max_held and len(self._held) >= self.max_held and key not in self._held:
+                self._released.wait()
+        if not self.store.acquire(key, self.owner, self.ttl):
+            return False
+        with self._lock:
+            self._held.add(key)
+        return True
+
+    def release(self, key):
+        key = str(key)
+        self.store.release(key, self.owner)
+        self._discard(key)
+
+    def _discard(self, key):
+        with self._released:
+            self._held.discard(key)
+            self._released.notify_all()
+
+    def is_held(self, key):
+        """立即续约确认租约仍属于本实例（回写前调用，避免与接管的实例重复回写）"""
+        key = str(key)
+        if self.store.renew(key, self.owner, self.ttl):
+            return True
+        self._discard(key)
+        return False
+
+    def _heartbeat_loop(self):
+        while not self._stopped.wait(self.heartbeat):
+            for key in self.held():
+                try:
+                    if not self.store.renew(key, self.owner, self.ttl):
+                        print(f"⚠️ ticket {key}的租约已过期并被其他实例接管")
+                        self._discard(key)
+                except Exception as e:
+                    # 存储暂时不可用时下次心跳再试，租约时长应为心跳间隔的数倍
+                    print(f"⚠️ 续约失败：{str(e)}")
+
+
+def start_lease_keeper():
+    """LEASE_ENABLED时创建租约存储并启动心跳，未开启时返回None"""
+    if not LEASE_CONFIG["enabled"]:
+        return None
+    keeper = LeaseKeeper(create_lease_store()).start()
+    print(f"✅ 已启用多实例租约（{LEASE_CONFIG['backend']}），实例标识：{keeper.owner}")
+    return keeper
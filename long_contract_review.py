@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+from contract_compactor import estimate_tokens, CLAUSE_HEADING
+from doubao_client import stream_doubao_prompt, parse_doubao_output
+from config import LONG_CONTRACT_CONFIG
+
+# 合并阶段输出的七个模块，与build_contract_review_prompt保持一致
+REVIEW_SECTIONS = ["【合法性检查】", "【完整性检查】", "【法律风险点识别】", "【税务风险点识别】",
+                   "【财务风险点识别】", "【修改建议】", "【整体结论】"]
+
+
+def split_clauses(text):
+    """按条款标题拆分合同文本，返回[(条款标题行, 条款全文)]，首个标题之前的内容（如合同首部）标题为空"""
+    matches = list(CLAUSE_HEADING.finditer(text))
+    if not matches:
+        return [("", text)] if text.strip() else []
+
+    clauses = []
+    if text[:matches[0].start()].strip():
+        clauses.append(("", text[:matches[0].start()].strip()))
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(text)
+        clause_text = text[match.start():end].strip()
+        # 标题取条款首行（截断过长的首行），如“第3条 付款方式”
+        clauses.append((clause_text.splitlines()[0][:40], clause_text))
+    return clauses
+
+
+def build_chunks(clauses, max_tokens):
+    """按token预算将连续条款打包为分块；单个条款超出预算时按行再拆分"""
+    chunks = []
+    current = []
+    current_tokens = 0
+
+    def flush():
+        nonlocal current, current_tokens
+        if current:
+            chunks.append("\n".join(current))
+        current = []
+        current_tokens = 0
+
+    for _, clause_text in clauses:
+        clause_tokens = estimate_tokens(clause_text)
+        if clause_tokens > max_tokens:
+            flush()
+            for line in clause_text.splitlines():
+                line_tokens = estimate_tokens(line)
+                if current and current_tokens + line_tokens > max_tokens:
+                    flush()
+                current.append(line)
+                current_tokens += line_tokens
+            flush()
+            continue
+        if current and current_tokens + clause_tokens > max_tokens:
+            flush()
+        current.append(clause_text)
+        current_tokens += clause_tokens
+    flush()
+    return chunks
+
+
+# 分块审阅的固定指令：不含分块序号，各分块及各合同共用同一个前缀缓存
+CHUNK_REVIEW_INSTRUCTIONS = """
+    你现在是一名专业的合同法律及财税审阅助手。下方为一份长合同的其中一部分，请仅针对该部分条款进行审阅：
+
+    ### 审阅要求
+    1. 从合法性、法律风险、税务风险、财务风险四个方面逐条列出发现的问题；
+    2. 每个问题必须注明对应的合同条款位置（如“第3条第2款”），并给出具体、可落地的修改建议；
+    3. 对于重大风险（风险发生概率大于80%或风险发生后的损失金额大于50万元的）标注【重大】；
+    4. 本部分未涉及的内容无需评价，也不要给出整体结论；
+    5. 输出为普通文本格式，不需要体现格式。
+    """
+
+
+def build_chunk_review_prompt(chunk_text, chunk_index, chunk_total):
+    """单个分块的审阅Prompt（不含固定指令）：只输出问题清单，供合并阶段汇总"""
+    return f"""
+    ### 合同内容（第{chunk_index}/{chunk_total}部分）
+    {chunk_text}
+    """
+
+
+def build_merge_prompt(chunk_reviews, clause_headings):
+    """合并阶段Prompt：将各分块意见汇总为与单次审阅相同的七个模块"""
+    reviews = "\n\n".join(f"--- 第{index}部分审阅意见 ---\n{review}"
+                          for index, review in enumerate(chunk_reviews, start=1))
+    return f"""
+    你现在是一名专业的合同法律及财税审阅助手。一份长合同已分为{len(chunk_reviews)}部分分别审阅，请将各部分意见汇总为完整的法律意见：
+
+    ### 合同条款目录
+    {"、".join(clause_headings) or "（未识别到条款标题）"}
+
+    ### 各部分审阅意见
+    {reviews}
+
+    ### 输出格式要求
+    1. 分模块输出：{"".join(REVIEW_SECTIONS)}；
+    2. 完整性检查：根据条款目录检查合同必备要素（当事人、标的、数量、质量、价款、履行期限/地点/方式、违约责任、争议解决）是否齐全；
+    3. 合并重复问题，保留各问题对应的合同条款位置（如“第3条第2款”），不得编造原意见中没有的条款编号；
+    4. 对于重大风险重点提示；
+    5. 给出合同整体评价（如“基本合规，需修改XX条款”“存在重大法律风险，建议重新拟定”）；
+    6. 输出为普通文本格式，不需要体现格式。
+    """
+
+
+# 长合同Prompt版本：分块/合并模板变化时自动变化，用于审阅结果缓存失效
+LONG_PROMPT_VERSION = hashlib.sha256(
+    (CHUNK_REVIEW_INSTRUCTIONS + build_chunk_review_prompt("", 0, 0) + build_merge_prompt([], [])).encode("utf-8")
+).hexdigest()[:12]
+
+
+def is_long_contract(contract_text):
+    """合同估算token数超过阈值时使用长合同模式"""
+    return estimate_tokens(contract_text) > LONG_CONTRACT_CONFIG["threshold_tokens"]
+
+
+async def review_long_contract_async(contract_text, on_delta=None):
+    """
+    长合同分块并行审阅：按条款拆分为token预算内的分块并发审阅，再合并为七个模块的完整意见。
+    on_delta只接收合并阶段的流式输出。返回值与parse_doubao_output相同，token消耗为所有调用之和
+    """
+    clauses = split_clauses(contract_text)
+    chunks = build_chunks(clauses, LONG_CONTRACT_CONFIG["chunk_tokens"])
+    print(f"长合同模式：共{len(clauses)}个条款，拆分为{len(chunks)}个分块并行审阅")
+
+    # 1. 各分块并发审阅（map），同一事件循环内最多chunk_workers个请求同时进行
+    semaphore = asyncio.Semaphore(LONG_CONTRACT_CONFIG["chunk_workers"])
+
+    async def review_chunk(index, chunk):
+        async with semaphore:
+            output = await stream_doubao_prompt(build_chunk_review_prompt(chunk, index, len(chunks)),
+                                                instructions=CHUNK_REVIEW_INSTRUCTIONS)
+        return parse_doubao_output(output)
+
+    # 任一分块失败时立即取消其余分块请求：任务重试时会重新审阅全部分块，继续执行只会浪费token
+    tasks = [asyncio.create_task(review_chunk(index, chunk)) for index, chunk in enumerate(chunks, start=1)]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        # 正常结束时无未完成的任务；失败或本任务被取消时取消其余分块，并等待其释放限流名额
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    for task in tasks:
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+    chunk_results = [task.result() for task in tasks]
+
+    # 2. 汇总为完整意见（reduce）
+    headings = [heading for heading, _ in clauses if heading]
+    merge_prompt = build_merge_prompt([result["text"] for result in chunk_results], headings)
+    merged = parse_doubao_output(await stream_doubao_prompt(merge_prompt, on_delta=on_delta))
+
+    merged["total_tokens"] += sum(result["total_tokens"] for result in chunk_results)
+    merged["cached_tokens"] += sum(result["cached_tokens"] for result in chunk_results)
+    merged["chunk_ids"] = [result["id"] for result in chunk_results]
+    return merged
+
+
+def review_long_contract(contract_text):
+    """review_long_contract_async的同步封装"""
+    return asyncio.run(review_long_contract_async(contract_text))
@@ -1,69 +1,56 @@
 import jira_client
 import schedule
 import time
+import metrics
 from datetime import datetime
-from trigger_checker import check_trigger_condition
-from attachment_processor import convert_response_to_json
-from doubao_client import call_doubao_api
-from config import DOUBAO_CONFIG
+from pipeline import ReviewPipeline, print_summary
+from state_ledger import ReviewLedger
+from similarity_index import SimilarityIndex
+from lease_store import start_lease_keeper
+from issue_poller import IssuePoller
+from review_cache import get_shared_cache
+from rate_limiter import limiter_stats
 
 
 def main():
-    # 1. 连接JIRA
-    jira = jira_client.connect_jira()
-
-    # 2. 获取目标ticket列报
-    issues = jira.get_target_issues()
-
-    for issue in issues:
-        issue_key = issue["id"]
-        issue_simpName = issue["key"]
-        print(f"\n处理ticket：{issue_simpName}")
-
-        # 3. 检查触发条件
-        comments = jira.get_issue_comments(issue_key)
-        if not check_trigger_condition(comments):
-            print(f"{issue_simpName}未触发审阅条件，跳过")
-            continue
-
-        # 4. 获取并读取最新附件
-        try:
-            attachment_key = issue["fields"]["attachment"][0]["id"]
-            jira_attachment = jira.get_issue_attachments(attachment_key)
-            attachment = convert_response_to_json(jira_attachment)
-            print(attachment)
-        except Exception as e:
-            print(f"{issue_key}附件处理失败：{str(e)}")
-            continue
-
-        # 5. 调取豆包获取合同审阅意见
-        try:
-            doubao_output = call_doubao_api(attachment)
-            print(doubao_output)
-
-            # 记录豆包API使用ID
-            doubao_id = doubao_output.id
-
-            # 获取使用信息
-            doubao_usage = doubao_output.usage
-            total_tokens = getattr(doubao_usage, "total_tokens")
-            print(f"本次调用ID为: {doubao_id}, 总消耗tokens: {total_tokens}")
-
-            # 获取豆包回复意见
-            doubao_resp = doubao_output.output
-            doubao_data = doubao_resp[1].content[0].text
-            print(doubao_data)
-
-            # 拼接输出内容
-            doubao_to_jira = (f"{doubao_data}\n\n"
-                              f"本次调用的AI模型为{DOUBAO_CONFIG['ai_model']}, AI回复ID为{doubao_id}, AI Token消耗为{total_tokens}。")
-
-            # 将回复放入jira
-            jira.add_comment_to_issue(issue_key=issue_key, comment_content=doubao_to_jira)
-
-        except Exception as e:
-            print(f"{issue_key}调用豆包API失败：{str(e)}")
-            continue
+    """运行一轮轮询审阅，返回本轮所有任务结果"""
+    # 1. 连接JIRA（进程内复用同一客户端及连接池，只在首次鉴权）
+    jira = jira_client.get_jira_client()
+
+    tick_start = time.time()
+    # 进程内共享的缓存，命中计数跨轮次累计（首次读写时才扫描缓存目录）
+    review_cache = get_shared_cache()
+    ledger = ReviewLedger()
+    similarity = SimilarityIndex()
+    # 多实例部署时通过租约保证同一ticket只由一个实例处理
+    leases = start_lease_keeper()
+    try:
+        # 2. 增量分页获取目标ticket（只查询上次水位之后更新的ticket）
+        poller = IssuePoller(jira, ledger)
+
+        # 3. 交由流水线并发处理：触发检查/附件下载 → 解析 → 豆包审阅 → 回写评论
+        #    已处理过的触发评论通过台账跳过，避免每轮重复审阅；相同附件/合同复用缓存结果，
+        #    同一模板的相似合同复用或基于已有审阅意见只审阅差异部分
+        pipeline = ReviewPipeline(jira, ledger=ledger, cache=review_cache, similarity=similarity,
+                                  leases=leases)
+        #    先恢复持久化队列中到期重试/上次中断的任务，从最后完成的阶段继续
+        pipeline.resume_due_jobs()
+        results = pipeline.run(poller.poll())
+
+        # 4. 本轮结束后推进轮询水位
+        poller.commit(results)
+    finally:
+        if leases is not None:
+            leases.close()
+        similarity.close()
+        ledger.close()
+    print_summary(results, time.time() - tick_start)
+    print(f"缓存统计：{review_cache.stats()}")
+    print(f"JIRA连接统计：{jira.get_connection_stats()}")
+    print(f"限流统计：{limiter_stats()}")
+    # 各阶段耗时p50/p95、下载字节数、解析页数及token消耗
+    metrics.registry.print_tick_summary()
+    return results
 
 
 def task_with_time_check():
@@ -82,11 +69,12 @@ def task_with_time_check():
         main()
 
 
-# 主程序测试
-if __name__ == "__main__":
+def run_daemon(task_interval=5):
+    """常驻运行：每天9:00-19:00内每task_interval分钟运行一轮"""
     # 配置任务执行间隔
-    task_interval = 5
     schedule.every(task_interval).minutes.do(task_with_time_check)
+    # 配置了METRICS_PORT时开启Prometheus文本格式指标接口
+    metrics.start_metrics_server()
 
     print("程序已启动，将在每天9:00-19:00内按固定间隔运行（按Ctrl+C停止）...")
 
@@ -95,4 +83,9 @@ if __name__ == "__main__":
             schedule.run_pending()
             time.sleep(30)
     except KeyboardInterrupt:
-        print("\n程序已被手动停止")
\ No newline at end of file
+        print("\n程序已被手动停止")
+
+
+# 主程序（等同于python cli.py daemon）
+if __name__ == "__main__":
+    run_daemon()
\ No newline at end of file
@@ -0,0 +1,282 @@
+import functools
+import inspect
+import json
+import math
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import METRICS_CONFIG
+
+# 导出的指标名前缀
+PREFIX = "contract_review_"
+
+
+def _percentile(values, q):
+    """最近秩法分位数（values已排序）"""
+    if not values:
+        return 0.0
+    index = max(0, math.ceil(q * len(values)) - 1)
+    return values[index]
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels_text(labels):
+    """标签转为Prometheus格式，如{stage="parse",outcome="ok"}"""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class MetricsRegistry:
+    """
+    进程内指标登记：
+    - 计数器（inc）：下载字节数、解析页数、token消耗等累计值
+    - 耗时/数值分布（observe/timer）：累计次数与总和，并保留最近window个样本计算p50/p95
+    每个统计周期（一轮轮询）另行记录样本，供周期结束时打印汇总
+    """
+
+    def __init__(self, window=None, jsonl_path=None):
+        self.window = window or METRICS_CONFIG["window"]
+        self.enabled = METRICS_CONFIG["enabled"]
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._summaries = {}
+        self._tick_counters = {}
+        self._tick_samples = {}
+        self.jsonl_path = jsonl_path if jsonl_path is not None else METRICS_CONFIG["jsonl_path"]
+        self._jsonl = None
+
+    def _write(self, kind, name, value, labels):
+        """逐条写入JSONL（调用方已持有锁；首次写入时才打开文件，解析子进程导入本模块时不会打开）"""
+        if not self.jsonl_path:
+            return
+        if self._jsonl is None:
+            self._jsonl = open(self.jsonl_path, "a", encoding="utf-8")
+        record = {"ts": datetime.now().isoformat(timespec="milliseconds"), "type": kind, "name": name,
+                  "value": value, "labels": dict(labels)}
+        self._jsonl.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._jsonl.flush()
+
+    def inc(self, name, value=1, **labels):
+        """计数器累加"""
+        if not self.enabled or value is None:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._tick_counters[key] = self._tick_counters.get(key, 0) + value
+            self._write("counter", name, value, key[1])
+
+    def observe(self, name, value, **labels):
+        """记录一次耗时（秒）或数值"""
+        if not self.enabled or value is None:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = {"count": 0, "sum": 0.0, "samples": deque(maxlen=self.window)}
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["samples"].append(value)
+            self._tick_samples.setdefault(key, []).append(value)
+            self._write("summary", name, value, key[1])
+
+    def timer(self, name, **labels):
+        """计时上下文（同步/协程代码均可使用），异常时outcome标签为error"""
+        return _Timer(self, name, labels)
+
+    def render_prometheus(self):
+        """Prometheus文本格式：计数器为counter，耗时为summary（分位数按最近window个样本计算）"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            summaries = sorted((key, summary["count"], summary["sum"], sorted(summary["samples"]))
+                               for key, summary in self._summaries.items())
+        lines = []
+        declared = set()
+        for (name, labels), value in counters:
+            metric = f"{PREFIX}{name}"
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} counter")
+                declared.add(metric)
+            lines.append(f"{metric}{_labels_text(labels)} {value}")
+        for (name, labels), count, total, samples in summaries:
+            metric = f"{PREFIX}{name}"
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} summary")
+                declared.add(metric)
+            for q in (0.5, 0.95):
+                lines.append(f"{metric}{_labels_text(labels + (('quantile', q),))} {_percentile(samples, q):.6f}")
+            lines.append(f"{metric}_sum{_labels_text(labels)} {total:.6f}")
+            lines.append(f"{metric}_count{_labels_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def tick_summary(self, reset=True):
+        """本周期的汇总：{指标: {"count", "p50", "p95", "max"}}及计数器增量，reset为True时开始新周期"""
+        with self._lock:
+            samples = self._tick_samples
+            counters = self._tick_counters
+            if reset:
+                self._tick_samples = {}
+                self._tick_counters = {}
+        return self._summarize(samples, counters)
+
+    def snapshot(self):
+        """进程启动以来的汇总（格式同tick_summary，分位数按最近window个样本计算），用于基准测试报告"""
+        with self._lock:
+            samples = {key: list(summary["samples"]) for key, summary in self._summaries.items()}
+            counters = dict(self._counters)
+        return self._summarize(samples, counters)
+
+    @staticmethod
+    def _summarize(samples, counters):
+        summary = {}
+        for (name, labels), values in sorted(samples.items()):
+            values = sorted(values)
+            summary[f"{name}{_labels_text(labels)}"] = {
+                "count": len(values),
+                "p50": round(_percentile(values, 0.5), 3),
+                "p95": round(_percentile(values, 0.95), 3),
+                "max": round(values[-1], 3)
+            }
+        totals = {f"{name}{_labels_text(labels)}": value for (name, labels), value in sorted(counters.items())}
+        return summary, totals
+
+    def print_tick_summary(self):
+        """打印本周期各阶段耗时的p50/p95及计数器增量"""
+        summary, totals = self.tick_summary()
+        if not summary and not totals:
+            return
+        print("本轮指标汇总（耗时单位：秒）：")
+        for name, stats in summary.items():
+            print(f"  {name}：{stats['count']}次，p50 {stats['p50']}，p95 {stats['p95']}，最大 {stats['max']}")
+        for name, value in totals.items():
+            print(f"  {name}：{value}")
+
+    def close(self):
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.close()
+                self._jsonl = None
+
+
+class _Timer:
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self._started
+        outcome = "error" if exc_type is not None else "ok"
+        self.registry.observe(self.name, self.elapsed, outcome=outcome, **self.labels)
+        return False
+
+
+# 进程内共享的指标登记
+registry = MetricsRegistry()
+inc = registry.inc
+observe = registry.observe
+timer = registry.timer
+
+
+def summarize_jsonl(path):
+    """
+    汇总JSONL指标文件（格式同tick_summary，分位数按文件中全部样本计算），
+    多个实例写入同一文件时可得到整体的耗时分布
+    """
+    samples = {}
+    counters = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            key = (record["name"], tuple(sorted(record["labels"].items())))
+            if record["type"] == "counter":
+                counters[key] = counters.get(key, 0) + record["value"]
+            else:
+                samples.setdefault(key, []).append(record["value"])
+    return MetricsRegistry._summarize(samples, counters)
+
+
+def timed(name, **labels):
+    """
+    函数计时装饰器，method标签为函数名；支持普通函数、协程函数及生成器函数
+    （生成器只统计生成器内部的执行时间，不含调用方处理每个元素的时间）
+    """
+    def decorator(func):
+        method_labels = dict(labels, method=func.__name__)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with registry.timer(name, **method_labels):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                generator = func(*args, **kwargs)
+                elapsed = 0.0
+                outcome = "ok"
+                try:
+                    while True:
+                        started = time.perf_counter()
+                        try:
+                            item = next(generator)
+                        except StopIteration:
+                            return
+                        except Exception:
+                            outcome = "error"
+                            raise
+                        finally:
+                            elapsed += time.perf_counter() - started
+                        yield item
+                finally:
+                    generator.close()
+                    registry.observe(name, elapsed, outcome=outcome, **method_labels)
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with registry.timer(name, **method_labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != METRICS_CONFIG["path"]:
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=None):
+    """在后台线程开启Prometheus文本格式接口，端口为0（默认）时不开启，返回HTTP服务或None"""
+    port = METRICS_CONFIG["port"] if port is None else port
+    if not port or not METRICS_CONFIG["enabled"]:
+        return None
+    server = ThreadingHTTPServer((METRICS_CONFIG["host"], port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"✅ 指标接口已启动：http://{METRICS_CONFIG['host']}:{server.server_address[1]}{METRICS_CONFIG['path']}")
+    return server
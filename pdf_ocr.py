@@ -0,0 +1,143 @@
+import hashlib
+import importlib.util
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import metrics
+from config import OCR_CONFIG
+
+# 进程内共享的OCR进程池（按需创建）
+_ocr_pool = None
+_lock = threading.Lock()
+_available = None
+
+# OCR子进程内复用的RapidOCR实例（加载模型较慢）
+_rapidocr = None
+
+
+def is_image_only_page(page, text):
+    """
+    判断页面是否为仅有图片的扫描页（无需渲染）：
+    可提取文字少于min_chars，且图片覆盖页面面积的比例达到min_image_coverage
+    """
+    if len(text.strip()) >= OCR_CONFIG["min_chars"] or not page.images:
+        return False
+    width, height = float(page.width), float(page.height)
+    covered = 0.0
+    for image in page.images:
+        x0, x1 = max(float(image["x0"]), 0.0), min(float(image["x1"]), width)
+        top, bottom = max(float(image["top"]), 0.0), min(float(image["bottom"]), height)
+        covered += max(0.0, x1 - x0) * max(0.0, bottom - top)
+    return covered / max(width * height, 1.0) >= OCR_CONFIG["min_image_coverage"]
+
+
+def page_image_hash(page):
+    """扫描页的内容hash：页面中各图片的原始数据及位置（同一扫描件重新上传时不变）"""
+    digest = hashlib.sha256()
+    for image in page.images:
+        stream = image.get("stream")
+        try:
+            data = stream.get_rawdata() if stream is not None else None
+        except Exception:
+            data = None
+        if data:
+            digest.update(data)
+        digest.update(f"{image['x0']:.1f},{image['top']:.1f},{image['x1']:.1f},{image['bottom']:.1f};".encode())
+    return digest.hexdigest()
+
+
+def ocr_cache_key(page_hash):
+    """OCR结果的缓存键：页面hash + 引擎 + 语言 + 分辨率，任一变化都会重新识别"""
+    return hashlib.sha256(
+        f"{OCR_CONFIG['engine']}\n{OCR_CONFIG['lang']}\n{OCR_CONFIG['dpi']}\n{page_hash}".encode("utf-8")
+    ).hexdigest()
+
+
+def ocr_available():
+    """OCR是否可用（已开启且安装了所配置的引擎），不可用时只提示一次"""
+    global _available
+    with _lock:
+        if _available is None:
+            engine = OCR_CONFIG["engine"]
+            if not OCR_CONFIG["enabled"]:
+                _available = False
+            elif engine == "tesseract":
+                _available = importlib.util.find_spec("pytesseract") is not None and shutil.which("tesseract") is not None
+            elif engine == "rapidocr":
+                _available = importlib.util.find_spec("rapidocr_onnxruntime") is not None
+            else:
+                print(f"⚠️ 未知的OCR引擎：{engine}（支持tesseract/rapidocr），扫描页将无法识别文字")
+                _available = False
+            if OCR_CONFIG["enabled"] and not _available and engine in ("tesseract", "rapidocr"):
+                print(f"⚠️ 未安装OCR引擎{engine}，扫描页将无法识别文字")
+        return _available
+
+
+def get_ocr_pool():
+    """获取共享的OCR进程池，进程数由OCR_CONFIG["processes"]限定"""
+    global _ocr_pool
+    with _lock:
+        if _ocr_pool is None:
+            _ocr_pool = ProcessPoolExecutor(max_workers=max(1, OCR_CONFIG["processes"]))
+        return _ocr_pool
+
+
+def _recognize(image):
+    """调用所配置的OCR引擎识别页面图片（PIL.Image），返回文字"""
+    global _rapidocr
+    if OCR_CONFIG["engine"] == "rapidocr":
+        import numpy
+        from rapidocr_onnxruntime import RapidOCR
+
+        if _rapidocr is None:
+            _rapidocr = RapidOCR()
+        result, _ = _rapidocr(numpy.asarray(image.convert("RGB")))
+        return "\n".join(line[1] for line in result or [])
+    import pytesseract
+    return pytesseract.image_to_string(image, lang=OCR_CONFIG["lang"])
+
+
+def ocr_pdf_page(path, page_index):
+    """渲染PDF的一页并识别文字（在OCR进程池中执行）"""
+    import pdfplumber
+
+    with pdfplumber.open(path) as pdf:
+        page = pdf.pages[page_index]
+        image = page.to_image(resolution=OCR_CONFIG["dpi"]).original
+        page.flush_cache()
+    return _recognize(image)
+
+
+def ocr_pages(path, scanned):
+    """
+    识别PDF中的扫描页：scanned为{页序号(从0开始): 页面hash}，返回{页序号: 文字}；
+    已识别过的页面（按页面hash）直接使用缓存，其余页面在OCR进程池中并行识别，单页失败不影响其他页面
+    """
+    if not scanned or not ocr_available():
+        return {}
+    # 与流水线共用进程内的同一个缓存实例（同一目录的占用统计及淘汰只有一份）
+    from review_cache import get_shared_cache
+
+    cache = get_shared_cache()
+    texts = {}
+    futures = {}
+    for index, page_hash in scanned.items():
+        key = ocr_cache_key(page_hash)
+        cached = cache.get("ocr", key)
+        if cached is not None:
+            texts[index] = cached["text"]
+        else:
+            futures[index] = (key, get_ocr_pool().submit(ocr_pdf_page, path, index))
+    if texts:
+        metrics.inc("pdf_ocr_cache_hits_total", len(texts))
+
+    for index, (key, future) in futures.items():
+        try:
+            text = future.result()
+        except Exception as e:
+            print(f"⚠️ 第{index + 1}页OCR识别失败：{str(e)}")
+            continue
+        texts[index] = text
+        cache.put("ocr", key, {"text": text})
+    metrics.inc("pdf_ocr_pages_total", len(futures))
+    return texts
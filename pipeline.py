@@ -0,0 +1,769 @@
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+import metrics
+from trigger_checker import find_trigger_comment
+from attachment_processor import convert_file_to_json, extractor_version
+from attachment_selector import select_attachments, attachment_content_type, attachment_fingerprint
+from doubao_client import call_doubao_api_async, stream_doubao_prompt, parse_doubao_output, PROMPT_VERSION
+from review_cache import review_cache_key, extract_cache_key
+from contract_compactor import compact_with_stats
+from long_contract_review import is_long_contract, review_long_contract_async, LONG_PROMPT_VERSION
+from revision_review import plan_incremental_review, REVISION_PROMPT_VERSION
+from similarity_index import plan_reference_review
+from config import (ATTACHMENT_CONFIG, DOUBAO_CONFIG, PIPELINE_CONFIG, POLLING_CONFIG, REVISION_CONFIG,
+                    SIMILARITY_CONFIG, SUPPORTED_FILE_TYPES)
+
+# 队列结束标记
+_STOP = object()
+
+# 渐进式回写：触发后立即回写的占位评论，以及审阅进行中追加的提示
+PLACEHOLDER_COMMENT = "🤖 已收到合同审阅请求，AI正在审阅附件，审阅意见将在本评论中陆续更新，请稍候……"
+RETRY_COMMENT = "⚠️ 合同审阅暂时失败，将于{next_attempt_at}自动重试，审阅意见仍将在本评论中更新。"
+DEAD_LETTER_COMMENT = "❌ 合同审阅多次重试仍失败，已转交运维人员处理。"
+
+# 检查点阶段 → 恢复时进入的流水线阶段序号（0 JIRA读取 / 1 附件下载 / 2 附件解析 / 3 豆包审阅 / 4 回写）
+_RESUME_STAGE_INDEX = {"triggered": 1, "downloaded": 2, "extracted": 3, "reviewed": 4}
+IN_PROGRESS_NOTE = "（AI审阅进行中，以上内容将持续更新……）"
+
+
+def _is_extraction_error(contract):
+    """解析失败时附件处理器返回{"error": ...}，此类结果不写入缓存"""
+    try:
+        return "error" in json.loads(contract)
+    except ValueError:
+        return True
+
+
+class ReviewJob:
+    """单个ticket（触发检查后为ticket中的单个附件）在流水线中的处理状态"""
+
+    def __init__(self, issue):
+        self.issue = issue
+        self.issue_key = issue["id"]
+        self.issue_name = issue["key"]
+        self.comment_id = None      # 触发评论ID
+        self.attachment_id = None   # 附件ID
+        self.attachment_meta = None  # 搜索结果中的附件元数据（filename/mimeType/size/created）
+        self.attachment_total = 1   # 本次触发审阅的附件数
+        self.forced = False         # 是否为运维强制重审
+        self.attachment = None      # 已下载到磁盘的附件信息（见download_attachment）
+        self.content_hash = None    # 附件内容hash（内容寻址缓存键）
+        self.contract = None        # 解析后的合同JSON字符串
+        self.contract_text = None   # 发送给模型的紧凑合同文本
+        self.token_estimate = None  # (压缩前, 压缩后) token估算
+        self.review = None          # 豆包审阅结果（见parse_doubao_output）
+        self.review_cached = False  # 审阅结果是否来自缓存
+        self.progress_comment_id = None  # 渐进式回写的占位评论ID
+        self.resumed_from = None    # 从持久化任务队列恢复时的检查点阶段
+        self.status = "pending"     # pending / skipped / failed / posted / leased（其他实例处理中）
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+
+    @classmethod
+    def from_checkpoint(cls, record):
+        """根据持久化任务队列中的记录（见ReviewLedger.due_jobs）恢复任务"""
+        job = cls(record["issue"])
+        job.comment_id = record["comment_id"]
+        job.attachment_id = record["attachment_id"]
+        job.resumed_from = record["stage"]
+        checkpoint = record["checkpoint"]
+        job.attachment_meta = checkpoint.get("attachment_meta")
+        job.attachment_total = checkpoint.get("attachment_total", 1)
+        job.forced = checkpoint.get("forced", False)
+        job.progress_comment_id = checkpoint.get("progress_comment_id")
+        job.attachment = checkpoint.get("attachment")
+        job.content_hash = checkpoint.get("content_hash")
+        job.contract = checkpoint.get("contract")
+        job.contract_text = checkpoint.get("contract_text")
+        job.token_estimate = tuple(checkpoint["token_estimate"]) if checkpoint.get("token_estimate") else None
+        job.review = checkpoint.get("review")
+        job.review_cached = checkpoint.get("review_cached", False)
+        return job
+
+    def for_attachment(self, attachment, total):
+        """触发检查通过后按附件拆分：每个附件一个任务，分别下载、解析、审阅及回写"""
+        job = ReviewJob(self.issue)
+        job.comment_id = self.comment_id
+        job.forced = self.forced
+        job.attachment_id = attachment["id"]
+        job.attachment_meta = attachment
+        job.attachment_total = total
+        job.started_at = self.started_at
+        return job
+
+    @property
+    def label(self):
+        """日志及评论中使用的名称：多附件时带上文件名"""
+        if self.attachment_total > 1 and self.attachment_meta:
+            return f"{self.issue_name}/{self.attachment_meta.get('filename')}"
+        return self.issue_name
+
+    @property
+    def comment_prefix(self):
+        """多附件时在评论开头注明对应的附件"""
+        if self.attachment_total > 1 and self.attachment_meta:
+            return f"【附件：{self.attachment_meta.get('filename')}】\n"
+        return ""
+
+    def finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+
+
+class _ProgressComment:
+    """
+    将流式输出节流更新到占位评论：两次更新至少间隔interval秒，
+    同一时间只有一个更新请求在进行（JIRA客户端为同步接口，在线程池中执行）
+    """
+
+    def __init__(self, jira, job, interval):
+        self.jira = jira
+        self.job = job
+        self.interval = interval
+        self.text = ""
+        self._last_update = time.time()
+        self._pending = None
+
+    async def on_delta(self, delta):
+        self.text += delta
+        if self._pending is not None and not self._pending.done():
+            return
+        if time.time() - self._last_update < self.interval:
+            return
+        self._last_update = time.time()
+        content = f"{self.job.comment_prefix}{self.text}\n\n{IN_PROGRESS_NOTE}"
+        self._pending = asyncio.get_running_loop().run_in_executor(None, self._update, content)
+
+    def _update(self, content):
+        try:
+            self.jira.update_comment(self.job.issue_key, self.job.progress_comment_id, content)
+        except Exception as e:
+            # 进度更新失败不影响审阅，最终结果由回写阶段写入
+            print(f"{self.job.label}更新审阅进度失败：{str(e)}")
+
+    async def drain(self):
+        """等待进行中的更新完成，避免覆盖回写阶段写入的最终结果"""
+        if self._pending is not None:
+            await self._pending
+
+
+class _Stage:
+    """流水线中的一个阶段：固定数量的worker从输入队列取任务，处理后放入下一阶段队列"""
+
+    def __init__(self, name, handler, workers, in_queue, out_queue, next_stage=None):
+        self.name = name
+        self.key = handler.__name__.strip("_").replace("_stage", "")  # 指标标签，如fetch/parse/llm
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.consumers = self.workers  # 从输入队列取任务的线程数（即需要的结束标记数）
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.next_stage = next_stage
+        self._alive = self.workers
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self, on_done):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._loop, args=(on_done,), name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _loop(self, on_done):
+        while True:
+            job = self.in_queue.get()
+            if job is _STOP:
+                break
+            try:
+                with metrics.timer("pipeline_stage_seconds", stage=self.key):
+                    passed = self.handler(job)
+            except Exception as e:
+                print(f"{job.label}在{self.name}阶段处理失败：{str(e)}")
+                job.finish("failed", f"{self.name}: {str(e)}")
+                passed = False
+
+            if isinstance(passed, list):
+                # 一个任务拆分为多个（ticket → 各附件），原任务不再单独计入结果
+                for child in passed:
+                    self.out_queue.put(child)
+                if not passed:
+                    on_done(job)
+            elif passed and self.out_queue is not None:
+                self.out_queue.put(job)
+            else:
+                on_done(job)
+
+        # 本阶段最后一个worker退出时，通知下一阶段的全部worker结束
+        with self._lock:
+            self._alive -= 1
+            last = self._alive == 0
+        if last and self.next_stage is not None:
+            for _ in range(self.next_stage.consumers):
+                self.next_stage.in_queue.put(_STOP)
+
+    def join(self):
+        for t in self._threads:
+            t.join()
+
+
+class _AsyncStage(_Stage):
+    """
+    异步阶段：单个线程运行事件循环，handler为协程函数，
+    最多workers个任务同时进行（用于豆包调用等I/O等待为主的阶段，无需每个请求占用一个线程）
+    """
+
+    def __init__(self, name, handler, workers, in_queue, out_queue, next_stage=None):
+        super().__init__(name, handler, workers, in_queue, out_queue, next_stage)
+        self.consumers = 1
+        self._alive = 1
+
+    def start(self, on_done):
+        t = threading.Thread(target=lambda: asyncio.run(self._main(on_done)), name=self.name, daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    async def _main(self, on_done):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.workers)
+        tasks = set()
+        while True:
+            job = await loop.run_in_executor(None, self.in_queue.get)
+            if job is _STOP:
+                break
+            await semaphore.acquire()
+            task = asyncio.create_task(self._handle(job, on_done, semaphore))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+        if self.next_stage is not None:
+            for _ in range(self.next_stage.consumers):
+                await loop.run_in_executor(None, self.next_stage.in_queue.put, _STOP)
+
+    async def _handle(self, job, on_done, semaphore):
+        try:
+            with metrics.timer("pipeline_stage_seconds", stage=self.key):
+                passed = await self.handler(job)
+        except Exception as e:
+            print(f"{job.label}在{self.name}阶段处理失败：{str(e)}")
+            job.finish("failed", f"{self.name}: {str(e)}")
+            passed = False
+        finally:
+            semaphore.release()
+
+        # 队列写入及完成回调（台账/JIRA请求）可能阻塞，不在事件循环线程中执行
+        if passed and self.out_queue is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.out_queue.put, job)
+        else:
+            await asyncio.get_running_loop().run_in_executor(None, on_done, job)
+
+
+class ReviewPipeline:
+    """
+    合同审阅流水线：JIRA读取（触发检查/附件选择） → 附件下载 → 附件解析 → 豆包审阅 → 评论回写，
+    各阶段使用独立且有上限的worker池，阶段之间通过有界队列衔接；ticket中的多个附件拆分为独立任务并行处理
+    """
+
+    # 进程内所有流水线共享：同一ticket同时只在一个流水线中处理（webhook与轮询兜底可能同时提交）
+    # ticket ID → 处理中的任务数（按附件拆分后每个附件一个任务）
+    _in_flight = {}
+    _in_flight_lock = threading.Lock()
+
+    def __init__(self, jira, ledger=None, cache=None, config=None, similarity=None, leases=None):
+        self.jira = jira
+        self.ledger = ledger
+        self.cache = cache
+        self.similarity = similarity  # 相似合同索引（见SimilarityIndex），为None时不查找相似合同
+        self.leases = leases  # 多实例租约（见LeaseKeeper），为None时不与其他实例协调
+        self.config = dict(PIPELINE_CONFIG, **(config or {}))
+        self.results = []
+        self._results_lock = threading.Lock()
+        self._stages = []
+        self._started = False
+
+    def start(self):
+        """启动全部阶段的worker"""
+        size = self.config["queue_size"]
+        jira_q, download_q, parse_q, llm_q, writeback_q = (queue.Queue(maxsize=size) for _ in range(5))
+
+        writeback = _Stage("回写", self._writeback_stage, self.config["writeback_workers"], writeback_q, None)
+        llm = _AsyncStage("豆包审阅", self._llm_stage, self.config["llm_workers"], llm_q, writeback_q, writeback)
+        parse = _Stage("附件解析", self._parse_stage, self.config["parse_workers"], parse_q, llm_q, llm)
+        download = _Stage("附件下载", self._download_stage, self.config["jira_workers"], download_q, parse_q, parse)
+        fetch = _Stage("JIRA读取", self._fetch_stage, self.config["jira_workers"], jira_q, download_q, download)
+        self._stages = [fetch, download, parse, llm, writeback]
+
+        for stage in self._stages:
+            stage.start(self._on_done)
+        self._started = True
+
+    def submit(self, issue):
+        """
+        提交一个ticket进入流水线（队列满时阻塞，形成背压），
+        该ticket已在处理中时不重复提交，返回False
+        """
+        if not self._started:
+            self.start()
+        with self._in_flight_lock:
+            if issue["id"] in self._in_flight:
+                print(f"{issue['key']}正在处理中，跳过重复提交")
+                return False
+            self._in_flight[issue["id"]] = 1
+        if not self._claim(issue["id"]):
+            print(f"{issue['key']}正由其他实例处理，跳过")
+            job = ReviewJob(issue)
+            job.finish("leased")
+            with self._results_lock:
+                self.results.append(job)
+            return False
+        self._stages[0].in_queue.put(ReviewJob(issue))
+        return True
+
+    def _claim(self, issue_id):
+        """获取ticket的租约，失败时撤销进程内的处理中标记"""
+        if self.leases is None or self.leases.claim(issue_id):
+            return True
+        metrics.inc("lease_conflicts_total")
+        with self._in_flight_lock:
+            self._in_flight.pop(issue_id, None)
+        return False
+
+    def close(self):
+        """不再接收新ticket，已提交的任务处理完后各阶段依次退出"""
+        first = self._stages[0]
+        for _ in range(first.consumers):
+            first.in_queue.put(_STOP)
+
+    def join(self):
+        """等待全部阶段结束，返回所有任务结果"""
+        for stage in self._stages:
+            stage.join()
+        return self.results
+
+    def drain_results(self):
+        """取出并清空已完成的任务结果（长期运行的流水线定期调用，避免结果无限累积）"""
+        with self._results_lock:
+            results, self.results = self.results, []
+        return results
+
+    def resume_due_jobs(self):
+        """
+        从持久化任务队列恢复待重试及上次中断的任务：
+        按检查点直接进入下一阶段（已下载的从解析开始，已解析的从审阅开始，已审阅的只需回写），返回恢复的任务数
+        """
+        if self.ledger is None:
+            return 0
+        if not self._started:
+            self.start()
+        resumed = 0
+        resumed_issues = set()
+        for record in self.ledger.due_jobs():
+            index = _RESUME_STAGE_INDEX.get(record["stage"])
+            if index is None:
+                continue
+            issue_id = record["issue_id"]
+            with self._in_flight_lock:
+                # 同一ticket的多个附件任务可一起恢复，其他流水线正在处理的ticket跳过
+                if issue_id in self._in_flight and issue_id not in resumed_issues:
+                    continue
+                self._in_flight[issue_id] = self._in_flight.get(issue_id, 0) + 1
+                first = issue_id not in resumed_issues
+                resumed_issues.add(issue_id)
+            # 多实例共用台账时，其他实例正在处理（租约未过期）的任务不接管
+            if first and not self._claim(issue_id):
+                resumed_issues.discard(issue_id)
+                continue
+            job = ReviewJob.from_checkpoint(record)
+            print(f"{job.label}从检查点[{record['stage']}]恢复处理（第{record['attempts'] + 1}次尝试）")
+            self._stages[index].in_queue.put(job)
+            resumed += 1
+        return resumed
+
+    def run(self, issues):
+        """处理一批ticket，返回所有任务结果"""
+        if not self._started:
+            self.start()
+        try:
+            # issues可以是生成器（如分页查询），边获取边处理
+            for issue in issues:
+                self.submit(issue)
+        finally:
+            self.close()
+            self.join()
+        return self.results
+
+    def _on_done(self, job):
+        if job.status == "pending":
+            job.finish("skipped")
+        # 单个任务端到端耗时（从提交/恢复到完成）
+        metrics.observe("ticket_seconds", job.finished_at - job.started_at, status=job.status)
+        if job.status == "failed":
+            self._record(job, "failed", status="failed", error=job.error)
+            self._schedule_retry(job)
+        elif self.ledger is not None and job.status != "leased":
+            # 处理成功或未触发的ticket记下当前updated，未变化前不再查询评论；失败的ticket下一轮重试
+            self.ledger.mark_seen(job.issue_key, job.issue.get("fields", {}).get("updated"))
+        with self._in_flight_lock:
+            remaining = self._in_flight.get(job.issue_key, 1) - 1
+            if remaining > 0:
+                self._in_flight[job.issue_key] = remaining
+            else:
+                self._in_flight.pop(job.issue_key, None)
+        if remaining <= 0 and self.leases is not None:
+            self.leases.release(job.issue_key)
+        with self._results_lock:
+            self.results.append(job)
+
+    def _record(self, job, stage, status="done", error=None):
+        """写入处理台账（未触发或尚未确定台账键的任务不记录）"""
+        if self.ledger is None or job.comment_id is None:
+            return
+        self.ledger.record_stage(job.issue_key, job.comment_id, job.attachment_id, stage,
+                                 status=status, error=error, issue_name=job.issue_name)
+
+    def _checkpoint(self, job, stage, **data):
+        """记录阶段完成并持久化该阶段产出，失败重试时从这里继续"""
+        self._record(job, stage)
+        if self.ledger is None:
+            return
+        self.ledger.save_checkpoint(job.issue, job.comment_id, job.attachment_id, stage, data)
+
+    def _schedule_retry(self, job):
+        """
+        失败任务：已有检查点的按指数退避安排重试（超过次数进入死信），占位评论改为失败提示；
+        尚无检查点（下载完成前失败）的删除占位评论，由下一轮轮询重新触发
+        """
+        status, next_attempt_at = (None, None)
+        if self.ledger is not None and job.comment_id is not None:
+            status, next_attempt_at = self.ledger.fail_job(job.issue_key, job.comment_id, job.attachment_id,
+                                                           job.error)
+        if status is None:
+            self._remove_placeholder(job)
+        elif status == "retry":
+            print(f"{job.label}将于{next_attempt_at}从最后完成的阶段重试")
+            self._note_placeholder(job, RETRY_COMMENT.format(next_attempt_at=next_attempt_at))
+        else:
+            print(f"❌ {job.label}多次重试仍失败，已进入死信队列（python state_ledger.py --dead 查看）")
+            self._note_placeholder(job, DEAD_LETTER_COMMENT)
+            self._discard_attachment(job)
+
+    def _note_placeholder(self, job, text):
+        """将占位评论更新为提示信息（失败仅打印）"""
+        if job.progress_comment_id is None:
+            return
+        try:
+            self.jira.update_comment(job.issue_key, job.progress_comment_id, job.comment_prefix + text)
+        except Exception as e:
+            print(f"{job.label}更新占位评论失败：{str(e)}")
+
+    def _remove_placeholder(self, job):
+        """
+        处理失败时删除占位评论：触发评论重新成为最新评论，下一轮可重试
+        （删除失败仅打印，不影响本轮其他ticket）
+        """
+        if job.progress_comment_id is None:
+            return
+        try:
+            self.jira.delete_comment(job.issue_key, job.progress_comment_id)
+            job.progress_comment_id = None
+        except Exception as e:
+            print(f"{job.label}删除占位评论失败：{str(e)}")
+
+    # ---------- 各阶段处理逻辑 ----------
+
+    def _fetch_stage(self, job):
+        print(f"\n处理ticket：{job.issue_name}")
+        # 按搜索结果中的附件元数据选择需要审阅的附件（支持的类型，同名文件取最新版本），无需下载
+        attachments = select_attachments(job.issue["fields"].get("attachment"))
+        if not attachments:
+            print(f"{job.issue_name}没有支持审阅的附件（{'/'.join(SUPPORTED_FILE_TYPES)}），跳过")
+            return False
+
+        # 运维强制重审：忽略触发评论及已处理记录
+        forced_at = self.ledger.is_forced(job.issue_key, job.issue_name) if self.ledger else None
+        if forced_at:
+            print(f"{job.issue_name}已被标记强制重审（{forced_at}）")
+            job.forced = True
+            job.comment_id = f"forced-{forced_at}"
+        else:
+            # ticket自上次检查后无任何更新（评论未变化），无需再查询评论
+            if self.ledger and self.ledger.is_unchanged(job.issue_key, job.issue.get("fields", {}).get("updated")):
+                print(f"{job.issue_name}自上次检查后无更新，跳过")
+                return False
+
+            # 检查触发条件：只需最新一条评论，无需拉取完整评论历史
+            comments = self.jira.get_latest_comments(job.issue_key, max_results=POLLING_CONFIG["latest_comments"])
+            trigger_comment = find_trigger_comment(comments)
+            if trigger_comment is None:
+                print(f"{job.issue_name}未触发审阅条件，跳过")
+                return False
+            job.comment_id = trigger_comment["id"]
+            attachments = self._pending_attachments(job, attachments)
+            if not attachments:
+                return False
+
+        # 每个附件拆分为独立任务，由下载/解析/审阅阶段并行处理
+        children = [job.for_attachment(attachment, len(attachments)) for attachment in attachments]
+        with self._in_flight_lock:
+            self._in_flight[job.issue_key] = self._in_flight.get(job.issue_key, 1) + len(children) - 1
+        if len(children) > 1:
+            print(f"{job.issue_name}共{len(children)}个附件需要审阅："
+                  f"{'、'.join(attachment['filename'] for attachment in attachments)}")
+        return children
+
+    def _pending_attachments(self, job, attachments):
+        """
+        过滤本次触发需要审阅的附件：
+        跳过该触发评论已审阅过或正在等待重试/已进入死信的附件，以及上次审阅后未变化（ID/大小/上传时间相同）的附件；
+        全部附件均未变化时（如重复@）仍审阅最新的一个，审阅结果通常直接命中缓存
+        """
+        if self.ledger is None:
+            return attachments
+        pending = []
+        for attachment in attachments:
+            if self.ledger.is_processed(job.issue_key, job.comment_id, attachment["id"]):
+                continue
+            # 失败任务由持久化任务队列按检查点重试，轮询不重新开始
+            status, next_attempt_at = self.ledger.job_status(job.issue_key, job.comment_id, attachment["id"])
+            if status == "retry":
+                print(f"{job.issue_name}/{attachment['filename']}等待重试（{next_attempt_at}），跳过")
+                continue
+            if status == "dead":
+                print(f"{job.issue_name}/{attachment['filename']}已进入死信队列，需运维处理，跳过")
+                continue
+            pending.append(attachment)
+        if not pending:
+            print(f"{job.issue_name}的触发评论{job.comment_id}已处理过，跳过")
+            return []
+
+        changed = [attachment for attachment in pending if not self.ledger.is_attachment_unchanged(
+            job.issue_key, attachment["id"], attachment_fingerprint(attachment))]
+        if len(changed) < len(pending):
+            print(f"{job.issue_name}有{len(pending) - len(changed)}个附件自上次审阅后未变化，跳过")
+        return changed or pending[-1:]
+
+    def _download_stage(self, job):
+        # 渐进式回写：先回写占位评论，请求人无需等待审阅全部完成即可看到进度
+        if self.config["progressive_writeback"] and job.progress_comment_id is None:
+            job.progress_comment_id = self.jira.add_comment_to_issue(
+                issue_key=job.issue_key, comment_content=job.comment_prefix + PLACEHOLDER_COMMENT)["id"]
+        self._checkpoint(job, "triggered", attachment_meta=job.attachment_meta,
+                         attachment_total=job.attachment_total, forced=job.forced,
+                         progress_comment_id=job.progress_comment_id)
+
+        # 流式下载附件到磁盘，下载过程中同时计算内容hash
+        job.attachment = self.jira.download_attachment(job.attachment_id)
+        job.content_hash = job.attachment["sha256"]
+        # JIRA下载接口可能返回application/octet-stream，以附件元数据判断的类型为准
+        job.attachment["content_type"] = (attachment_content_type(job.attachment_meta or {})
+                                          or job.attachment["content_type"])
+        self._checkpoint(job, "downloaded", attachment=job.attachment, content_hash=job.content_hash)
+        return True
+
+    def _parse_stage(self, job):
+        # 相同附件内容（且解析器版本及OCR可用性相同）直接复用解析结果
+        extract_key = extract_cache_key(job.content_hash, extractor_version()) if self.cache else None
+        cached = self.cache.get("extract", extract_key) if self.cache else None
+        if cached is not None:
+            print(f"{job.label}附件解析命中缓存")
+            job.contract = cached["contract"]
+        else:
+            if job.resumed_from and not os.path.exists(job.attachment["path"]):
+                # 从检查点恢复但附件文件已被清理，重新下载
+                job.attachment = self.jira.download_attachment(job.attachment_id)
+            # 解析在共享进程池中执行（PDF/DOCX均不占用主进程，大PDF按页拆分并行），进程直接从磁盘读取附件
+            job.contract = convert_file_to_json(job.attachment["path"], job.attachment["content_type"])
+            if self.cache and not _is_extraction_error(job.contract):
+                self.cache.put("extract", extract_key, {"contract": job.contract})
+
+        # 转换为紧凑文本，减少发送给模型的token
+        job.contract_text, before, after = compact_with_stats(job.contract)
+        job.token_estimate = (before, after)
+        print(f"{job.label}合同内容压缩：约{before} → {after} tokens")
+        self._checkpoint(job, "extracted", contract=job.contract, contract_text=job.contract_text,
+                         token_estimate=job.token_estimate)
+        # 解析结果已持久化，下载的附件不再需要（解析失败时保留，供重试使用）
+        self._discard_attachment(job)
+        return True
+
+    def _discard_attachment(self, job):
+        """解析完成后删除下载的附件文件（除非配置保留）"""
+        if job.attachment and not ATTACHMENT_CONFIG["keep_files"]:
+            try:
+                os.remove(job.attachment["path"])
+            except OSError:
+                pass
+
+    def _plan_revision(self, job):
+        """修订版增量审阅：找到该附件上一版的审阅记录并按条款对比，不适用时返回None"""
+        if not REVISION_CONFIG["enabled"] or self.ledger is None or job.forced or not job.attachment_meta:
+            return None
+        previous = self.ledger.latest_revision(job.issue_key, job.attachment_meta.get("filename"), job.attachment_id)
+        revision = plan_incremental_review(previous, job.contract_text)
+        if revision:
+            print(f"{job.label}为修订版（上一版附件{previous['attachment_id']}），"
+                  f"{revision['changed']}/{revision['total']}个条款有变化，增量审阅")
+        return revision
+
+    def _plan_reference(self, job):
+        """相似合同：在索引中查找同一模板的已审阅合同，决定复用参考意见或只审阅差异，不适用时返回None"""
+        if not SIMILARITY_CONFIG["enabled"] or self.similarity is None or job.forced:
+            return None
+        match = self.similarity.query(job.contract_text)
+        reference = plan_reference_review(match, job.contract_text)
+        if reference:
+            reference["match"] = match
+            action = "复用其审阅意见" if reference["mode"] == "reuse" else "只审阅差异部分"
+            print(f"{job.label}与已审阅合同（{match['issue_name'] or match['review'].get('id')}）"
+                  f"相似度约{match['similarity']:.0%}，{action}")
+        return reference
+
+    def _plan_review(self, job):
+        """
+        确定审阅方式，返回(修订版增量审阅, 是否长合同, 缓存键, 缓存的审阅结果, 相似合同参考)；
+        包含SQLite查询、条款对比、MinHash计算及磁盘缓存读取，由_llm_stage放到线程池中执行
+        """
+        # 修订版只审阅变化的条款，其余情况按合同长度选择单次审阅或分块审阅
+        revision = self._plan_revision(job)
+        long_contract = revision is None and is_long_contract(job.contract_text)
+        # 相同合同文本（增量审阅为相同Prompt）、模型及Prompt版本直接复用审阅结果，不消耗token
+        if revision:
+            cache_key = review_cache_key(revision["prompt"], DOUBAO_CONFIG["ai_model"],
+                                         f"{PROMPT_VERSION}+{REVISION_PROMPT_VERSION}")
+        else:
+            prompt_version = f"{PROMPT_VERSION}+{LONG_PROMPT_VERSION}" if long_contract else PROMPT_VERSION
+            cache_key = review_cache_key(job.contract_text, DOUBAO_CONFIG["ai_model"], prompt_version)
+        cached = self.cache.get("review", cache_key) if self.cache else None
+        # 未命中缓存时查找同一模板的相似合同
+        reference = self._plan_reference(job) if cached is None and revision is None else None
+        return revision, long_contract, cache_key, cached, reference
+
+    def _save_review(self, job, cache_key):
+        """写入审阅缓存及检查点（磁盘/SQLite写入，由_llm_stage放到线程池中执行）"""
+        # 基于相似合同得到的意见不写入缓存（缓存只保存针对本合同文本的审阅结果）
+        if not job.review_cached and not job.review.get("reference") and self.cache:
+            self.cache.put("review", cache_key, job.review)
+        self._checkpoint(job, "reviewed", review=job.review, review_cached=job.review_cached)
+
+    async def _llm_stage(self, job):
+        # 阻塞的查询/计算/写入放到线程池中执行，不阻塞同一事件循环中其他审阅的流式输出及超时计时
+        loop = asyncio.get_running_loop()
+        revision, long_contract, cache_key, cached, reference = await loop.run_in_executor(
+            None, self._plan_review, job)
+        if cached is not None:
+            print(f"{job.label}审阅结果命中缓存（AI回复ID为{cached['id']}）")
+            job.review = cached
+            job.review_cached = True
+        elif reference and reference["mode"] == "reuse":
+            match = reference["match"]
+            job.review = dict(match["review"], total_tokens=0)
+            job.review["reference"] = {"mode": "reuse", "issue": match["issue_name"],
+                                       "similarity": round(match["similarity"], 3)}
+        else:
+            # 流式输出节流更新到占位评论（长合同只有合并阶段的输出）
+            progress = None
+            if job.progress_comment_id is not None:
+                progress = _ProgressComment(self.jira, job, self.config["progress_interval"])
+            on_delta = progress.on_delta if progress else None
+            try:
+                if revision:
+                    job.review = parse_doubao_output(await stream_doubao_prompt(revision["prompt"], on_delta=on_delta))
+                    job.review["revision"] = {"changed": revision["changed"], "total": revision["total"]}
+                elif reference:
+                    # 同一模板的相似合同：基于参考意见只审阅差异部分
+                    match = reference["match"]
+                    job.review = parse_doubao_output(await stream_doubao_prompt(reference["prompt"], on_delta=on_delta))
+                    job.review["reference"] = {"mode": "diff", "issue": match["issue_name"],
+                                               "similarity": round(match["similarity"], 3)}
+                elif long_contract:
+                    # 长合同：按条款分块并行审阅后合并
+                    job.review = await review_long_contract_async(job.contract_text, on_delta=on_delta)
+                else:
+                    # 所有审阅请求共用本阶段事件循环中的同一个异步客户端
+                    doubao_output = await call_doubao_api_async(job.contract_text, on_delta=on_delta)
+                    print(doubao_output)
+                    job.review = parse_doubao_output(doubao_output)
+            finally:
+                if progress:
+                    await progress.drain()
+        await loop.run_in_executor(None, self._save_review, job, cache_key)
+        return True
+
+    def _writeback_stage(self, job):
+        # 租约已过期并被其他实例接管（如本实例长时间卡住）时不回写，避免重复评论；检查点保留，由接管的实例完成
+        if self.leases is not None and not self.leases.is_held(job.issue_key):
+            print(f"⚠️ {job.label}的租约已被其他实例接管，放弃回写")
+            job.finish("leased", "租约已失效")
+            return False
+        review = job.review
+        doubao_id = review["id"]
+        total_tokens = review["total_tokens"]
+        print(f"本次调用ID为: {doubao_id}, 总消耗tokens: {total_tokens}")
+        print(review["text"])
+
+        # 拼接输出内容
+        if job.review_cached:
+            footer = (f"本次审阅复用了相同合同的历史AI审阅结果（AI模型为{review['model']}, AI回复ID为{doubao_id}），"
+                      f"未消耗AI Token。")
+        else:
+            footer = f"本次调用的AI模型为{DOUBAO_CONFIG['ai_model']}, AI回复ID为{doubao_id}, AI Token消耗为{total_tokens}"
+            # 固定审阅指令命中前缀缓存的输入token（旧缓存结果无此字段）
+            footer += f"（其中{review['cached_tokens']}个输入Token命中缓存）。" if review.get("cached_tokens") else "。"
+        reference = review.get("reference")
+        if reference and reference["mode"] == "reuse":
+            footer = (f"本合同与{reference['issue'] or '历史ticket'}中已审阅的合同内容相同，"
+                      f"直接复用其AI审阅意见（AI模型为{review.get('model')}, AI回复ID为{doubao_id}），未消耗AI Token。")
+        elif reference:
+            footer += (f"本合同与{reference['issue'] or '历史ticket'}中已审阅的合同来自同一模板（相似度约{reference['similarity']:.0%}），"
+                       f"仅对差异部分重新审阅，其余沿用参考意见。")
+        if review.get("revision"):
+            footer += (f"本次为修订版增量审阅：共{review['revision']['total']}个条款，"
+                       f"仅对{review['revision']['changed']}个修改/新增/删除的条款重新审阅，其余沿用上一版意见。")
+        doubao_to_jira = f"{job.comment_prefix}{review['text']}\n\n{footer}"
+
+        # 将回复放入jira：已有占位评论时更新为最终结果，否则新增评论
+        if job.progress_comment_id is not None:
+            self.jira.update_comment(job.issue_key, job.progress_comment_id, doubao_to_jira)
+            print(f"✅ 法律意见已更新到{job.label}的评论中")
+        else:
+            self.jira.add_comment_to_issue(issue_key=job.issue_key, comment_content=doubao_to_jira)
+        job.finish("posted")
+        self._record(job, "posted", status="posted")
+        if self.ledger is not None:
+            self.ledger.complete_job(job.issue_key, job.comment_id, job.attachment_id)
+            if job.attachment_meta:
+                self.ledger.mark_attachment_reviewed(job.issue_key, job.attachment_id,
+                                                     attachment_fingerprint(job.attachment_meta))
+                # 作为下一版增量审阅的基准
+                self.ledger.save_revision(job.issue_key, job.attachment_meta.get("filename") or job.attachment_id,
+                                          job.attachment_id, job.contract_text, review)
+        # 作为后续相似合同的参考（直接复用的意见不重复加入）
+        if self.similarity is not None and not (reference and reference["mode"] == "reuse"):
+            self.similarity.add(job.contract_text, review, issue_name=job.issue_name, attachment_id=job.attachment_id)
+        if job.forced:
+            self.ledger.clear_forced(job.issue_key, job.issue_name)
+        return False
+
+
+def print_summary(results, elapsed):
+    """打印本轮处理结果汇总"""
+    counts = {}
+    for job in results:
+        counts[job.status] = counts.get(job.status, 0) + 1
+    summary = "，".join(f"{status}: {count}" for status, count in sorted(counts.items()))
+    print(f"本轮共处理{len(results)}个ticket（{summary or '无'}），耗时{elapsed:.1f}秒")
+    estimates = [job.token_estimate for job in results if job.token_estimate]
+    if estimates:
+        before = sum(estimate[0] for estimate in estimates)
+        after = sum(estimate[1] for estimate in estimates)
+        print(f"合同内容token估算：压缩前约{before}，压缩后约{after}（节省{1 - after / max(before, 1):.0%}）")
+    for job in results:
+        if job.status == "failed":
+            print(f"  ❌ {job.label}：{job.error}")
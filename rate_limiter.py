@@ -0,0 +1,181 @@
+import asyncio
+import email.utils
+import threading
+import time
+from config import RATE_LIMIT_CONFIG
+
+# 并发已满或处于冷却期时的重试检查间隔（秒）
+_POLL_INTERVAL = 0.05
+# 被限流的状态码
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+def parse_retry_after(value):
+    """解析Retry-After响应头（秒数或HTTP日期），无法解析时返回None"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+def backoff_delay(attempt, retry_after=None):
+    """第attempt次重试前的等待时间：优先使用Retry-After，否则指数退避"""
+    if retry_after is not None:
+        return min(retry_after, RATE_LIMIT_CONFIG["max_backoff_seconds"])
+    return min(RATE_LIMIT_CONFIG["backoff_seconds"] * 2 ** attempt, RATE_LIMIT_CONFIG["max_backoff_seconds"])
+
+
+class TokenBucket:
+    """令牌桶：按rate每秒补充令牌，最多积累capacity个（调用方负责加锁）"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount):
+        """取出amount个令牌还需等待的秒数（大于桶容量的请求在桶满时放行）"""
+        self.refill()
+        needed = min(amount, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    单个端点的限流器：
+    - 令牌桶限制请求速率，可选的第二个令牌桶限制每分钟token消耗（按预估预扣，完成后按实际用量多退少补）
+    - 并发上限按AIMD调整：请求成功时缓慢加一，被限流时减半，其他失败（超时、5xx、连接错误）时不变
+    - 收到Retry-After后整个端点暂停到指定时间
+    同时支持线程（acquire）与协程（acquire_async）调用
+    """
+
+    def __init__(self, name, rate, burst, max_concurrency, tokens_per_minute=0, min_concurrency=1):
+        self.name = name
+        self.requests = TokenBucket(rate, burst)
+        self.budget = TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max(max_concurrency, min_concurrency)
+        self.min_concurrency = min_concurrency
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "throttled": 0, "waited_seconds": 0.0}
+
+    def _try_acquire(self, cost):
+        """尝试占用一个请求名额，成功返回0，否则返回建议等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.cooldown_until:
+                return self.cooldown_until - now
+            if self.in_flight >= int(self.limit):
+                return _POLL_INTERVAL
+            wait = self.requests.wait_time(1)
+            if self.budget is not None and cost:
+                wait = max(wait, self.budget.wait_time(cost))
+            if wait > 0:
+                return wait
+            self.requests.tokens -= 1
+            if self.budget is not None:
+                self.budget.tokens -= cost
+            self.in_flight += 1
+            self._stats["requests"] += 1
+            return 0.0
+
+    def acquire(self, cost=0):
+        """阻塞直到可以发出请求；cost为预估token数（仅设置了每分钟token预算时生效）"""
+        started = time.monotonic()
+        while True:
+            wait = self._try_acquire(cost)
+            if not wait:
+                break
+            time.sleep(wait)
+        self._add_wait(time.monotonic() - started)
+
+    async def acquire_async(self, cost=0):
+        """acquire的协程版本，等待期间不阻塞事件循环"""
+        started = time.monotonic()
+        while True:
+            wait = self._try_acquire(cost)
+            if not wait:
+                break
+            await asyncio.sleep(wait)
+        self._add_wait(time.monotonic() - started)
+
+    def _add_wait(self, seconds):
+        with self._lock:
+            self._stats["waited_seconds"] += seconds
+
+    def release(self, throttled=False, retry_after=None, cost=0, actual_cost=None, success=False):
+        """
+        请求结束后归还名额：
+        throttled为True时并发上限减半（同一冷却期内只减一次）并暂停retry_after秒；
+        success为True时并发上限加1/limit（约每limit个成功请求加一）；
+        其他失败（超时、5xx、连接错误、任务取消）并发上限不变；actual_cost为实际token消耗
+        """
+        with self._lock:
+            self.in_flight = max(self.in_flight - 1, 0)
+            now = time.monotonic()
+            if throttled:
+                self._stats["throttled"] += 1
+                pause = retry_after if retry_after is not None else RATE_LIMIT_CONFIG["backoff_seconds"]
+                self.cooldown_until = max(self.cooldown_until, now + pause)
+                if now - self._last_decrease > pause:
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self._last_decrease = now
+            elif success:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            if self.budget is not None and actual_cost is not None:
+                self.budget.tokens -= actual_cost - cost
+
+    def stats(self):
+        """返回请求数、被限流次数、累计等待时间及当前并发上限"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["waited_seconds"] = round(stats["waited_seconds"], 2)
+            stats["concurrency_limit"] = int(self.limit)
+        return stats
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _create_limiter(name):
+    if name.startswith("doubao"):
+        return RateLimiter(name, RATE_LIMIT_CONFIG["doubao_rate"], RATE_LIMIT_CONFIG["doubao_burst"],
+                           RATE_LIMIT_CONFIG["doubao_max_concurrency"],
+                           tokens_per_minute=RATE_LIMIT_CONFIG["doubao_tpm"])
+    return RateLimiter(name, RATE_LIMIT_CONFIG["jira_rate"], RATE_LIMIT_CONFIG["jira_burst"],
+                       RATE_LIMIT_CONFIG["jira_max_concurrency"])
+
+
+def get_limiter(name):
+    """获取进程内共享的端点限流器（如"jira:search"、"doubao"），首次调用时按配置创建"""
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = _limiters[name] = _create_limiter(name)
+        return limiter
+
+
+def limiter_stats():
+    """所有端点限流器的统计信息"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
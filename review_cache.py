@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from config import CACHE_CONFIG
+
+
+def content_hash(data):
+    """计算附件内容（bytes）或文本的SHA-256摘要，作为内容寻址的键"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def extract_cache_key(attachment_hash, extractor_version):
+    """解析结果的缓存键：附件内容hash + 解析器版本（含OCR是否可用），解析方式变化时重新解析"""
+    return content_hash(f"{extractor_version}\n{attachment_hash}")
+
+
+def review_cache_key(contract_text, model, prompt_version):
+    """审阅结果的缓存键：合同文本 + 模型 + Prompt版本，任一变化都会重新审阅"""
+    return content_hash(f"{model}\n{prompt_version}\n{contract_text}")
+
+
+class ContentCache:
+    """
+    内容寻址的本地磁盘缓存：
+    - extract命名空间：附件内容hash+解析器版本 → 解析后的合同JSON
+    - review命名空间：合同文本+模型+Prompt版本hash → 豆包审阅结果
+    - ocr命名空间：扫描页图片hash+OCR引擎/语言/分辨率 → 识别的文字（见pdf_ocr）
+    按总大小和存放时长淘汰，最近命中的条目最后淘汰
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, max_age_days=None):
+        self.cache_dir = cache_dir or CACHE_CONFIG["cache_dir"]
+        self.max_bytes = max_bytes if max_bytes is not None else CACHE_CONFIG["max_bytes"]
+        max_age_days = max_age_days if max_age_days is not None else CACHE_CONFIG["max_age_days"]
+        self.max_age = max_age_days * 24 * 3600
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._counters = {}
+        # 占用统计及过期淘汰在首次读写时进行（未触发审阅的轮次不遍历缓存目录）
+        self._total_bytes = None
+        self._scan_lock = threading.Lock()
+
+    def _ensure_scanned(self):
+        with self._scan_lock:
+            if self._total_bytes is None:
+                self.evict()
+
+    def _path(self, namespace, key):
+        return os.path.join(self.cache_dir, namespace, key[:2], f"{key}.json")
+
+    def _entries(self):
+        """遍历所有缓存文件，返回(路径, 修改时间, 大小)"""
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def _count(self, namespace, outcome):
+        with self._lock:
+            counter = self._counters.setdefault(namespace, {"hits": 0, "misses": 0})
+            counter[outcome] += 1
+
+    def get(self, namespace, key):
+        """读取缓存，未命中或已过期返回None"""
+        self._ensure_scanned()
+        path = self._path(namespace, key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                self._count(namespace, "misses")
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)  # 命中后刷新时间，淘汰时按最近使用排序
+        except (OSError, ValueError):
+            self._count(namespace, "misses")
+            return None
+        self._count(namespace, "hits")
+        return value
+
+    def put(self, namespace, key, value):
+        """写入缓存（先写临时文件再原子替换，避免并发读到半个文件）"""
+        self._ensure_scanned()
+        path = self._path(namespace, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._total_bytes += len(data) - old_size
+            over_limit = self._total_bytes > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def evict(self):
+        """删除过期条目，并按最久未使用顺序删除直至总大小低于上限"""
+        with self._lock:
+            now = time.time()
+            entries = sorted(self._entries(), key=lambda entry: entry[1])
+            total = sum(size for _, _, size in entries)
+            removed = 0
+            for path, mtime, size in entries:
+                if now - mtime <= self.max_age and total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            self._total_bytes = total
+        if removed:
+            print(f"🧹 缓存淘汰{removed}个条目，当前占用{total / 1024 / 1024:.1f}MB")
+
+    def iter_namespace(self, namespace):
+        """遍历命名空间中未过期的条目，返回(键, 值)（不刷新使用时间）"""
+        now = time.time()
+        for root, _, files in os.walk(os.path.join(self.cache_dir, namespace)):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    if now - os.path.getmtime(path) > self.max_age:
+                        continue
+                    with open(path, "r", encoding="utf-8") as f:
+                        value = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                yield name[:-len(".json")], value
+
+    def stats(self):
+        """返回各命名空间的命中/未命中次数及当前占用字节数（尚未读写过时为None）"""
+        with self._lock:
+            stats = {namespace: dict(counter) for namespace, counter in self._counters.items()}
+            stats["total_bytes"] = self._total_bytes
+        return stats
+
+
+# 进程内共享的缓存实例：同一缓存目录只由一个实例统计占用及淘汰，避免各自淘汰对方的条目
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    """获取进程内共享的缓存（首次调用时创建，创建时会扫描缓存目录并淘汰过期条目）"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ContentCache()
+        return _shared_cache
@@ -0,0 +1,112 @@
+import difflib
+import hashlib
+from contract_compactor import estimate_tokens, normalize_whitespace, CLAUSE_HEADING
+from doubao_client import build_contract_review_prompt
+from long_contract_review import split_clauses, REVIEW_SECTIONS
+from config import LONG_CONTRACT_CONFIG, REVISION_CONFIG
+
+
+def _clause_body(text):
+    """条款比较用的正文：去掉开头的条款编号（如“第3条”“Article 3”），编号只用于展示"""
+    match = CLAUSE_HEADING.match(text)
+    return normalize_whitespace(text[match.end():] if match else text)
+
+
+def diff_clauses(old_text, new_text):
+    """
+    条款级对比两版合同：按条款拆分后对齐（允许条款增删导致的编号整体移动），
+    返回变化列表[(类型, 条款标题, 旧条款, 新条款)]及新版条款总数，类型为修改/新增/删除
+    """
+    old_clauses = split_clauses(old_text)
+    new_clauses = split_clauses(new_text)
+    # 只比较去掉编号并规范化后的正文，忽略空白差异；插入/删除条款导致的后续条款重新编号不算修改
+    old_bodies = [_clause_body(text) for _, text in old_clauses]
+    new_bodies = [_clause_body(text) for _, text in new_clauses]
+
+    changes = []
+    matcher = difflib.SequenceMatcher(None, old_bodies, new_bodies, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        old_part = old_clauses[i1:i2]
+        new_part = new_clauses[j1:j2]
+        # 替换区间内按顺序配对为“修改”，多出的部分为新增或删除
+        for index in range(max(len(old_part), len(new_part))):
+            old = old_part[index] if index < len(old_part) else None
+            new = new_part[index] if index < len(new_part) else None
+            if old and new:
+                changes.append(("修改", new[0] or old[0], old[1], new[1]))
+            elif new:
+                changes.append(("新增", new[0], None, new[1]))
+            else:
+                changes.append(("删除", old[0], old[1], None))
+    return changes, len(new_clauses)
+
+
+def build_incremental_review_prompt(previous_review, changes, clause_headings):
+    """增量审阅Prompt：上一版审阅意见 + 有变化的条款（新旧对照），输出与完整审阅相同的七个模块"""
+    sections = []
+    for kind, heading, old, new in changes:
+        title = heading or "（合同首部）"
+        if kind == "修改":
+            sections.append(f"--- {kind}：{title} ---\n【修改前】\n{old}\n【修改后】\n{new}")
+        elif kind == "新增":
+            sections.append(f"--- {kind}：{title} ---\n{new}")
+        else:
+            sections.append(f"--- {kind}：{title} ---\n{old}")
+    changed = "\n\n".join(sections)
+    return f"""
+    你现在是一名专业的合同法律及财税审阅助手。请求人根据上一版审阅意见修改了合同，请对修订版进行增量审阅：
+
+    ### 上一版合同的审阅意见
+    {previous_review}
+
+    ### 修订版合同条款目录
+    {"、".join(clause_headings) or "（未识别到条款标题）"}
+
+    ### 本次修改的条款（未列出的条款与上一版相同）
+    {changed}
+
+    ### 审阅要求
+    1. 逐条核对上一版意见中的问题是否已在修改后的条款中解决，未解决的继续保留并说明；
+    2. 从合法性、法律风险、税务风险、财务风险四个方面审阅修改、新增的条款，识别新引入的问题；删除的条款需评估删除后是否造成缺失；
+    3. 未修改条款沿用上一版意见，不得编造原意见及本次修改中没有的条款编号；
+    4. 对于重大风险（风险发生概率大于80%或风险发生后的损失金额大于50万元的）重点提示。
+
+    ### 输出格式要求
+    1. 分模块输出完整的修订版法律意见：{"".join(REVIEW_SECTIONS)}；
+    2. 在【整体结论】开头说明上一版意见的整改情况（已解决/部分解决/未解决的问题数量）；
+    3. 针对每一个问题，明确指出对应的合同条款位置（如“第3条第2款”）；
+    4. 输出为普通文本格式，不需要体现格式。
+    """
+
+
+# 增量审阅Prompt版本：模板变化时自动变化，用于审阅结果缓存失效
+REVISION_PROMPT_VERSION = hashlib.sha256(
+    build_incremental_review_prompt("", [], []).encode("utf-8")
+).hexdigest()[:12]
+
+
+def plan_incremental_review(previous, contract_text):
+    """
+    判断修订版能否增量审阅，可以时返回{"prompt", "changed", "total"}，否则返回None（走完整审阅）：
+    previous为上一版的审阅记录（见ReviewLedger.latest_revision）；
+    条款过少、变化比例过高（可能并非同一份合同）或增量Prompt并不更短时完整审阅
+    """
+    if not previous or not previous.get("review_text"):
+        return None
+    changes, total = diff_clauses(previous["contract_text"], contract_text)
+    if not changes or total < REVISION_CONFIG["min_clauses"]:
+        return None
+    if len(changes) > total * REVISION_CONFIG["max_changed_ratio"]:
+        print(f"修订版{len(changes)}/{total}个条款有变化，超过增量审阅比例上限，完整审阅")
+        return None
+
+    headings = [heading for heading, _ in split_clauses(contract_text) if heading]
+    prompt = build_incremental_review_prompt(previous["review_text"], changes, headings)
+    # 增量Prompt不比完整审阅更短（如合同本身很短）或超过长合同阈值时，完整审阅
+    prompt_tokens = estimate_tokens(prompt)
+    if (prompt_tokens >= estimate_tokens(build_contract_review_prompt(contract_text))
+            or prompt_tokens > LONG_CONTRACT_CONFIG["threshold_tokens"]):
+        return None
+    return {"prompt": prompt, "changed": len(changes), "total": total}
@@ -0,0 +1,285 @@
+import difflib
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from array import array
+from datetime import datetime
+from contract_compactor import estimate_tokens, normalize_whitespace
+from doubao_client import build_contract_review_prompt
+from long_contract_review import REVIEW_SECTIONS
+from config import SIMILARITY_CONFIG
+
+_DIGITS = re.compile(r"\d+")
+_WHITESPACE = re.compile(r"\s+")
+# 空桶标记（该桶没有任何shingle落入）
+_EMPTY = 2 ** 64 - 1
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _shingles(text, size):
+    """
+    字符级shingle：统一空白并将数字替换为#，使金额/日期/编号不同的同模板合同仍然相似；
+    仅用于查找候选合同，能否复用参考意见由plan_reference_review按原文对比决定
+    """
+    text = _WHITESPACE.sub("", _DIGITS.sub("#", normalize_whitespace(text)))
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def minhash_signature(text, num_perm=None, shingle_size=None):
+    """
+    MinHash签名（单次哈希分桶的one-permutation MinHash）：
+    每个shingle只计算一次64位哈希，按哈希值分入num_perm个桶，每个桶保留最小值
+    """
+    num_perm = num_perm or SIMILARITY_CONFIG["num_perm"]
+    signature = [_EMPTY] * num_perm
+    for shingle in _shingles(text, shingle_size or SIMILARITY_CONFIG["shingle_size"]):
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        index = value % num_perm
+        if value < signature[index]:
+            signature[index] = value
+    return signature
+
+
+def estimate_similarity(signature_a, signature_b):
+    """按签名估算两份合同shingle集合的Jaccard相似度（忽略两边均为空的桶）"""
+    matched = total = 0
+    for a, b in zip(signature_a, signature_b):
+        if a == _EMPTY and b == _EMPTY:
+            continue
+        total += 1
+        matched += a == b
+    return matched / total if total else 0.0
+
+
+def _band_keys(signature, bands):
+    """LSH分段：签名按段哈希，任一段相同即为候选"""
+    rows = len(signature) // bands
+    keys = []
+    for band in range(bands):
+        part = signature[band * rows:(band + 1) * rows]
+        if all(value == _EMPTY for value in part):
+            continue
+        keys.append((band, hashlib.blake2b(array("Q", part).tobytes(), digest_size=8).hexdigest()))
+    return keys
+
+
+def diff_lines(reference_text, contract_text):
+    """逐行对比参考合同与本合同，返回差异片段[(参考合同行, 本合同行)]"""
+    reference = reference_text.splitlines()
+    contract = contract_text.splitlines()
+    matcher = difflib.SequenceMatcher(None, reference, contract, autojunk=False)
+    return [("\n".join(reference[i1:i2]), "\n".join(contract[j1:j2]))
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"]
+
+
+def build_reference_diff_prompt(reference_review, differences, similarity):
+    """相似合同Prompt：参考合同的审阅意见 + 两份合同的差异片段，输出本合同完整的七个模块"""
+    blocks = "\n\n".join(f"--- 差异{index} ---\n【参考合同】\n{old or '（无）'}\n【本合同】\n{new or '（无）'}"
+                         for index, (old, new) in enumerate(differences, start=1))
+    return f"""
+    你现在是一名专业的合同法律及财税审阅助手。以下合同与一份已审阅的参考合同来自同一模板（相似度约{similarity:.0%}），
+    除下列差异外两份合同内容完全相同，请基于参考合同的审阅意见审阅本合同：
+
+    ### 参考合同的审阅意见
+    {reference_review}
+
+    ### 本合同与参考合同的差异
+    {blocks}
+
+    ### 审阅要求
+    1. 参考意见中与差异部分无关的内容直接沿用；
+    2. 逐一审阅差异部分（当事人、金额、期限、新增或改动的条款等），从合法性、法律风险、税务风险、财务风险四个方面识别新的问题，
+       并判断参考意见中的问题在本合同中是否仍然存在；
+    3. 不得编造参考意见及差异中没有的条款编号；
+    4. 对于重大风险（风险发生概率大于80%或风险发生后的损失金额大于50万元的）重点提示。
+
+    ### 输出格式要求
+    1. 分模块输出本合同完整的法律意见：{"".join(REVIEW_SECTIONS)}；
+    2. 针对每一个问题，明确指出对应的合同条款位置（如“第3条第2款”）；
+    3. 输出为普通文本格式，不需要体现格式。
+    """
+
+
+class SimilarityIndex:
+    """
+    已审阅合同的近似重复索引（SQLite本地文件）：
+    保存合同文本、MinHash签名及审阅意见，按LSH分段建立倒排，查询时只比较候选合同的签名
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or SIMILARITY_CONFIG["db_path"]
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self.num_perm = SIMILARITY_CONFIG["num_perm"]
+        self.bands = SIMILARITY_CONFIG["bands"]
+
+        # 流水线多线程共用同一连接，读写均通过锁串行化
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    doc_key TEXT PRIMARY KEY,
+                    issue_name TEXT,
+                    attachment_id TEXT,
+                    contract_text TEXT NOT NULL,
+                    review TEXT NOT NULL,
+                    signature BLOB NOT NULL,
+                    created_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS lsh_buckets (
+                    band INTEGER NOT NULL,
+                    bucket TEXT NOT NULL,
+                    doc_key TEXT NOT NULL,
+                    PRIMARY KEY (band, bucket, doc_key)
+                );
+            """)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def add(self, contract_text, review, issue_name=None, attachment_id=None):
+        """将已审阅的合同加入索引（相同合同文本只保留最新的审阅意见）"""
+        doc_key = hashlib.sha256(contract_text.encode("utf-8")).hexdigest()
+        signature = minhash_signature(contract_text, self.num_perm)
+        review = {key: review[key] for key in ("text", "id", "model", "total_tokens") if key in review}
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM lsh_buckets WHERE doc_key = ?", (doc_key,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (doc_key, issue_name, attachment_id, contract_text, review,"
+                " signature, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (doc_key, issue_name, attachment_id, contract_text, json.dumps(review, ensure_ascii=False),
+                 array("Q", signature).tobytes(), _now())
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO lsh_buckets (band, bucket, doc_key) VALUES (?, ?, ?)",
+                [(band, bucket, doc_key) for band, bucket in _band_keys(signature, self.bands)]
+            )
+            self._conn.execute("COMMIT")
+
+    def query(self, contract_text, threshold=None):
+        """
+        查找最相似的已审阅合同，相似度达到threshold时返回
+        {"similarity", "issue_name", "attachment_id", "contract_text", "review"}，否则返回None
+        """
+        threshold = threshold if threshold is not None else SIMILARITY_CONFIG["diff_threshold"]
+        signature = minhash_signature(contract_text, self.num_perm)
+        keys = _band_keys(signature, self.bands)
+        if not keys:
+            return None
+        clause = " OR ".join("(band = ? AND bucket = ?)" for _ in keys)
+        params = [value for key in keys for value in key]
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT doc_key, signature FROM documents WHERE doc_key IN"
+                f" (SELECT DISTINCT doc_key FROM lsh_buckets WHERE {clause})",
+                params
+            ).fetchall()
+
+        best_key, best_similarity = None, 0.0
+        for row in rows:
+            similarity = estimate_similarity(signature, array("Q", row["signature"]))
+            if similarity > best_similarity:
+                best_key, best_similarity = row["doc_key"], similarity
+        if best_key is None or best_similarity < threshold:
+            return None
+
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM documents WHERE doc_key = ?", (best_key,)).fetchone()
+        return {
+            "similarity": best_similarity,
+            "issue_name": row["issue_name"],
+            "attachment_id": row["attachment_id"],
+            "contract_text": row["contract_text"],
+            "review": json.loads(row["review"])
+        }
+
+    def stats(self):
+        with self._lock:
+            documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            buckets = self._conn.execute("SELECT COUNT(*) FROM lsh_buckets").fetchone()[0]
+        return {"documents": documents, "buckets": buckets}
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM lsh_buckets")
+            self._conn.execute("DELETE FROM documents")
+
+
+def plan_reference_review(match, contract_text):
+    """
+    根据相似合同决定审阅方式：
+    与参考合同的紧凑文本逐行对比无差异时直接复用参考意见（返回{"mode": "reuse"}）；
+    相似度按数字归一化后计算，金额/日期/比例不同的合同相似度同样为100%，因此只要原文有差异就必须审阅差异部分：
+    差异Prompt明显短于完整审阅时返回{"mode": "diff", "prompt"}，不适用时返回None
+    """
+    if match is None:
+        return None
+    differences = diff_lines(match["contract_text"], contract_text)
+    if not differences:
+        return {"mode": "reuse"}
+    prompt = build_reference_diff_prompt(match["review"]["text"], differences, match["similarity"])
+    if estimate_tokens(prompt) >= estimate_tokens(build_contract_review_prompt(contract_text)):
+        return None
+    return {"mode": "diff", "prompt": prompt}
+
+
+def rebuild_index(index, cache=None, ledger=None):
+    """
+    从已保存的解析结果批量重建索引：
+    解析缓存中的合同（extract命名空间）按紧凑文本查找对应的审阅缓存，以及台账中各附件最近一次审阅的文本及意见
+    """
+    from contract_compactor import compact_contract
+    from doubao_client import PROMPT_VERSION
+    from review_cache import review_cache_key
+    from config import DOUBAO_CONFIG
+
+    index.clear()
+    added = 0
+    if cache is not None:
+        for _, value in cache.iter_namespace("extract"):
+            contract_text = compact_contract(value["contract"])
+            key = review_cache_key(contract_text, DOUBAO_CONFIG["ai_model"], PROMPT_VERSION)
+            review = cache.get("review", key)
+            if review is not None:
+                index.add(contract_text, review)
+                added += 1
+    if ledger is not None:
+        for revision in ledger.iter_revisions():
+            index.add(revision["contract_text"], {"text": revision["review_text"], "id": revision["review_id"]},
+                      attachment_id=revision["attachment_id"])
+            added += 1
+    print(f"✅ 相似合同索引重建完成：共处理{added}份已审阅合同，{index.stats()}")
+    return added
+
+
+# 运维命令：python similarity_index.py --rebuild / --stats
+if __name__ == "__main__":
+    import argparse
+    from review_cache import ContentCache
+    from state_ledger import ReviewLedger
+
+    parser = argparse.ArgumentParser(description="相似合同索引")
+    parser.add_argument("--rebuild", action="store_true", help="从解析/审阅缓存及台账批量重建索引")
+    parser.add_argument("--stats", action="store_true", help="查看索引规模")
+    args = parser.parse_args()
+
+    similarity_index = SimilarityIndex()
+    if args.rebuild:
+        review_ledger = ReviewLedger()
+        rebuild_index(similarity_index, cache=ContentCache(), ledger=review_ledger)
+        review_ledger.close()
+    if args.stats:
+        print(similarity_index.stats())
+    similarity_index.close()
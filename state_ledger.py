@@ -0,0 +1,427 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from config import LEDGER_CONFIG
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class ReviewLedger:
+    """
+    审阅处理台账（SQLite本地文件）：
+    以 ticket ID + 触发评论ID + 附件ID 为键，记录各阶段处理结果及时间，
+    程序重启后依然有效，避免同一触发评论被重复审阅
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or LEDGER_CONFIG["db_path"]
+        db_dir = os.path.dirname(os.path.abspath(self.db_path))
+        os.makedirs(db_dir, exist_ok=True)
+
+        # 流水线多线程共用同一连接，读写均通过锁串行化
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS reviews (
+                    issue_id TEXT NOT NULL,
+                    comment_id TEXT NOT NULL,
+                    attachment_id TEXT NOT NULL,
+                    issue_name TEXT,
+                    stage TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (issue_id, comment_id, attachment_id)
+                );
+                CREATE TABLE IF NOT EXISTS stage_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    issue_id TEXT NOT NULL,
+                    comment_id TEXT NOT NULL,
+                    attachment_id TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    outcome TEXT NOT NULL,
+                    detail TEXT,
+                    created_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS forced_reviews (
+                    issue TEXT PRIMARY KEY,
+                    requested_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS issue_seen (
+                    issue_id TEXT PRIMARY KEY,
+                    updated TEXT NOT NULL,
+                    checked_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS jobs (
+                    issue_id TEXT NOT NULL,
+                    comment_id TEXT NOT NULL,
+                    attachment_id TEXT NOT NULL,
+                    issue_name TEXT,
+                    issue TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    checkpoint TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at TEXT,
+                    last_error TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (issue_id, comment_id, attachment_id)
+                );
+                CREATE TABLE IF NOT EXISTS attachment_reviews (
+                    issue_id TEXT NOT NULL,
+                    attachment_id TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    reviewed_at TEXT NOT NULL,
+                    PRIMARY KEY (issue_id, attachment_id)
+                );
+                CREATE TABLE IF NOT EXISTS revisions (
+                    issue_id TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    attachment_id TEXT NOT NULL,
+                    contract_text TEXT NOT NULL,
+                    review_text TEXT NOT NULL,
+                    review_id TEXT,
+                    reviewed_at TEXT NOT NULL,
+                    PRIMARY KEY (issue_id, filename)
+                );
+                CREATE TABLE IF NOT EXISTS webhook_deliveries (
+                    delivery_id TEXT PRIMARY KEY,
+                    received_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT,
+                    updated_at TEXT NOT NULL
+                );
+            """)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def is_processed(self, issue_id, comment_id, attachment_id):
+        """该触发评论+附件是否已经成功回写过审阅意见"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status FROM reviews WHERE issue_id = ? AND comment_id = ? AND attachment_id = ?",
+                (str(issue_id), str(comment_id), str(attachment_id))
+            ).fetchone()
+        return row is not None and row["status"] == "posted"
+
+    def record_stage(self, issue_id, comment_id, attachment_id, stage, status="running",
+                     error=None, issue_name=None):
+        """记录某一阶段的处理结果"""
+        key = (str(issue_id), str(comment_id), str(attachment_id))
+        now = _now()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO reviews (issue_id, comment_id, attachment_id, issue_name, stage, status, error,
+                                     created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (issue_id, comment_id, attachment_id) DO UPDATE SET
+                    issue_name = COALESCE(excluded.issue_name, reviews.issue_name),
+                    stage = excluded.stage,
+                    status = excluded.status,
+                    error = excluded.error,
+                    updated_at = excluded.updated_at
+                """,
+                key + (issue_name, stage, status, error, now, now)
+            )
+            self._conn.execute(
+                "INSERT INTO stage_events (issue_id, comment_id, attachment_id, stage, outcome, detail, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                key + (stage, status, error, now)
+            )
+
+    def history(self, issue):
+        """按ticket ID或key查询台账记录"""
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(
+                "SELECT * FROM reviews WHERE issue_id = ? OR issue_name = ? ORDER BY updated_at",
+                (str(issue), str(issue))
+            )]
+
+    # ---------- ticket变更检测 ----------
+
+    def is_unchanged(self, issue_id, updated):
+        """ticket的updated与上次检查时相同（评论未变化），可跳过评论查询"""
+        if not updated:
+            return False
+        with self._lock:
+            row = self._conn.execute("SELECT updated FROM issue_seen WHERE issue_id = ?", (str(issue_id),)).fetchone()
+        return row is not None and row["updated"] == updated
+
+    def mark_seen(self, issue_id, updated):
+        if not updated:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO issue_seen (issue_id, updated, checked_at) VALUES (?, ?, ?)",
+                (str(issue_id), updated, _now())
+            )
+
+    # ---------- 附件变更检测 ----------
+
+    def is_attachment_unchanged(self, issue_id, attachment_id, fingerprint):
+        """该附件已审阅过且ID/大小/上传时间均未变化"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint FROM attachment_reviews WHERE issue_id = ? AND attachment_id = ?",
+                (str(issue_id), str(attachment_id))
+            ).fetchone()
+        return row is not None and row["fingerprint"] == fingerprint
+
+    def mark_attachment_reviewed(self, issue_id, attachment_id, fingerprint):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO attachment_reviews (issue_id, attachment_id, fingerprint, reviewed_at)"
+                " VALUES (?, ?, ?, ?)",
+                (str(issue_id), str(attachment_id), fingerprint, _now())
+            )
+
+    # ---------- 修订版增量审阅 ----------
+
+    def save_revision(self, issue_id, filename, attachment_id, contract_text, review):
+        """保存附件最近一次审阅的合同文本及意见，作为下一版增量审阅的基准"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO revisions (issue_id, filename, attachment_id, contract_text, review_text,"
+                " review_id, reviewed_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (str(issue_id), filename.lower(), str(attachment_id), contract_text, review["text"],
+                 review.get("id"), _now())
+            )
+
+    def latest_revision(self, issue_id, filename, attachment_id):
+        """
+        查找该附件的上一版：优先同名文件，否则取该ticket最近审阅的其他附件；
+        与当前附件ID相同（同一文件重新审阅）时返回None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM revisions WHERE issue_id = ? AND filename = ?", (str(issue_id), (filename or "").lower())
+            ).fetchone()
+            if row is None:
+                row = self._conn.execute(
+                    "SELECT * FROM revisions WHERE issue_id = ? ORDER BY reviewed_at DESC LIMIT 1", (str(issue_id),)
+                ).fetchone()
+        if row is None or row["attachment_id"] == str(attachment_id):
+            return None
+        return dict(row)
+
+    def iter_revisions(self):
+        """遍历各附件最近一次审阅的合同文本及意见（用于重建相似合同索引）"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM revisions ORDER BY reviewed_at").fetchall()
+        return [dict(row) for row in rows]
+
+    # ---------- 通用键值（如JIRA轮询水位） ----------
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else default
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value, updated_at) VALUES (?, ?, ?)",
+                (key, value, _now())
+            )
+
+    # ---------- 持久化任务队列（阶段检查点/重试/死信） ----------
+
+    def save_checkpoint(self, issue, comment_id, attachment_id, stage, data):
+        """
+        记录任务完成的阶段及该阶段产出（与已有检查点合并），
+        重试时从最后完成的阶段继续，不重复下载/解析/调用模型
+        """
+        key = (str(issue["id"]), str(comment_id), str(attachment_id))
+        now = _now()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT checkpoint FROM jobs WHERE issue_id = ? AND comment_id = ? AND attachment_id = ?", key
+            ).fetchone()
+            checkpoint = json.loads(row["checkpoint"]) if row else {}
+            checkpoint.update(data)
+            self._conn.execute(
+                """
+                INSERT INTO jobs (issue_id, comment_id, attachment_id, issue_name, issue, stage, status, checkpoint,
+                                  created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, 'running', ?, ?, ?)
+                ON CONFLICT (issue_id, comment_id, attachment_id) DO UPDATE SET
+                    issue = excluded.issue,
+                    stage = excluded.stage,
+                    status = 'running',
+                    checkpoint = excluded.checkpoint,
+                    updated_at = excluded.updated_at
+                """,
+                key + (issue.get("key"), json.dumps(issue, ensure_ascii=False), stage,
+                       json.dumps(checkpoint, ensure_ascii=False), now, now)
+            )
+
+    def complete_job(self, issue_id, comment_id, attachment_id):
+        """任务完成（已回写）：清空检查点内容，只保留状态"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET stage = 'posted', status = 'done', checkpoint = '{}', last_error = NULL,"
+                " next_attempt_at = NULL, updated_at = ? WHERE issue_id = ? AND comment_id = ? AND attachment_id = ?",
+                (_now(), str(issue_id), str(comment_id), str(attachment_id))
+            )
+
+    def fail_job(self, issue_id, comment_id, attachment_id, error):
+        """
+        任务失败：按指数退避安排下次重试，超过最大尝试次数后进入死信状态。
+        返回(状态, 下次重试时间)，状态为retry或dead；任务尚无检查点时返回(None, None)
+        """
+        key = (str(issue_id), str(comment_id), str(attachment_id))
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempts FROM jobs WHERE issue_id = ? AND comment_id = ? AND attachment_id = ?", key
+            ).fetchone()
+            if row is None:
+                return None, None
+            attempts = row["attempts"] + 1
+            if attempts >= LEDGER_CONFIG["max_attempts"]:
+                status, next_attempt_at = "dead", None
+            else:
+                delay = min(LEDGER_CONFIG["retry_base_seconds"] * 2 ** (attempts - 1),
+                            LEDGER_CONFIG["retry_max_seconds"])
+                status = "retry"
+                next_attempt_at = (datetime.now() + timedelta(seconds=delay)).isoformat(timespec="seconds")
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ?"
+                " WHERE issue_id = ? AND comment_id = ? AND attachment_id = ?",
+                (status, attempts, next_attempt_at, error, _now()) + key
+            )
+        return status, next_attempt_at
+
+    def job_status(self, issue_id, comment_id, attachment_id):
+        """返回任务状态（running / retry / dead / done）及下次重试时间，无记录时返回(None, None)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, next_attempt_at FROM jobs WHERE issue_id = ? AND comment_id = ? AND attachment_id = ?",
+                (str(issue_id), str(comment_id), str(attachment_id))
+            ).fetchone()
+        return (row["status"], row["next_attempt_at"]) if row else (None, None)
+
+    def _decode_job(self, row):
+        job = dict(row)
+        job["issue"] = json.loads(job["issue"])
+        job["checkpoint"] = json.loads(job["checkpoint"])
+        return job
+
+    def due_jobs(self):
+        """
+        需要继续处理的任务：已到重试时间的任务，以及上次运行中断（进程退出）仍为running的任务。
+        调用方需跳过当前进程中正在处理的任务
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = 'running' OR (status = 'retry' AND next_attempt_at <= ?)"
+                " ORDER BY updated_at",
+                (_now(),)
+            ).fetchall()
+        return [self._decode_job(row) for row in rows]
+
+    def dead_letters(self):
+        """死信任务列表（不含检查点内容），供运维排查"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT issue_id, comment_id, attachment_id, issue_name, stage, attempts, last_error, updated_at"
+                " FROM jobs WHERE status = 'dead' ORDER BY updated_at"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def requeue_job(self, issue):
+        """运维将指定ticket（ID或key）的死信任务重新放回队列，下一轮从最后完成的阶段继续"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'retry', attempts = 0, next_attempt_at = ?, updated_at = ?"
+                " WHERE status = 'dead' AND (issue_id = ? OR issue_name = ?)",
+                (_now(), _now(), str(issue), str(issue))
+            )
+        print(f"✅ 已将{issue}的{cursor.rowcount}个死信任务重新放回队列")
+        return cursor.rowcount
+
+    # ---------- webhook投递去重 ----------
+
+    def record_delivery(self, delivery_id):
+        """记录一次webhook投递，首次收到返回True，重复投递（JIRA重试）返回False"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO webhook_deliveries (delivery_id, received_at) VALUES (?, ?)",
+                (str(delivery_id), _now())
+            )
+        return cursor.rowcount == 1
+
+    def prune_deliveries(self, before):
+        """删除received_at早于before（ISO时间字符串）的投递记录"""
+        with self._lock:
+            self._conn.execute("DELETE FROM webhook_deliveries WHERE received_at < ?", (before,))
+
+    # ---------- 运维强制重审 ----------
+
+    def force_rereview(self, issue):
+        """标记某个ticket（ID或key）在下一轮强制重新审阅，忽略触发评论及已处理记录"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO forced_reviews (issue, requested_at) VALUES (?, ?)",
+                (str(issue), _now())
+            )
+        print(f"✅ 已标记{issue}在下一轮强制重新审阅")
+
+    def is_forced(self, issue_id, issue_name=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT requested_at FROM forced_reviews WHERE issue = ? OR issue = ?",
+                (str(issue_id), str(issue_name))
+            ).fetchone()
+        return row["requested_at"] if row else None
+
+    def forced_issues(self):
+        """所有待强制重审的ticket（ID或key，按标记先后）"""
+        with self._lock:
+            rows = self._conn.execute("SELECT issue FROM forced_reviews ORDER BY requested_at").fetchall()
+        return [row["issue"] for row in rows]
+
+    def clear_forced(self, issue_id, issue_name=None):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM forced_reviews WHERE issue = ? OR issue = ?",
+                (str(issue_id), str(issue_name))
+            )
+
+
+# 运维命令：python state_ledger.py --force FIN-123 / --show FIN-123 / --dead / --retry FIN-123
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="合同审阅处理台账")
+    parser.add_argument("--force", metavar="ISSUE", help="强制重新审阅指定ticket（ID或key）")
+    parser.add_argument("--show", metavar="ISSUE", help="查看指定ticket的处理记录（ID或key）")
+    parser.add_argument("--dead", action="store_true", help="查看死信任务（多次重试仍失败）")
+    parser.add_argument("--retry", metavar="ISSUE", help="将指定ticket（ID或key）的死信任务重新放回队列")
+    args = parser.parse_args()
+
+    ledger = ReviewLedger()
+    if args.force:
+        ledger.force_rereview(args.force)
+    if args.show:
+        for record in ledger.history(args.show):
+            print(record)
+    if args.dead:
+        for job in ledger.dead_letters():
+            print(job)
+    if args.retry:
+        ledger.requeue_job(args.retry)
+    ledger.close()
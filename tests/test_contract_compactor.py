@@ -0,0 +1,27 @@
+import json
+
+from contract_compactor import compact_contract
+from long_contract_review import split_clauses
+
+
+def _pdf(pages):
+    """构造PDF解析结果（与attachment_processor的分页标记一致）"""
+    text = "".join(f"=== 第{index}页 ===\n{page}\n\n" for index, page in enumerate(pages, start=1))
+    return json.dumps({"text": text, "pdf_info": {"pages": len(pages)}}, ensure_ascii=False)
+
+
+def test_headers_and_page_numbers_are_stripped():
+    pages = [f"XX科技有限公司采购合同\n条款内容{index}。\n第 {index} 页 共 4 页" for index in range(1, 5)]
+    text = compact_contract(_pdf(pages))
+    assert "XX科技有限公司采购合同" not in text
+    assert "共4页" not in text
+    assert text.splitlines() == [f"条款内容{index}。" for index in range(1, 5)]
+
+
+def test_clause_headings_at_page_boundaries_are_kept():
+    # 每页以“第N条 付款”开头：按数字归一化后会被误判为重复的页眉
+    pages = [f"第{index}条 付款\n第{index}期款项于验收合格后支付。\n- {index} -" for index in range(1, 5)]
+    text = compact_contract(_pdf(pages))
+    assert "- 4 -" not in text
+    headings = [heading for heading, _ in split_clauses(text)]
+    assert headings == [f"第{index}条付款" for index in range(1, 5)]
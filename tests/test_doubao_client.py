@@ -0,0 +1,23 @@
+from doubao_client import _is_cache_miss
+
+
+class _StatusError(Exception):
+    """模拟方舟SDK的状态码异常"""
+
+    def __init__(self, status_code, body):
+        super().__init__(str(body))
+        self.status_code = status_code
+        self.body = body
+
+
+def test_missing_previous_response_is_cache_miss():
+    error = _StatusError(404, {"error": {"code": "InvalidParameter.PreviousResponseNotFound",
+                                         "message": "previous response not found or expired"}})
+    assert _is_cache_miss(error, "resp-1")
+    assert not _is_cache_miss(error, None)
+
+
+def test_other_bad_requests_are_not_cache_miss():
+    assert not _is_cache_miss(_StatusError(400, {"error": {"code": "InvalidParameter",
+                                                           "message": "max_tokens is too large"}}), "resp-1")
+    assert not _is_cache_miss(_StatusError(404, {"error": {"code": "ModelNotFound"}}), "resp-1")
@@ -0,0 +1,65 @@
+import re
+
+from issue_poller import IssuePoller, WATERMARK_KEY
+
+
+class _Ledger:
+    def __init__(self, meta, forced=()):
+        self.meta = dict(meta)
+        self.forced = list(forced)
+
+    def get_meta(self, key):
+        return self.meta.get(key)
+
+    def forced_issues(self):
+        return self.forced
+
+
+class _Jira:
+    def __init__(self, time_zone, issues=(), all_issues=()):
+        self.time_zone = time_zone
+        self.issues = list(issues)
+        self.all_issues = list(all_issues)
+        self.queries = []
+
+    def iter_target_issues(self, updated_since=None, page_size=100, issue_keys=None):
+        self.queries.append(issue_keys)
+        if issue_keys:
+            return iter([issue for issue in self.all_issues
+                         if issue["key"] in issue_keys or issue["id"] in issue_keys])
+        return iter(self.issues)
+
+
+def _issue(number, updated="2024-05-01T12:00:00.000+0000"):
+    return {"id": str(10000 + number), "key": f"FIN-{number}", "fields": {"updated": updated}}
+
+
+def _poller(time_zone, watermark="2024-05-01T10:20:30.000+0000"):
+    return IssuePoller(_Jira(time_zone), _Ledger({WATERMARK_KEY: watermark}),
+                       config={"incremental": True, "overlap_minutes": 10})
+
+
+def test_watermark_is_formatted_in_jira_timezone():
+    # 10:10 UTC（减去回退窗口）在纽约（夏令时UTC-4）为06:10，与本机时区无关
+    assert _poller("America/New_York")._updated_since() == "2024/05/01 06:10"
+    assert _poller("Asia/Shanghai")._updated_since() == "2024/05/01 18:10"
+
+
+def test_unknown_timezone_uses_relative_jql():
+    for time_zone in (None, "Mars/Olympus_Mons"):
+        assert re.fullmatch(r"-\d+m", _poller(time_zone)._updated_since())
+
+
+def test_no_watermark_means_full_query():
+    poller = IssuePoller(_Jira("UTC"), _Ledger({}), config={"incremental": True, "overlap_minutes": 10})
+    assert poller._updated_since() is None
+
+
+def test_forced_tickets_are_polled_without_updates():
+    recent, stale = _issue(1), _issue(2, updated="2024-01-01T00:00:00.000+0000")
+    jira = _Jira("UTC", issues=[recent], all_issues=[recent, stale])
+    ledger = _Ledger({WATERMARK_KEY: "2024-05-01T10:00:00.000+0000"}, forced=["FIN-2", "10001"])
+    poller = IssuePoller(jira, ledger, config={"incremental": True, "overlap_minutes": 10})
+    assert [issue["key"] for issue in poller.poll()] == ["FIN-1", "FIN-2"]
+    # 已在增量结果中的ticket（FIN-1即10001）不再单独查询
+    assert jira.queries == [None, ["FIN-2"]]
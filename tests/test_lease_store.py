@@ -0,0 +1,29 @@
+import pytest
+
+from lease_store import LeaseKeeper, LeaseStore, SQLiteLeaseStore, create_lease_store
+
+
+class IncompleteStore(LeaseStore):
+    def acquire(self, key, owner, ttl):
+        return True
+
+
+def test_incomplete_custom_backend_fails_at_creation():
+    with pytest.raises(TypeError):
+        create_lease_store(f"{__name__}:IncompleteStore")
+
+
+def test_custom_backend_must_subclass_lease_store():
+    with pytest.raises(TypeError):
+        create_lease_store("collections:OrderedDict")
+
+
+def test_sqlite_lease_is_exclusive(tmp_path):
+    store = SQLiteLeaseStore(str(tmp_path / "leases.db"))
+    first = LeaseKeeper(store, owner="a", ttl=60, heartbeat=30, max_held=0)
+    second = LeaseKeeper(store, owner="b", ttl=60, heartbeat=30, max_held=0)
+    assert first.claim("PROJ-1")
+    assert not second.claim("PROJ-1")
+    first.release("PROJ-1")
+    assert second.claim("PROJ-1")
+    store.close()
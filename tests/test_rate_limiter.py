@@ -0,0 +1,25 @@
+from rate_limiter import RateLimiter
+
+
+def _limiter():
+    limiter = RateLimiter("test", rate=1000, burst=1000, max_concurrency=8)
+    limiter.limit = 2.0
+    return limiter
+
+
+def test_limit_grows_only_on_success():
+    limiter = _limiter()
+    limiter.acquire()
+    limiter.release()
+    assert limiter.limit == 2.0
+    limiter.acquire()
+    limiter.release(success=True)
+    assert limiter.limit == 2.5
+
+
+def test_throttle_halves_limit():
+    limiter = _limiter()
+    limiter.acquire()
+    limiter.release(throttled=True, retry_after=0)
+    assert limiter.limit == 1.0
+    assert limiter.stats()["throttled"] == 1
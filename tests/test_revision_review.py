@@ -0,0 +1,25 @@
+from revision_review import diff_clauses
+
+
+def _contract(bodies):
+    return "采购合同\n" + "\n".join(f"第{index}条 {body}" for index, body in enumerate(bodies, start=1))
+
+
+BODIES = [f"条款内容{name}，双方按本条约定履行。" for name in "甲乙丙丁戊己庚辛壬癸"]
+
+
+def test_inserted_clause_does_not_renumber_into_changes():
+    revised = BODIES[:5] + ["新增保密条款，双方对合同内容保密。"] + BODIES[5:]
+    changes, total = diff_clauses(_contract(BODIES), _contract(revised))
+    assert total == 12
+    assert changes == [("新增", "第6条 新增保密条款，双方对合同内容保密。", None,
+                        "第6条 新增保密条款，双方对合同内容保密。")]
+
+
+def test_modified_and_deleted_clauses():
+    revised = BODIES[:2] + ["条款内容丙，验收合格后30日内付款。"] + BODIES[4:]
+    changes, _ = diff_clauses(_contract(BODIES), _contract(revised))
+    assert [(kind, heading) for kind, heading, _, _ in changes] == [
+        ("修改", "第3条 条款内容丙，验收合格后30日内付款。"),
+        ("删除", "第4条 条款内容丁，双方按本条约定履行。")
+    ]
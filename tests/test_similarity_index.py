@@ -0,0 +1,25 @@
+from similarity_index import estimate_similarity, minhash_signature, plan_reference_review
+
+CLAUSES = [f"第{index}条 双方应按本合同约定履行第{index}项义务，任何一方不得擅自变更或解除本合同。" for index in range(1, 40)]
+
+
+def _contract(amount, penalty):
+    return "\n".join(CLAUSES + [f"第40条 合同总价为人民币{amount}元，逾期付款按未付金额的{penalty}%支付违约金。"])
+
+
+def _match(contract_text):
+    return {"similarity": 1.0, "contract_text": contract_text, "issue_name": "PROJ-1",
+            "review": {"text": "【整体结论】基本合规。", "id": "resp_1"}}
+
+
+def test_amount_changes_are_similar_but_not_reused():
+    reference, contract = _contract(100000, 5), _contract(9000000, 50)
+    assert estimate_similarity(minhash_signature(reference), minhash_signature(contract)) == 1.0
+    plan = plan_reference_review(_match(reference), contract)
+    assert plan["mode"] == "diff"
+    assert "9000000" in plan["prompt"] and "100000" in plan["prompt"]
+
+
+def test_identical_text_is_reused():
+    contract = _contract(100000, 5)
+    assert plan_reference_review(_match(contract), contract) == {"mode": "reuse"}
@@ -1,20 +1,26 @@
 from config import JIRA_CONFIG
 
 
-def check_trigger_condition(comments):
-    """检查评论中是否包含@指定字段，返回是否触发"""
+def find_trigger_comment(comments):
+    """返回包含@指定字段的最新评论，未触发时返回None"""
     if not comments:
-        return False
+        return None
 
-    # 遍历所有评论，只要有一条包含触发关键词就返回True
+    # 遍历所有评论，只要有一条包含触发关键词就返回该评论
     try:
         comment_text = comments[-1]["body"]["content"][0]["content"][0]
         # 增加判断type是否为text，不为则跳过
         if JIRA_CONFIG["trigger_keyword"] in comment_text["text"]:
             print(f"检测到触发关键词，评论作者：{comments[-1]["author"]["displayName"]}，时间：{comments[-1]["updated"]}")
-            return True
+            return comments[-1]
     except Exception as e:
-        return False
+        return None
+    return None
+
+
+def check_trigger_condition(comments):
+    """检查评论中是否包含@指定字段，返回是否触发"""
+    return find_trigger_comment(comments) is not None
 
 # 程序测试
 if __name__ == "__main__":
@@ -0,0 +1,283 @@
+import hashlib
+import hmac
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import metrics
+from config import JIRA_CONFIG, WEBHOOK_CONFIG
+
+# 只处理新增评论事件，其余事件直接忽略
+COMMENT_CREATED = "comment_created"
+# JIRA每次投递的唯一标识（失败重试时保持不变），用于去重
+DELIVERY_ID_HEADER = "X-Atlassian-Webhook-Identifier"
+SIGNATURE_HEADER = "X-Hub-Signature"
+
+
+def sign_payload(secret, body):
+    """按JIRA webhook规范计算签名：sha256=HMAC-SHA256(密钥, 请求体)"""
+    return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+class WebhookReceiver:
+    """
+    webhook事件校验、去重及入队（与HTTP服务解耦，便于直接回放测试）：
+    校验签名及事件类型 → 按投递ID去重 → 评论包含触发关键词时将ticket key放入issue_queue
+    """
+
+    def __init__(self, ledger, secret=None):
+        self.ledger = ledger
+        self.secret = secret
+        self.issue_queue = queue.Queue()
+        self._counts = {}
+        self._counts_lock = threading.Lock()
+
+    def _count(self, outcome):
+        with self._counts_lock:
+            self._counts[outcome] = self._counts.get(outcome, 0) + 1
+        metrics.inc("webhook_deliveries_total", outcome=outcome)
+
+    def stats(self):
+        with self._counts_lock:
+            return dict(self._counts)
+
+    def verify_signature(self, body, signature):
+        """未配置密钥时不校验签名（仅建议在内网调试时使用）"""
+        if not self.secret:
+            return True
+        return bool(signature) and hmac.compare_digest(sign_payload(self.secret, body), signature)
+
+    def handle(self, headers, body):
+        """处理一次投递，返回(HTTP状态码, 说明)"""
+        if not self.verify_signature(body, headers.get(SIGNATURE_HEADER)):
+            self._count("rejected")
+            return 401, "invalid signature"
+        try:
+            payload = json.loads(body)
+            event = payload["webhookEvent"]
+        except (ValueError, KeyError, TypeError):
+            self._count("rejected")
+            return 400, "invalid payload"
+
+        if event != COMMENT_CREATED:
+            self._count("ignored")
+            return 200, f"ignored event {event}"
+        try:
+            issue = payload["issue"]
+            issue_key = issue["key"]
+            comment = payload["comment"]
+            comment_id = comment["id"]
+        except (KeyError, TypeError):
+            self._count("rejected")
+            return 400, "invalid payload"
+
+        # 只处理目标项目，且评论包含触发关键词（完整的触发判断仍由流水线按最新评论进行）
+        project = (issue.get("fields") or {}).get("project") or {}
+        if project.get("key") and project["key"] != JIRA_CONFIG["project_key"]:
+            self._count("ignored")
+            return 200, "ignored project"
+        if JIRA_CONFIG["trigger_keyword"] not in json.dumps(comment.get("body"), ensure_ascii=False):
+            self._count("ignored")
+            return 200, "no trigger keyword"
+
+        delivery_id = headers.get(DELIVERY_ID_HEADER) or f"{COMMENT_CREATED}:{comment_id}"
+        if not self.ledger.record_delivery(delivery_id):
+            self._count("duplicate")
+            return 200, "duplicate delivery"
+
+        print(f"📨 收到{issue_key}的触发评论{comment_id}（投递ID：{delivery_id}）")
+        self.issue_queue.put(issue_key)
+        self._count("accepted")
+        return 202, "accepted"
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    """HTTP入口：只接受配置路径上的POST请求"""
+
+    def do_POST(self):
+        if self.path.split("?", 1)[0] != WEBHOOK_CONFIG["path"]:
+            return self._reply(404, "not found")
+        try:
+            length = int(self.headers.get("Content-Length", "0"))
+        except ValueError:
+            return self._reply(400, "invalid content length")
+        if length > WEBHOOK_CONFIG["max_body_bytes"]:
+            return self._reply(413, "payload too large")
+        body = self.rfile.read(length)
+        status, message = self.server.receiver.handle(self.headers, body)
+        self._reply(status, message)
+
+    def _reply(self, status, message):
+        data = json.dumps({"message": message}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # 每个请求的处理结果已由WebhookReceiver打印，不再输出访问日志
+        pass
+
+
+class WebhookService:
+    """
+    webhook模式：本地HTTP服务接收事件，批量查询涉及的ticket后提交到常驻流水线；
+    原有轮询降为低频兜底（补偿漏投或处理失败的事件）
+    """
+
+    def __init__(self, jira, ledger, cache=None, config=None, similarity=None, leases=None):
+        from pipeline import ReviewPipeline
+
+        self.jira = jira
+        self.ledger = ledger
+        self.config = dict(WEBHOOK_CONFIG, **(config or {}))
+        self.receiver = WebhookReceiver(ledger, secret=self.config["secret"])
+        self.pipeline = ReviewPipeline(jira, ledger=ledger, cache=cache, similarity=similarity, leases=leases)
+        self.server = ThreadingHTTPServer((self.config["host"], self.config["port"]), _WebhookHandler)
+        self.server.receiver = self.receiver
+        self._stopped = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if not self.config["secret"]:
+            print("⚠️ 未配置JIRA_WEBHOOK_SECRET，webhook请求将不校验签名")
+        self.pipeline.start()
+        for target, name in ((self.server.serve_forever, "webhook-http"), (self._dispatch_loop, "webhook-dispatch")):
+            t = threading.Thread(target=target, name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+        host, port = self.server.server_address[:2]
+        print(f"✅ webhook服务已启动：http://{host}:{port}{self.config['path']}")
+
+    def _next_batch(self):
+        """取出一批ticket key：收到第一个事件后再等待batch_seconds，合并期间的其他事件"""
+        try:
+            keys = {self.receiver.issue_queue.get(timeout=1)}
+        except queue.Empty:
+            return set()
+        deadline = time.time() + self.config["batch_seconds"]
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                keys.add(self.receiver.issue_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return keys
+
+    def _dispatch_loop(self):
+        while not self._stopped.is_set():
+            keys = self._next_batch()
+            if not keys:
+                continue
+            try:
+                # 一次JQL查询确认这些ticket仍满足审阅条件（项目/类型/状态/附件）并获取附件信息
+                issues = list(self.jira.iter_target_issues(issue_keys=sorted(keys), page_size=len(keys)))
+            except Exception as e:
+                # 查询失败的事件由兜底轮询补偿
+                print(f"❌ 查询webhook涉及的ticket失败：{str(e)}")
+                continue
+            if len(issues) < len(keys):
+                print(f"{len(keys) - len(issues)}个ticket不满足审阅条件，跳过")
+            for issue in issues:
+                self.pipeline.submit(issue)
+
+    def report(self):
+        """打印自上次报告以来的处理结果，并清理过期的投递去重记录"""
+        from pipeline import print_summary
+
+        results = self.pipeline.drain_results()
+        if results:
+            elapsed = max(job.finished_at for job in results) - min(job.started_at for job in results)
+            print_summary(results, elapsed)
+        print(f"webhook统计：{self.receiver.stats()}")
+        metrics.registry.print_tick_summary()
+        expire = datetime.now() - timedelta(days=self.config["dedupe_days"])
+        self.ledger.prune_deliveries(expire.isoformat(timespec="seconds"))
+
+    def shutdown(self):
+        """停止接收事件，等待已提交的ticket处理完成"""
+        self._stopped.set()
+        self.server.shutdown()
+        for t in self._threads:
+            t.join()
+        self.pipeline.close()
+        self.pipeline.join()
+        self.server.server_close()
+
+
+def replay(path, url, secret=None):
+    """
+    本地回放录制的webhook投递（JSONL，每行为{"headers": {...}, "body": {...}}或直接为事件内容），
+    配置了密钥时按JIRA规范重新签名；用于在没有JIRA的环境中验证webhook模式
+    """
+    import requests
+
+    with open(path, "r", encoding="utf-8") as f:
+        deliveries = [json.loads(line) for line in f if line.strip()]
+    for delivery in deliveries:
+        if "body" not in delivery:
+            delivery = {"headers": {}, "body": delivery}
+        body = json.dumps(delivery["body"], ensure_ascii=False).encode("utf-8")
+        headers = dict(delivery.get("headers") or {}, **{"Content-Type": "application/json"})
+        if secret:
+            headers[SIGNATURE_HEADER] = sign_payload(secret, body)
+        response = requests.post(url, data=body, headers=headers, timeout=10)
+        print(f"回放{delivery['body'].get('webhookEvent')}：HTTP {response.status_code} {response.text}")
+
+
+def serve():
+    """webhook模式入口：事件驱动处理，兜底轮询按WEBHOOK_SWEEP_MINUTES低频运行"""
+    import schedule
+    import jira_client
+    import main
+    from state_ledger import ReviewLedger
+    from similarity_index import SimilarityIndex
+    from lease_store import start_lease_keeper
+    from review_cache import get_shared_cache
+
+    jira = jira_client.get_jira_client()
+    ledger = ReviewLedger()
+    similarity = SimilarityIndex()
+    leases = start_lease_keeper()
+    service = WebhookService(jira, ledger, cache=get_shared_cache(), similarity=similarity, leases=leases)
+    service.start()
+    metrics.start_metrics_server()
+
+    schedule.every(WEBHOOK_CONFIG["sweep_minutes"]).minutes.do(main.task_with_time_check)
+    schedule.every(WEBHOOK_CONFIG["sweep_minutes"]).minutes.do(service.report)
+    print(f"兜底轮询间隔：{WEBHOOK_CONFIG['sweep_minutes']}分钟（按Ctrl+C停止）...")
+    try:
+        while True:
+            schedule.run_pending()
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n程序已被手动停止，等待处理中的ticket完成...")
+    finally:
+        service.shutdown()
+        service.report()
+        if leases is not None:
+            leases.close()
+        similarity.close()
+        ledger.close()
+
+
+# 运行：python webhook_server.py
+# 回放：python webhook_server.py --replay samples/webhooks/comment_created.jsonl
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="JIRA webhook接收服务")
+    parser.add_argument("--replay", metavar="FILE", help="将录制的webhook投递回放到运行中的服务")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{WEBHOOK_CONFIG['port']}{WEBHOOK_CONFIG['path']}",
+                        help="回放目标地址")
+    args = parser.parse_args()
+
+    if args.replay:
+        replay(args.replay, args.url, secret=WEBHOOK_CONFIG["secret"])
+    else:
+        serve()